@@ -0,0 +1,77 @@
+"""Bundling of the static assets of the report.
+
+The scripts of ``index.html`` are concatenated in a single file and
+other assets (style sheet, images) are renamed, with the hash of their
+content in their names. Assets can then be served with far-future
+cache headers: only ``index.html`` must be revalidated by browsers.
+"""
+
+import re
+
+from awstatic.compat import jsmin
+from awstatic.utils import replace_tags
+
+
+# Path of the script that loads data files in a Web Worker (relative
+# to the output directory). It is bundled with the other scripts but
+# is also needed as a separate file by the worker.
+LOADER_PATH = 'assets/js/loader.js'
+BUNDLE_PATH = 'assets/js/bundle.js'
+
+SCRIPT_RE = re.compile(
+    r'([ \t]*)<script src="(assets/[^"]+\.js)"></script>[ \t]*\n?')
+ASSET_RE = re.compile(r'((?:src|href)=")(assets/[^"]+)(")')
+
+
+def get_scripts(html):
+    """Return the paths of the scripts of the assets directory that
+    are loaded by the given HTML page, in order.
+    """
+    return [match.group(2) for match in SCRIPT_RE.finditer(html)]
+
+
+def get_assets(html):
+    """Return the paths of the files of the assets directory other
+    than scripts (style sheets, images) that are referenced by the
+    given HTML page.
+    """
+    return [match.group(2) for match in ASSET_RE.finditer(html)
+            if not match.group(2).endswith('.js')]
+
+
+def replace_scripts(html, url):
+    """Return the given HTML page where the first script of the assets
+    directory is replaced by the script at ``url`` and other scripts
+    are removed.
+    """
+    return replace_tags(SCRIPT_RE, html, '<script src="%s"></script>' % url)
+
+
+def replace_assets(html, urls):
+    """Return the given HTML page where references to assets are
+    replaced by the corresponding value of ``urls``, a dictionary.
+    """
+    def _sub(match):
+        url = urls.get(match.group(2), match.group(2))
+        return ''.join((match.group(1), url, match.group(3)))
+    return ASSET_RE.sub(_sub, html)
+
+
+def minify_js(path, source):
+    """Return the minified version of ``source``, the source of the
+    script at ``path``, if the ``rjsmin`` package is installed.
+    Scripts whose name ends with ``.min.js`` are already minified.
+    """
+    if jsmin is None or path.endswith('.min.js'):  # pragma: no cover
+        return source
+    return jsmin(source)  # pragma: no cover
+
+
+def bundle_scripts(scripts):
+    """Return the concatenation of the given scripts (a list of
+    ``(path, source)`` tuples), minified if possible.
+    """
+    # Scripts are separated by a semicolon, in case one of them does
+    # not end with one.
+    return '\n;\n'.join(minify_js(path, source).strip()
+                        for path, source in scripts) + '\n'
@@ -0,0 +1,6 @@
+"""Benchmarks for AWStatic.
+
+Each module of this package can be run as a script, e.g.::
+
+    $ python -m awstatic.benchmarks.top_n
+"""
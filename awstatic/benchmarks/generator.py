@@ -0,0 +1,208 @@
+"""Generate synthetic AWStats data files.
+
+Files are written in the format of AWStats, with a ``MAP`` section
+that lists the correct offsets of all sections, so that they can be
+used to measure the performance of AWStatic on sites of any size.
+
+It can also be run as a script to write files in a directory::
+
+    $ python -m awstatic.benchmarks.generator <out_dir> [options]
+"""
+
+from argparse import ArgumentParser
+import os
+import random
+
+from awstatic.utils import get_number_of_days
+
+
+# Width of offsets in the 'MAP' section. Offsets are padded so that
+# the length of the map does not depend on them.
+OFFSET_WIDTH = 20
+
+WORDS = ('awstats', 'static', 'report', 'python', 'log', 'analyzer',
+         'caf%C3%A9', 'web', 'statistics', 'server', 'free', 'open',
+         'source', 'traffic', 'visitor', 'page', 'download', 'graph')
+
+
+def _rows(rand, n, make_row):
+    return [make_row(rand, i) for i in range(n)]
+
+
+def _make_sections(rand, yyyymm, n_urls, n_visitors, n_keywords,
+                   n_phrases, n_downloads, n_referrers):
+    """Return the sections of a file as a list of ``(name, comment,
+    rows)`` where ``comment`` is the comment line that precedes the
+    section in AWStats files and ``rows`` is a list of strings.
+    """
+    n_days = get_number_of_days(yyyymm)
+    visits = n_visitors + rand.randint(0, n_visitors)
+    general = ['LastLine %s01013554 129 30471 4886531997209' % yyyymm,
+               'FirstTime %s01000000' % yyyymm,
+               'LastTime %s%02d235959' % (yyyymm, n_days),
+               'LastUpdate %s%02d235959 129 0 128 0 0' % (yyyymm, n_days),
+               'TotalVisits %d' % visits,
+               'TotalUnique %d' % n_visitors,
+               'MonthHostsKnown %d' % n_visitors,
+               'MonthHostsUnknown 0']
+    time = _rows(rand, 24, lambda r, i: '%d %d %d %d 0 0 0' % (
+        i, r.randint(0, 10 ** 4), r.randint(0, 10 ** 5),
+        r.randint(0, 10 ** 8)))
+    visitor = _rows(rand, n_visitors, lambda r, i: (
+        'host-%d.example.com %d %d %d %s%02d111511' % (
+            i, r.randint(1, 100), r.randint(1, 1000),
+            r.randint(1000, 10 ** 7), yyyymm, r.randint(1, n_days))))
+    day = _rows(rand, n_days, lambda r, i: '%s%02d %d %d %d %d' % (
+        yyyymm, i + 1, r.randint(0, 10 ** 4), r.randint(0, 10 ** 5),
+        r.randint(0, 10 ** 8), r.randint(0, 10 ** 3)))
+    sider = _rows(rand, n_urls, lambda r, i: '/page/%d.html %d %d %d %d' % (
+        i, r.randint(1, 1000), r.randint(1000, 10 ** 6),
+        r.randint(0, 10), r.randint(0, 10)))
+    downloads = _rows(rand, n_downloads, lambda r, i: (
+        '/files/archive-%d.tar.gz %d %d %d' % (
+            i, r.randint(1, 1000), r.randint(0, 10),
+            r.randint(10 ** 5, 10 ** 8))))
+    os_ = [('%s %d' % (os_id, rand.randint(0, 10 ** 4)))
+           for os_id in ('winxp', 'winlong', 'macosx', 'linux', 'Unknown')]
+    browser = [('%s %d' % (browser_id, rand.randint(0, 10 ** 4)))
+               for browser_id in ('firefox', 'chrome', 'safari', 'msie9.0')]
+    sereferrals = [('%s %d %d' % (engine, rand.randint(0, 10 ** 3),
+                                  rand.randint(0, 10 ** 4)))
+                   for engine in ('google', 'bing', 'yahoo')]
+    pagerefs = _rows(rand, n_referrers, lambda r, i: (
+        'http://referrer-%d.example.org/page %d %d' % (
+            i, r.randint(1, 100), r.randint(1, 1000))))
+    searchwords = _rows(rand, n_phrases, lambda r, i: '%s+%s+%d %d' % (
+        r.choice(WORDS), r.choice(WORDS), i, r.randint(1, 100)))
+    keywords = _rows(rand, n_keywords, lambda r, i: '%s%d %d' % (
+        r.choice(WORDS), i, r.randint(1, 100)))
+    errors = ['404 %d %d' % (rand.randint(0, 1000), rand.randint(0, 10 ** 6))]
+    return [
+        ('GENERAL', '# TotalVisits = Number of visits', general),
+        ('TIME', '# Hour - Pages - Hits - Bandwidth - Not viewed Pages - '
+         'Not viewed Hits - Not viewed Bandwidth', time),
+        ('VISITOR', '# Host - Pages - Hits - Bandwidth - Last visit date',
+         visitor),
+        ('DAY', '# Date - Pages - Hits - Bandwidth - Visits', day),
+        ('SIDER', '# URL - Pages - Bandwidth - Entry - Exit', sider),
+        ('DOWNLOADS', '# Downloads - Hits - 206 Hits - Bandwidth',
+         downloads),
+        ('OS', '# OS ID - Hits', os_),
+        ('BROWSER', '# Browser ID - Hits', browser),
+        ('SEREFERRALS', '# Search engine referers ID - Pages - Hits',
+         sereferrals),
+        ('PAGEREFS', '# External page referers - Pages - Hits', pagerefs),
+        ('SEARCHWORDS', '# Search keyphrases - Number of search',
+         searchwords),
+        ('KEYWORDS', '# Search keywords - Number of search', keywords),
+        ('ERRORS', '# Errors - Hits - Bandwidth', errors),
+        ]
+
+
+def write_file(path, yyyymm, n_urls=1000, n_visitors=1000, n_keywords=100,
+               n_phrases=100, n_downloads=10, n_referrers=100, seed=0):
+    """Write a synthetic AWStats data file for the given month
+    (formatted as YYYYMM) at ``path``.
+    """
+    rand = random.Random('%s-%s' % (seed, yyyymm))
+    sections = _make_sections(rand, yyyymm, n_urls, n_visitors, n_keywords,
+                              n_phrases, n_downloads, n_referrers)
+    header = ['AWSTATS DATA FILE 7.0 (build 1.971)',
+              '# If you remove this file, all statistics for date %s will '
+              'be lost/reset.' % yyyymm,
+              '# This is a synthetic file generated by AWStatic.',
+              '',
+              '# Position (offset in bytes) in this file for beginning of '
+              'each section for',
+              '# direct I/O access.',
+              'BEGIN_MAP %d' % len(sections)]
+    # The content is ASCII, hence offsets in bytes are the same as
+    # offsets in characters.
+    blocks = []
+    for name, comment, rows in sections:
+        blocks.append('\n'.join(
+            ['', comment, 'BEGIN_%s %d' % (name, len(rows))] + rows +
+            ['END_%s' % name, '']))
+    map_length = sum(len('POS_%s %s\n' % (name, ' ' * OFFSET_WIDTH))
+                     for name, comment, rows in sections)
+    offset = len('\n'.join(header) + '\n') + map_length + len('END_MAP\n')
+    positions = []
+    for (name, comment, rows), block in zip(sections, blocks):
+        # Each block starts with an empty line and a comment.
+        positions.append('POS_%s %-*d\n' % (
+            name, OFFSET_WIDTH, offset + 2 + len(comment)))
+        offset += len(block)
+    with open(path, 'w') as fp:
+        fp.write('\n'.join(header) + '\n')
+        fp.write(''.join(positions))
+        fp.write('END_MAP\n')
+        fp.write(''.join(blocks))
+
+
+def generate(out_dir, site_id, n_months=12, prefix='awstats', suffix='txt',
+             **kwargs):
+    """Write synthetic files for ``n_months`` months of the given site
+    in ``out_dir``, with the file names expected by
+    ``Parser.parse_dir()``. Keyword arguments are passed to
+    ``write_file()``. Return the list of the paths of the files.
+    """
+    paths = []
+    year, month = 2012, 1
+    for i in range(n_months):
+        yyyymm = '%04d%02d' % (year, month)
+        filename = '%s%02d%04d.%s.%s' % (prefix, month, year, site_id, suffix)
+        path = os.path.join(out_dir, filename)
+        write_file(path, yyyymm, **kwargs)
+        paths.append(path)
+        month += 1
+        if month > 12:
+            year, month = year + 1, 1
+    return paths
+
+
+def add_size_arguments(parser):
+    """Add the arguments that control the size of the generated data
+    to the given ``ArgumentParser``.
+    """
+    parser.add_argument('--site', default='bench.example.com',
+                        help='site identifier (default: %(default)s)')
+    parser.add_argument('--months', type=int, default=12,
+                        help='number of months (default: %(default)s)')
+    parser.add_argument('--urls', type=int, default=10000,
+                        help='distinct URLs per month (default: %(default)s)')
+    parser.add_argument('--visitors', type=int, default=10000,
+                        help='visitors per month (default: %(default)s)')
+    parser.add_argument('--keywords', type=int, default=1000,
+                        help='distinct keywords and phrases per month '
+                        '(default: %(default)s)')
+    parser.add_argument('--referrers', type=int, default=1000,
+                        help='distinct referrers per month '
+                        '(default: %(default)s)')
+    parser.add_argument('--downloads', type=int, default=100,
+                        help='distinct downloads per month '
+                        '(default: %(default)s)')
+
+
+def generate_from_args(out_dir, args):
+    """Call ``generate()`` with the arguments added by
+    ``add_size_arguments()``.
+    """
+    return generate(out_dir, args.site, n_months=args.months,
+                    n_urls=args.urls, n_visitors=args.visitors,
+                    n_keywords=args.keywords, n_phrases=args.keywords,
+                    n_downloads=args.downloads, n_referrers=args.referrers)
+
+
+def main():
+    parser = ArgumentParser(description='Generate synthetic AWStats files.')
+    parser.add_argument('out_dir', help='directory where files are written')
+    add_size_arguments(parser)
+    args = parser.parse_args()
+    if not os.path.isdir(args.out_dir):
+        os.makedirs(args.out_dir)
+    paths = generate_from_args(args.out_dir, args)
+    print('Wrote %d files in "%s".' % (len(paths), args.out_dir))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,114 @@
+"""Compare the memory used by the data of a large synthetic AWStats
+file, depending on how rows are stored:
+
+- dictionaries of strings (the layout used by AWStatic before rows
+  were parsed as tuples);
+
+- lists of tuples (the default layout of ``Parser``);
+
+- columns (``Parser(compact=True)``).
+
+Memory is traced with ``tracemalloc``: only times are printed if it
+is not available (before Python 3.4).
+"""
+
+from collections import defaultdict
+import os
+import random
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from awstatic.compat import tracemalloc
+from awstatic.parser import Parser
+from awstatic.parser import SECTIONS
+
+
+N_VISITORS = 500000
+N_URLS = 100000
+
+
+def write_file(path, n_visitors, n_urls):
+    rand = random.Random(0)
+    with open(path, 'w') as fp:
+        fp.write('BEGIN_VISITOR %d\n' % n_visitors)
+        for i in range(n_visitors):
+            fp.write('host-%d.example.com %d %d %d 20120131111511\n' % (
+                i, rand.randint(1, 100), rand.randint(1, 1000),
+                rand.randint(1000, 10 ** 7)))
+        fp.write('END_VISITOR\n')
+        fp.write('BEGIN_SIDER %d\n' % n_urls)
+        for i in range(n_urls):
+            fp.write('/page/%d %d %d %d %d\n' % (
+                i, rand.randint(1, 1000), rand.randint(1000, 10 ** 6),
+                rand.randint(0, 10), rand.randint(0, 10)))
+        fp.write('END_SIDER\n')
+
+
+def parse_as_dicts(path):
+    """Parse the file as AWStatic used to do: one dictionary of
+    strings per row.
+    """
+    data = {}
+    with open(path) as fp:
+        for line in iter(fp.readline, ''):
+            if not line.startswith('BEGIN_'):
+                continue
+            name, length = line.split()
+            name = name[len('BEGIN_'):]
+            lines = [fp.readline().strip() for i in range(int(length))]
+            section = defaultdict(dict)
+            for line in lines:
+                values = line.split()
+                for i, key in enumerate(SECTIONS[name]):
+                    section[values[0]][key] = values[i]
+            data[name] = {'201201': section}
+    return data
+
+
+def parse_with_parser(path, **kwargs):
+    parser = Parser(sections=('VISITOR', 'SIDER'), **kwargs)
+    parser.parse_file(path, '201201')
+    return parser.data
+
+
+def measure(func, *args, **kwargs):
+    if tracemalloc is None:
+        start = default_timer()
+        func(*args, **kwargs)
+        return default_timer() - start, None, None
+    tracemalloc.start()
+    start = default_timer()
+    data = func(*args, **kwargs)
+    elapsed = default_timer() - start
+    size, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del data
+    return elapsed, size, peak
+
+
+def main():
+    tmp_dir = mkdtemp()
+    try:
+        path = os.path.join(tmp_dir, 'awstats012012.bench.txt')
+        write_file(path, N_VISITORS, N_URLS)
+        print('%d visitors and %d URLs (%.1f MB file).' % (
+            N_VISITORS, N_URLS, os.path.getsize(path) / 1024.0 / 1024))
+        print('%-10s %10s %12s %12s' % ('layout', 'time', 'size', 'peak'))
+        for label, func, kwargs in (
+                ('dicts', parse_as_dicts, {}),
+                ('rows', parse_with_parser, {}),
+                ('columnar', parse_with_parser, {'compact': True})):
+            elapsed, size, peak = measure(func, path, **kwargs)
+            if size is None:
+                print('%-10s %9.2fs %12s %12s' % (label, elapsed, 'n/a',
+                                                  'n/a'))
+                continue
+            print('%-10s %9.2fs %10.1fMB %10.1fMB' % (
+                label, elapsed, size / 1024.0 / 1024, peak / 1024.0 / 1024))
+    finally:
+        rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,115 @@
+"""Measure the main steps of the generation of a report on synthetic
+AWStats files (see ``generator``): parsing of the files, building of
+the report and writing of the JSON file.
+
+For each step, the best time of a few runs and the memory high-water
+mark (as traced by ``tracemalloc``, in a separate run) are printed.
+The memory is not measured if ``tracemalloc`` is not available
+(before Python 3.4)::
+
+    $ python -m awstatic.benchmarks.pipeline --months 24 --urls 100000
+"""
+
+from argparse import ArgumentParser
+import logging
+import os
+from shutil import rmtree
+from tempfile import mkdtemp
+from timeit import default_timer
+
+from awstatic.benchmarks.generator import add_size_arguments
+from awstatic.benchmarks.generator import generate_from_args
+from awstatic.compat import tracemalloc
+from awstatic.parser import Parser
+from awstatic.reporter import Reporter
+from awstatic.reporter import create_report
+from awstatic.reporter import get_required_sections
+from awstatic.utils import iter_json
+
+
+def parse(awstats_dir, site_id, compact):
+    parser = Parser(sections=get_required_sections(), compact=compact)
+    return parser.parse_dir(site_id, awstats_dir, 'awstats', 'txt')
+
+
+def build_report(data):
+    return create_report(data, 'http://bench.example.com')
+
+
+def write_report(reporter, site_id, report):
+    path = os.path.join(reporter.data_dir, '%s.json' % site_id)
+    return reporter._write_file(path, iter_json(report, depth=2))
+
+
+def measure(repeat, func, *args):
+    """Call ``func`` ``repeat`` times and once more while tracing
+    memory allocations. Return the best time, the memory high-water
+    mark (or ``None`` if ``tracemalloc`` is not available) and the
+    result of the last call.
+    """
+    best = None
+    for i in range(repeat):
+        start = default_timer()
+        func(*args)
+        elapsed = default_timer() - start
+        if best is None or elapsed < best:
+            best = elapsed
+    if tracemalloc is None:
+        return best, None, func(*args)
+    tracemalloc.start()
+    result = func(*args)
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return best, peak, result
+
+
+def print_step(label, elapsed, peak):
+    if peak is None:
+        print('%-8s %9.3fs %12s' % (label, elapsed, 'n/a'))
+    else:
+        print('%-8s %9.3fs %10.1fMB' % (label, elapsed,
+                                        peak / 1024.0 / 1024))
+
+
+def main():
+    parser = ArgumentParser(description=__doc__.split('\n\n')[0])
+    add_size_arguments(parser)
+    parser.add_argument('--compact', action='store_true',
+                        help='store parsed rows in columns')
+    parser.add_argument('--repeat', type=int, default=3,
+                        help='number of timed runs of each step '
+                        '(default: %(default)s)')
+    args = parser.parse_args()
+
+    tmp_dir = mkdtemp()
+    try:
+        awstats_dir = os.path.join(tmp_dir, 'awstats')
+        os.mkdir(awstats_dir)
+        paths = generate_from_args(awstats_dir, args)
+        size = sum(os.path.getsize(path) for path in paths)
+        print('%d files (%.1f MB): %d URLs, %d visitors, %d keywords and '
+              '%d referrers per month.' % (
+                  len(paths), size / 1024.0 / 1024, args.urls,
+                  args.visitors, args.keywords, args.referrers))
+
+        reporter = Reporter(awstats_dir, 'awstats', 'txt', (),
+                            os.path.join(tmp_dir, 'out'),
+                            logging.getLogger(__name__))
+        os.makedirs(reporter.data_dir)
+        print('%-8s %10s %12s' % ('step', 'time', 'peak'))
+        elapsed, peak, data = measure(args.repeat, parse, awstats_dir,
+                                      args.site, args.compact)
+        print_step('parse', elapsed, peak)
+        elapsed, peak, report = measure(args.repeat, build_report, data)
+        print_step('report', elapsed, peak)
+        elapsed, peak, path = measure(args.repeat, write_report, reporter,
+                                      args.site, report)
+        print_step('write', elapsed, peak)
+        print('Report size: %.1f MB.' % (
+            os.path.getsize(path) / 1024.0 / 1024))
+    finally:
+        rmtree(tmp_dir)
+
+
+if __name__ == '__main__':
+    main()
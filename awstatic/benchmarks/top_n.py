@@ -0,0 +1,73 @@
+"""Compare the selection of the top entries of a report with a full
+sort, on large synthetic sections.
+"""
+
+import random
+from timeit import default_timer
+
+from awstatic.reporter import _create_report_top10
+from awstatic.reporter import _select_top
+
+
+N_MONTHS = 12
+N_URLS = 100000
+
+
+def make_data(n_months, n_urls):
+    """Return fake parsed data with a ``SIDER`` section."""
+    rand = random.Random(0)
+    section = {}
+    for month in range(1, 1 + n_months):
+        rows = []
+        for i in range(n_urls):
+            rows.append(('/page/%d' % i,
+                         rand.randint(1, 1000),
+                         rand.randint(1000, 10 ** 6),
+                         0,
+                         0))
+        section['2012%02d' % month] = rows
+    return {'SIDER': section}
+
+
+def full_sort(items, key, top=None):
+    items = sorted(items, key=key, reverse=True)
+    if top:
+        items = items[:top]
+    return items
+
+
+def timed(func, *args):
+    start = default_timer()
+    result = func(*args)
+    return default_timer() - start, result
+
+
+def main():
+    data = make_data(N_MONTHS, N_URLS)
+    print('%d months of %d URLs.' % (N_MONTHS, N_URLS))
+
+    items = [{'url': row[0], 'pages': row[1]}
+             for rows in data['SIDER'].values() for row in rows]
+    key = lambda i: i['pages']
+    sort_time, expected = timed(full_sort, items, key, 10)
+    top_time, result = timed(_select_top, items, key, 10)
+    assert result == expected
+    print('Top 10 of %d items:' % len(items))
+    print('    full sort:   %.3fs' % sort_time)
+    print('    _select_top: %.3fs (%.1fx)' % (top_time, sort_time / top_time))
+
+    import awstatic.reporter
+    awstatic.reporter._select_top = full_sort
+    try:
+        sort_time, expected = timed(_create_report_top10, data)
+    finally:
+        awstatic.reporter._select_top = _select_top
+    top_time, result = timed(_create_report_top10, data)
+    assert result == expected
+    print('_create_report_top10():')
+    print('    full sort:   %.3fs' % sort_time)
+    print('    _select_top: %.3fs (%.1fx)' % (top_time, sort_time / top_time))
+
+
+if __name__ == '__main__':
+    main()
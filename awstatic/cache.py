@@ -0,0 +1,151 @@
+"""Persistent caches for the data parsed from AWStats files and for
+the aggregates that are computed from them.
+
+Only the file of the current month changes from one run to the next
+one. Historical files can be read from the cache instead of being
+parsed again, and the aggregates of past years do not need to be
+computed again.
+"""
+
+import hashlib
+import os
+
+from awstatic.compat import pickle
+
+
+# Increment this number whenever the structure of the cached data
+# changes, so that stale entries are ignored.
+CACHE_VERSION = 3
+HASH_CHUNK_SIZE = 1024 * 1024
+
+
+def get_file_hash(path):
+    """Return the SHA-1 hash of the content of the given file."""
+    h = hashlib.sha1()
+    with open(path, 'rb') as fp:
+        while 1:
+            chunk = fp.read(HASH_CHUNK_SIZE)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+
+class ParseCache(object):
+    """A cache of the data returned by ``Parser`` for each file.
+
+    Each entry is stored as a separate file in ``cache_dir``. An entry
+    is valid if the path, the size and the modification time of the
+    file it has been built from are unchanged. If the size is the same
+    but the modification time differs (e.g. if the file has been
+    touched or copied), the hash of the content of the file is checked
+    before discarding the entry.
+
+    An entry is also discarded if it has been built for another list
+    of sections or another (compact or not) representation.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.mkdir(cache_dir)
+
+    def _get_entry_path(self, path):
+        return os.path.join(self.cache_dir,
+                            '%s.cache' % os.path.basename(path))
+
+    def get(self, path, sections, compact=False):
+        """Return cached data for the file at ``path``, or ``None`` if
+        there is no valid entry.
+        """
+        entry_path = self._get_entry_path(path)
+        try:
+            with open(entry_path, 'rb') as fp:
+                entry = pickle.load(fp)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('version') != CACHE_VERSION or \
+                entry['path'] != path or \
+                entry['sections'] != frozenset(sections) or \
+                entry['compact'] != compact:
+            return None
+        stat = os.stat(path)
+        if entry['size'] != stat.st_size:
+            return None
+        if entry['mtime'] != stat.st_mtime:
+            if entry['hash'] != get_file_hash(path):
+                return None
+            # Same content: remember the new modification time so that
+            # we do not compute the hash again next time.
+            entry['mtime'] = stat.st_mtime
+            self._write_entry(entry_path, entry)
+        return entry['data']
+
+    def set(self, path, sections, data, compact=False):
+        """Store ``data`` as the result of the parsing of the file at
+        ``path``.
+        """
+        stat = os.stat(path)
+        entry = {'version': CACHE_VERSION,
+                 'path': path,
+                 'sections': frozenset(sections),
+                 'compact': compact,
+                 'size': stat.st_size,
+                 'mtime': stat.st_mtime,
+                 'hash': get_file_hash(path),
+                 'data': data}
+        self._write_entry(self._get_entry_path(path), entry)
+
+    def _write_entry(self, entry_path, entry):
+        _write_entry(entry_path, entry)
+
+
+class AggregateCache(object):
+    """A cache of the aggregates of each year of the reports of each
+    site.
+
+    Each entry is stored as a separate file in ``cache_dir``, along
+    with a fingerprint of the AWStats files of the year it has been
+    computed from. An entry is valid only if this fingerprint is
+    unchanged.
+    """
+
+    def __init__(self, cache_dir):
+        self.cache_dir = cache_dir
+        if not os.path.exists(cache_dir):
+            os.mkdir(cache_dir)
+
+    def _get_entry_path(self, site_id, report, year):
+        return os.path.join(self.cache_dir, '%s.%s.%s.aggregate' % (
+            site_id, report, year))
+
+    def get(self, site_id, report, year, fingerprint):
+        """Return the cached aggregates of the given year, or ``None``
+        if there is no valid entry.
+        """
+        entry_path = self._get_entry_path(site_id, report, year)
+        try:
+            with open(entry_path, 'rb') as fp:
+                entry = pickle.load(fp)
+        except (IOError, OSError, EOFError, pickle.UnpicklingError):
+            return None
+        if entry.get('version') != CACHE_VERSION or \
+                entry['fingerprint'] != fingerprint:
+            return None
+        return entry['aggregates']
+
+    def set(self, site_id, report, year, fingerprint, aggregates):
+        """Store ``aggregates`` as the aggregates of the given year."""
+        entry = {'version': CACHE_VERSION,
+                 'fingerprint': fingerprint,
+                 'aggregates': aggregates}
+        _write_entry(self._get_entry_path(site_id, report, year), entry)
+
+
+def _write_entry(entry_path, entry):
+    # Write in a temporary file first, so that a concurrent or
+    # interrupted run never sees a partially written entry.
+    tmp_path = '%s.%d.tmp' % (entry_path, os.getpid())
+    with open(tmp_path, 'wb') as fp:
+        pickle.dump(entry, fp, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, entry_path)
@@ -7,6 +7,7 @@ import sys
 
 from awstatic import __version__ as VERSION
 from awstatic.compat import SafeConfigParser
+from awstatic.reporter import ReportError
 from awstatic.reporter import Reporter
 
 
@@ -18,10 +19,15 @@ def main():
     args = parse_args()
     config_file = args.config_file
     config = get_config(config_file)
+    if args.profile is not None:
+        config['profile'] = os.path.abspath(args.profile)
     pdb_mode = config.pop('pdb')
     r = Reporter(**config)
     try:
         r.run()
+    except ReportError as exc:
+        config['logger'].error('%s Program aborted.', exc)
+        sys.exit(1)
     except:
         logging.exception('An unexpected error occurred (see traceback '
                           'below). Program aborted.')
@@ -45,6 +51,11 @@ def parse_args():  # pragma: no coverage
         default=DEFAULT_CONFIG_FILE,
         help='The configuration file to use. Default is '
              '"./%s".' % DEFAULT_CONFIG_FILE)
+    add('--profile',
+        metavar='PATH',
+        help='Profile the run and write statistics in PATH (and '
+             'statistics of each site in "PATH.<site>"). This overrides '
+             'the "profile" option of the configuration file.')
     return parser.parse_args()
 
 
@@ -62,7 +73,11 @@ def get_config(config_file):
     # Check unknown directives
     for key in options.keys():
         if key not in ('awstats_dir', 'file_prefix', 'file_suffix',
-                       'sites', 'out_dir', 'pdb'):
+                       'sites', 'out_dir', 'cache_dir', 'workers',
+                       'compact', 'split_data', 'precompress',
+                       'hashed_filenames', 'stats_file', 'profile',
+                       'referrers_top', 'heavy_hitters',
+                       'precompile_templates', 'bundle_assets', 'pdb'):
             sys.exit('Unknown option in configuration file: "%s". '
                      'Program aborted.' % key)
 
@@ -86,6 +101,32 @@ def get_config(config_file):
     if os.path.exists(out_dir) and not os.path.isdir(out_dir):
         sys.exit('The value of "out_dir" ("%s") should be a directory.' %
                  out_dir)
+    cache_dir = options.get('cache_dir', None)
+    if cache_dir is not None:
+        cache_dir = os.path.abspath(cache_dir)
+        if not os.path.isdir(os.path.dirname(cache_dir)):
+            sys.exit('The parent of "cache_dir" ("%s") must be an existing '
+                     'directory.' % cache_dir)
+        if os.path.exists(cache_dir) and not os.path.isdir(cache_dir):
+            sys.exit('The value of "cache_dir" ("%s") should be a '
+                     'directory.' % cache_dir)
+    stats_file = options.get('stats_file', None)
+    if stats_file is not None:
+        stats_file = os.path.abspath(stats_file)
+        if not os.path.isdir(os.path.dirname(stats_file)):
+            sys.exit('The parent of "stats_file" ("%s") must be an existing '
+                     'directory.' % stats_file)
+    profile = options.get('profile', None)
+    if profile is not None:
+        profile = os.path.abspath(profile)
+        if not os.path.isdir(os.path.dirname(profile)):
+            sys.exit('The parent of "profile" ("%s") must be an existing '
+                     'directory.' % profile)
+
+    # Check number of worker processes and sizes of reports
+    workers = get_positive_integer(options, 'workers', '1')
+    referrers_top = get_positive_integer(options, 'referrers_top')
+    heavy_hitters = get_positive_integer(options, 'heavy_hitters')
 
     # Prepare config dict and provide default values for optional
     # directives
@@ -94,6 +135,23 @@ def get_config(config_file):
               'file_prefix': options.get('file_prefix', 'awstats'),
               'file_suffix': options.get('file_suffix', 'txt'),
               'sites': [],
+              'cache_dir': cache_dir,
+              'stats_file': stats_file,
+              'profile': profile,
+              'workers': workers,
+              'referrers_top': referrers_top,
+              'heavy_hitters': heavy_hitters,
+              'compact': options.get('compact', '').lower() in ('1', 'true'),
+              'split_data': options.get(
+                  'split_data', '').lower() in ('1', 'true'),
+              'precompress': options.get(
+                  'precompress', '').lower() in ('1', 'true'),
+              'hashed_filenames': options.get(
+                  'hashed_filenames', '').lower() in ('1', 'true'),
+              'precompile_templates': options.get(
+                  'precompile_templates', '').lower() in ('1', 'true'),
+              'bundle_assets': options.get(
+                  'bundle_assets', '').lower() in ('1', 'true'),
               'pdb': options.get('pdb', '').lower() in ('1', 'true')}
     for id_url in options['sites'].split():
         error = False
@@ -111,6 +169,23 @@ def get_config(config_file):
     return config
 
 
+def get_positive_integer(options, name, default=None):
+    """Return the value of the given option as a positive integer, or
+    ``default`` (converted) if it is missing.
+    """
+    value = options.get(name, default)
+    if value is None:
+        return None
+    try:
+        value = int(value)
+    except ValueError:
+        value = 0
+    if value < 1:
+        sys.exit('The value of "%s" ("%s") should be a positive '
+                 'integer.' % (name, options[name]))
+    return value
+
+
 def get_logger(options):
     logger = logging.getLogger('AWStatic')
     level = options.get('level', DEFAULT_LOG_LEVEL).lower()
@@ -1,5 +1,6 @@
 """Compatibility layer for Python 3."""
 
+from array import array
 import sys
 
 
@@ -9,9 +10,59 @@ if PY3:  # pragma: no cover
     from configparser import SafeConfigParser
 else:  # pragma: no cover
     from ConfigParser import SafeConfigParser  # pyflakes: ignore
+if PY3:  # pragma: no cover
+    import pickle
+else:  # pragma: no cover
+    import cPickle as pickle  # pyflakes: ignore
+if PY3:  # pragma: no cover
+    text_type = str
+else:  # pragma: no cover
+    text_type = unicode  # pyflakes: ignore
+if PY3:  # pragma: no cover
+    izip = zip
+else:  # pragma: no cover
+    from itertools import izip  # pyflakes: ignore
 if PY3:  # pragma: no cover
     from urllib.parse import quote_plus
     from urllib.parse import unquote_plus
 else:  # pragma: no cover
     from urllib import quote_plus  # pyflakes: ignore
     from urllib import unquote_plus  # pyflakes: ignore
+
+# Type code of arrays of (signed) 64-bit integers. The 'q' type code is
+# not available before Python 3.3.
+try:
+    array('q')
+except ValueError:  # pragma: no cover
+    INT_ARRAY_TYPECODE = 'l'
+else:  # pragma: no cover
+    INT_ARRAY_TYPECODE = 'q'
+
+# The 'resource' module is not available on Windows.
+try:  # pragma: no cover
+    import resource
+except ImportError:  # pragma: no cover
+    resource = None
+
+# The 'tracemalloc' module (used by benchmarks) is not available before
+# Python 3.4.
+try:  # pragma: no cover
+    import tracemalloc
+except ImportError:  # pragma: no cover
+    tracemalloc = None
+
+# Optional dependency for the minification of scripts.
+try:  # pragma: no cover
+    from rjsmin import jsmin
+except ImportError:  # pragma: no cover
+    jsmin = None
+
+# Optional dependencies for stronger compression of the generated files.
+try:  # pragma: no cover
+    import brotli
+except ImportError:  # pragma: no cover
+    brotli = None
+try:  # pragma: no cover
+    from zopfli.gzip import compress as zopfli_gzip_compress
+except ImportError:  # pragma: no cover
+    zopfli_gzip_compress = None
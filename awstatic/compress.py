@@ -0,0 +1,70 @@
+"""Precompression of the generated files.
+
+HTTP servers can serve precompressed files directly (e.g. with the
+``gzip_static`` and ``brotli_static`` directives of nginx), instead of
+compressing them on each request.
+"""
+
+import gzip
+from io import BytesIO
+import os
+
+from awstatic.compat import brotli
+from awstatic.compat import zopfli_gzip_compress
+
+
+COMPRESSIBLE_EXTENSIONS = ('.css', '.html', '.js', '.json')
+COMPRESSED_SUFFIXES = ('.gz', '.br')
+
+
+def is_compressible(path):
+    """Return whether the given file is worth compressing."""
+    return os.path.splitext(path)[1] in COMPRESSIBLE_EXTENSIONS
+
+
+def get_compressed_suffixes():
+    """Return the suffixes of the compressed copies that
+    ``write_compressed_copies()`` writes, depending on the installed
+    modules.
+    """
+    if brotli is not None:  # pragma: no cover
+        return COMPRESSED_SUFFIXES
+    return tuple(suffix for suffix in COMPRESSED_SUFFIXES
+                 if suffix != '.br')
+
+
+def gzip_compress(content, mtime):
+    """Return ``content`` compressed with the best available gzip
+    implementation: zopfli if it is installed, the standard library
+    (with the highest compression level) otherwise.
+    """
+    if zopfli_gzip_compress is not None:  # pragma: no cover
+        return zopfli_gzip_compress(content)
+    out = BytesIO()
+    with gzip.GzipFile(filename='', mode='wb', compresslevel=9,
+                       fileobj=out, mtime=mtime) as fp:
+        fp.write(content)
+    return out.getvalue()
+
+
+def write_compressed_copies(path):
+    """Write a gzip-compressed copy of the file at ``path`` as
+    ``<path>.gz`` and, if the ``brotli`` module is installed, a
+    Brotli-compressed copy as ``<path>.br``.
+
+    Copies have the same modification time as the original file.
+    Existing copies are replaced (not overwritten in place, since they
+    may be hard links to the files of a previous report).
+    """
+    with open(path, 'rb') as fp:
+        content = fp.read()
+    stat = os.stat(path)
+    copies = [(path + '.gz', gzip_compress(content, stat.st_mtime))]
+    if brotli is not None:  # pragma: no cover
+        copies.append((path + '.br', brotli.compress(content, quality=11)))
+    for copy_path, compressed in copies:
+        tmp_path = copy_path + '.tmp'
+        with open(tmp_path, 'wb') as fp:
+            fp.write(compressed)
+        os.utime(tmp_path, (stat.st_atime, stat.st_mtime))
+        os.rename(tmp_path, copy_path)
@@ -1,14 +1,19 @@
-import codecs
-from collections import defaultdict
+from array import array
+import io
+from itertools import islice
+from multiprocessing import Pool
 import os
 
+from awstatic.compat import INT_ARRAY_TYPECODE
+from awstatic.compat import izip
+
 
 _special = object()
 
 SECTIONS = {
     # A list of keys or '_special' if each line has a different
     # meaning (in which case we store all values of the line as a
-    # list).
+    # list). The first key is a string, the others are integers.
     'BROWSER': ('id', 'hits'),
     'DAY': ('yyyymmdd', 'pages', 'hits', 'bandwidth', 'visits'),
     'DOWNLOADS': ('url', 'hits', 'status_206', 'bandwidth'),
@@ -24,127 +29,370 @@ SECTIONS = {
     }
 
 
+# Number of rows that are converted at once in 'ColumnarSection'.
+COLUMNAR_CHUNK_SIZE = 1024
+
+
+def get_column_index(section, key):
+    """Return the position of ``key`` in the rows of ``section``."""
+    return SECTIONS[section].index(key)
+
+
+class ColumnarSection(object):
+    """A compact list of rows of a section.
+
+    Keys (the first value of each row) are stored in a list and the
+    other values are stored in arrays of integers, one per column.
+    Iterating over a ``ColumnarSection`` yields rows as tuples, as if
+    it were a list of rows.
+    """
+
+    def __init__(self, n_columns):
+        self.keys = []
+        self.columns = tuple(array(INT_ARRAY_TYPECODE)
+                             for i in range(n_columns - 1))
+
+    def extend(self, rows, intern=None):
+        """Append ``rows``. If given, ``intern`` is called on each key
+        and must return the key to store.
+        """
+        rows = iter(rows)
+        while 1:
+            # Rows are appended by chunks, which is a lot faster than
+            # appending each value one by one.
+            chunk = list(islice(rows, COLUMNAR_CHUNK_SIZE))
+            if not chunk:
+                break
+            columns = izip(*chunk)
+            keys = next(columns)
+            if intern is not None:
+                keys = map(intern, keys)
+            self.keys.extend(keys)
+            for column, values in izip(self.columns, columns):
+                column.extend(values)
+
+    def __len__(self):
+        return len(self.keys)
+
+    def __iter__(self):
+        return izip(self.keys, *self.columns)
+
+
 class Parser(object):
     """A parser for AWStats report files.
 
     Data is stored in the ``data`` attribute as a dictionary. See
-    'tests/test_parser.py' for the structure of this dictionary. The
-    keys of this dictionary are:
+    'tests/test_parser.py' for the structure of this dictionary. Keys
+    of this dictionary are section names, values are dictionaries
+    where keys are months (as a string formatted as YYYYMM) and values
+    are the list of the rows of the section. Each row is a tuple of
+    the values listed in ``SECTIONS``: the first one is a string (for
+    example an URL), the others are integers. The sections are:
 
     ``BROWSER``
-        Keys are browser identifiers (e.g. "firefox4.0.1", or
-        "opera9.80"), values are dictionaries with a ``hits`` key.
+        Browser identifier (e.g. "firefox4.0.1", or "opera9.80") and
+        ``hits``.
 
     ``DAY``
-        Keys are the days of the month (as a string formatted as
-        YYYYMMDD), values are dictionaries with the following keys:
-        ``hits``, ``bandwidth``, ``pages`` and ``visits``.
+        Day of the month (as a string formatted as YYYYMMDD),
+        ``pages``, ``hits``, ``bandwidth`` and ``visits``.
 
     ``DOWNLOADS``
-        The most downloaded files: keys are the relative URL, values
-        are dictionaries with the following keys: ``hits`` and
-        ``bandwidth``.
+        The most downloaded files: relative URL, ``hits``, number of
+        ``206`` responses and ``bandwidth``.
 
     ``ERRORS``
-        Keys are the HTTP status code (e.g. "404"), values are
-        dictionaries with the following keys: ``hits``, ``bandwidth``.
+        HTTP status code (e.g. "404"), ``hits`` and ``bandwidth``.
 
     ``GENERAL``
-        Contains, amongst other things, the number of visits
-        (``TotalVisits``) and visitors (``TotalUnique``), both being a
-        list with a single (string) value.
+        Not a list of rows but a dictionary that contains, amongst
+        other things, the number of visits (``TotalVisits``) and
+        visitors (``TotalUnique``), both being a list with a single
+        (string) value.
 
     ``KEYWORDS``
-        Each key is a single search keyword. Values are dictionaries
-        that include a ``searches`` key.
+        A single search keyword (quoted) and the number of
+        ``searches``.
 
     ``OS``
-        Keys are OS identifiers (e.g. "winxp", "winlong", "macosx",
-        "linux" or "linuxubuntu"), values are dictionaries with a
-        ``hits`` key.
+        OS identifier (e.g. "winxp", "winlong", "macosx", "linux" or
+        "linuxubuntu") and ``hits``.
 
     ``PAGEREFS``
-        Keys are the referrers (URLs), values are dictionaries with
-        the following values: ``hits`` and ``pages``.
+        Referrer (URL), ``pages`` and ``hits``.
 
     ``SEARCHWORDS``
-        Each key is a search phrase. Values are dictionaries that
-        include a ``searches`` key.
+        A search phrase (quoted) and the number of ``searches``.
 
     ``SEREFERRALS``
-        Keys are the search engine identifiers ("google", "yahoo",
-        etc.). Values are dictionaries with the following keys:
-        ``pages``, ``hits``.
+        Search engine identifier ("google", "yahoo", etc.), ``pages``
+        and ``hits``.
 
     ``SIDER``
-        The most viewed pages: keys are the relative URL, values are
-        dictionaries with the following keys: ``pages`` and
-        ``bandwidth``.
+        The most viewed pages: relative URL, ``pages``,
+        ``bandwidth``, number of entries and exits.
 
     ``VISITOR``
-        Keys are the (DNS reversed) host of the visitor, values are
-        dictionaries with the following keys: ``hits``, ``bandwidth``
-        and ``pages``.
+        (DNS reversed) host of the visitor, ``pages``, ``hits`` and
+        ``bandwidth``.
 
     The parser does not make available everything from AWStats report
     files.
+
+    If the parser is created with ``compact=True``, each list of rows
+    is stored as a ``ColumnarSection`` instead, which uses a lot less
+    memory for large sections.
     """
 
-    def __init__(self):
+    def __init__(self, sections=None, use_map=True, cache=None,
+                 compact=False):
+        """``sections`` is the list of names of the sections to read
+        (see ``SECTIONS``). All supported sections are read if it is
+        ``None``.
+
+        If ``use_map`` is true, the parser reads the ``MAP`` section
+        that AWStats writes at the beginning of each file and directly
+        seeks to the requested sections. If the map is missing or
+        inconsistent with the content of the file, the parser falls
+        back to reading the whole file.
+
+        ``cache`` may be an instance of ``awstatic.cache.ParseCache``,
+        in which case files that have not changed since they were last
+        parsed are not read again.
+
+        If ``compact`` is true, rows are stored in ``ColumnarSection``
+        objects instead of lists.
+        """
         self.data = {}
+        if sections is None:
+            sections = SECTIONS.keys()
+        self.sections = frozenset(sections)
+        self.use_map = use_map
+        self.cache = cache
+        self.compact = compact
+        # Number of bytes that have been read from files (not counting
+        # files that were found in the cache). When the map is used,
+        # only the map and the requested sections are counted.
+        self.bytes_read = 0
+        # A fingerprint of the file of each month (formatted as
+        # YYYYMM), which changes whenever the file changes.
+        self.fingerprints = {}
+        # Keys of compact sections (URLs, hosts, etc.) are shared
+        # amongst months.
+        self._interned = {}
+
+    def _intern(self, key):
+        return self._interned.setdefault(key, key)
 
     def _read_section(self, fp, first_line):
         name, length = first_line.split()
         name = name[len('BEGIN_'):]
         length = int(length)
-        lines = []
-        while length > 0:
-            lines.append(fp.readline().strip())
-            length -= 1
-        fp.readline()  # eat ending line ('END_<section_name>')
         data_keys = SECTIONS.get(name, None)
-        if not data_keys:  # unknown/unsupported section name
-            return None, None
-        data = defaultdict(dict)
-        for line in lines:
-            values = line.split()
-            key = values[0]
-            if data_keys is _special:
-                data[key] = values[1:]
-            else:
-                for i, data_key in enumerate(data_keys):
-                    data[key][data_key] = values[i]
+        if name not in self.sections or not data_keys:
+            # unknown, unsupported or unwanted section name
+            for i in range(length):
+                fp.readline()
+            data = None
+        elif data_keys is _special:
+            data = {}
+            for i in range(length):
+                values = fp.readline().split()
+                data[values[0]] = values[1:]
+        elif self.compact:
+            data = ColumnarSection(len(data_keys))
+            data.extend(_iter_rows(fp, length, len(data_keys)),
+                        intern=self._intern)
+        else:
+            data = list(_iter_rows(fp, length, len(data_keys)))
+        fp.readline()  # eat ending line ('END_<section_name>')
         return name, data
 
+    def _read_map(self, fp):
+        """Return the offsets listed in the ``MAP`` section as a
+        dictionary (where keys are section names), or ``None`` if the
+        file does not have a map.
+        """
+        for line in iter(fp.readline, ''):
+            if line.startswith('BEGIN_MAP '):
+                break
+            if line.startswith('BEGIN_'):  # a map must come first
+                return None
+        else:
+            return None
+        offsets = {}
+        for i in range(int(line.split()[1])):
+            try:
+                name, offset = fp.readline().split()
+                offset = int(offset)
+            except ValueError:
+                return None
+            offsets[name[len('POS_'):]] = offset
+        return offsets
+
+    def _read_sections_with_map(self, fp):
+        """Return the requested sections of the file by seeking to
+        the offsets listed in its map, and the number of bytes that
+        have been read, or ``None`` if the map is missing or
+        inconsistent.
+        """
+        offsets = self._read_map(fp)
+        if offsets is None:
+            return None
+        # Files are read line by line, so that positions are offsets
+        # in bytes.
+        n_bytes = fp.tell()
+        sections = []
+        for name in sorted(self.sections):
+            offset = offsets.get(name, None)
+            if offset is None:
+                return None
+            fp.seek(offset)
+            try:
+                line = fp.readline()
+            except UnicodeDecodeError:  # not the beginning of a line
+                return None
+            if not line.startswith('BEGIN_%s ' % name):
+                return None
+            sections.append(self._read_section(fp, line))
+            n_bytes += fp.tell() - offset
+        return sections, n_bytes
+
+    def _read_sections(self, fp):
+        """Return all sections of the file by reading it line by
+        line.
+        """
+        sections = []
+        for line in iter(fp.readline, ''):
+            if line.startswith('BEGIN_'):
+                sections.append(self._read_section(fp, line))
+        return sections
+
+    def _parse_file(self, path):
+        """Return data of the given file as a dictionary, where keys
+        are section names, and the number of bytes that have been
+        read.
+        """
+        with io.open(path, 'r', encoding='utf-8') as fp:
+            result = None
+            if self.use_map:
+                result = self._read_sections_with_map(fp)
+            if result is None:
+                fp.seek(0)
+                result = self._read_sections(fp), os.path.getsize(path)
+        sections, n_bytes = result
+        data = dict((section, data) for section, data in sections if data)
+        return data, n_bytes
+
+    def _get_cached(self, path):
+        if self.cache is None:
+            return None
+        return self.cache.get(path, self.sections, self.compact)
+
+    def _set_cached(self, path, sections):
+        if self.cache is not None:
+            self.cache.set(path, self.sections, sections, self.compact)
+
+    def _store(self, yyyymm, sections):
+        for section, data in sections.items():
+            if not section in self.data:
+                self.data[section] = {}
+            self.data[section][yyyymm] = data
+
     def parse_file(self, path, yyyymm):
         """Parse a single file that corresponds to the given date
         (formatted as YYYYMM).
         """
-        with codecs.open(path, 'r', 'utf-8') as fp:
-            while 1:
-                line = fp.readline()
-                if not line:  # end of file
-                    break
-                while 1:
-                    if line.startswith('BEGIN_'):
-                        break
-                    line = fp.readline()
-                section, data = self._read_section(fp, line)
-                if not data:
-                    continue
-                if not section in self.data:
-                    self.data[section] = defaultdict(dict)
-                self.data[section][yyyymm] = data
-
-    def parse_dir(self, site_id, in_dir, prefix, suffix):
+        sections = self._get_cached(path)
+        if sections is None:
+            sections, n_bytes = self._parse_file(path)
+            self.bytes_read += n_bytes
+            self._set_cached(path, sections)
+        self._store(yyyymm, sections)
+        self.fingerprints[yyyymm] = get_fingerprint(path)
+
+    def parse_dir(self, site_id, in_dir, prefix, suffix, workers=1):
         """Parse all files of the given directory that are related to
         the given site.
+
+        If ``workers`` is greater than 1, files are parsed in parallel
+        by a pool of ``workers`` processes.
         """
         suffix = '.%s.%s' % (site_id, suffix)
-        for filename in os.listdir(in_dir):
+        files = []
+        for filename in sorted(os.listdir(in_dir)):
             if not (filename.startswith(prefix) and filename.endswith(suffix)):
                 continue
             mmyyyy = filename[len(prefix):-len(suffix)]
             yyyymm = mmyyyy[2:] + mmyyyy[:2]
-            self.parse_file(os.path.join(in_dir, filename), yyyymm)
+            files.append((os.path.join(in_dir, filename), yyyymm))
+        if workers < 2:
+            for path, yyyymm in files:
+                self.parse_file(path, yyyymm)
+            return self.data
+
+        # Files that are in the cache are not sent to the workers.
+        # Results are stored in the order of the files, so that the
+        # data is the same as if files had been parsed sequentially.
+        results = {}
+        to_parse = []
+        for path, yyyymm in files:
+            sections = self._get_cached(path)
+            if sections is None:
+                to_parse.append(path)
+            else:
+                results[path] = sections
+        if to_parse:
+            pool = Pool(min(workers, len(to_parse)),
+                        initializer=_init_worker,
+                        initargs=(self.sections, self.use_map,
+                                  self.compact))
+            try:
+                for path, sections, n_bytes in pool.imap(
+                        _parse_file_in_worker, to_parse):
+                    self.bytes_read += n_bytes
+                    self._set_cached(path, sections)
+                    results[path] = sections
+                pool.close()
+            except:
+                pool.terminate()
+                raise
+            finally:
+                pool.join()
+        for path, yyyymm in files:
+            self._store(yyyymm, results[path])
+            self.fingerprints[yyyymm] = get_fingerprint(path)
         return self.data
+
+
+def get_fingerprint(path):
+    """Return a fingerprint (size and modification time) of the given
+    file.
+    """
+    stat = os.stat(path)
+    return '%d:%r' % (stat.st_size, stat.st_mtime)
+
+
+def _iter_rows(fp, length, n_keys):
+    """Read ``length`` lines from ``fp`` and yield each of them as a
+    tuple of ``n_keys`` values. The first value is kept as is, the
+    others are converted to integers.
+    """
+    for i in range(length):
+        values = fp.readline().split()
+        yield (values[0], ) + tuple(map(int, values[1:n_keys]))
+
+
+# The parser used by worker processes. It is set by '_init_worker()'
+# when each worker process starts.
+_worker_parser = None
+
+
+def _init_worker(sections, use_map, compact):
+    global _worker_parser
+    _worker_parser = Parser(sections=sections, use_map=use_map,
+                            compact=compact)
+
+
+def _parse_file_in_worker(path):
+    return (path, ) + _worker_parser._parse_file(path)
@@ -0,0 +1,86 @@
+"""Profiling of a run with ``cProfile``."""
+
+from contextlib import contextmanager
+import cProfile
+import os
+import pstats
+
+
+class Profiler(object):
+    """Profile a run: the main process on one side and the processing
+    of each site on the other side, so that sites can be profiled even
+    when they are processed in worker processes.
+
+    Statistics of each site are written in ``<path>.<site_id>``. At the
+    end of the run, ``dump()`` writes the statistics of the whole run
+    (main process and all sites) in ``path``. All files can be read
+    with the ``pstats`` module.
+
+    If ``path`` is ``None``, nothing is profiled.
+    """
+
+    def __init__(self, path=None):
+        self.path = path
+        self._profile = None
+
+    def __getstate__(self):
+        # Profiles cannot be pickled (and are not needed) when the
+        # reporter is sent to a worker process.
+        return {'path': self.path, '_profile': None}
+
+    @contextmanager
+    def profile_main(self):
+        """Profile the code that runs in this context."""
+        if self.path is None:
+            yield
+            return
+        self._profile = cProfile.Profile()
+        self._profile.enable()
+        try:
+            yield
+        finally:
+            self._profile.disable()
+
+    @contextmanager
+    def pause(self):
+        """Stop profiling the main process in this context (while sites
+        are profiled separately).
+        """
+        if self._profile is None:
+            yield
+            return
+        self._profile.disable()
+        try:
+            yield
+        finally:
+            self._profile.enable()
+
+    @contextmanager
+    def profile_site(self, site_id):
+        """Profile the code that runs in this context and write the
+        statistics in the file of the given site.
+        """
+        if self.path is None:
+            yield
+            return
+        profile = cProfile.Profile()
+        profile.enable()
+        try:
+            yield
+        finally:
+            profile.disable()
+            profile.dump_stats(self.get_site_path(site_id))
+
+    def get_site_path(self, site_id):
+        return '%s.%s' % (self.path, site_id)
+
+    def dump(self, site_ids):
+        """Write the statistics of the main process and of the given
+        sites in ``path``.
+        """
+        stats = pstats.Stats(self._profile)
+        for site_id in site_ids:
+            site_path = self.get_site_path(site_id)
+            if os.path.exists(site_path):
+                stats.add(site_path)
+        stats.dump_stats(self.path)
@@ -1,18 +1,72 @@
 from collections import defaultdict
+import hashlib
+import heapq
+import io
 import json
+from multiprocessing import Pool
 import os
 import shutil
 from time import strftime
+from time import time
+import traceback
 
+from awstatic.assets import BUNDLE_PATH
+from awstatic.assets import LOADER_PATH
+from awstatic.assets import bundle_scripts
+from awstatic.assets import get_assets
+from awstatic.assets import get_scripts
+from awstatic.assets import replace_assets
+from awstatic.assets import replace_scripts
+from awstatic.cache import AggregateCache
+from awstatic.cache import ParseCache
+from awstatic.cache import get_file_hash
 from awstatic.compat import PY3
+from awstatic.compat import text_type
 from awstatic.compat import unquote_plus
+from awstatic.compress import COMPRESSED_SUFFIXES
+from awstatic.compress import get_compressed_suffixes
+from awstatic.compress import is_compressible
+from awstatic.compress import write_compressed_copies
 from awstatic.parser import Parser
-from awstatic.utils import interpolate
+from awstatic.parser import get_column_index
+from awstatic.profiling import Profiler
+from awstatic.stats import RunStats
+from awstatic.templates import HANDLEBARS_PATH
+from awstatic.templates import PRECOMPILED_TEMPLATES_PATH
+from awstatic.templates import TemplateError
+from awstatic.templates import get_templates
+from awstatic.templates import precompile
+from awstatic.templates import replace_templates
+from awstatic.topk import SpaceSaving
+from awstatic.topk import merge
+from awstatic.utils import JSON_SEPARATORS
+from awstatic.utils import Memoized
+from awstatic.utils import dumps
 from awstatic.utils import get_number_of_days
+from awstatic.utils import interpolate
+from awstatic.utils import is_process_alive
+from awstatic.utils import iter_json
 
 
-BACKUP_DIR_NAME = '.backup'
 DATA_DIR_NAME = 'data'
+# Name of the subdirectory of the cache directory where aggregates of
+# each year are cached.
+AGGREGATE_CACHE_DIR_NAME = 'aggregates'
+# Lists the (possibly hashed) file names of the data files, see
+# 'Reporter._write_manifest()'.
+MANIFEST_NAME = 'manifest.json'
+# Staging directories of other runs are removed if the process that
+# created them is not running anymore, or if they are older than this
+# number of seconds. See 'Reporter._remove_stale_dirs()'.
+STALE_STAGING_AGE = 24 * 3600
+# Number of characters of the hash that are inserted in file names.
+HASH_LENGTH = 16
+# Maximum number of unquoted search keywords and phrases that are
+# cached. See '_unquote()'.
+UNQUOTE_CACHE_SIZE = 100000
+# Reports that are included in the index of a site when data is split
+# (see 'Reporter._write_split_report()').
+INDEX_REPORTS = ('overview', )
 # Paths that denote directories must end with a slash.
 TEMPLATE_STRUCTURE = ('assets/',
                       'assets/css/',
@@ -25,207 +79,766 @@ TEMPLATE_STRUCTURE = ('assets/',
                       'assets/js/libs/handlebars-1.0.0.beta.6.min.js',
                       'assets/js/libs/jquery-1.8.0.min.js',
                       'assets/js/libs/jquery.flot-0.7.min.js',
+                      'assets/js/loader.js',
                       'assets/js/ui.js',
                       'index.html',
                       '%s/' % DATA_DIR_NAME)
 
 
+class ReportError(Exception):
+    """Raised when the report of one or more sites could not be
+    generated.
+    """
+
+
 class Reporter(object):
 
     def __init__(self, awstats_dir, file_prefix, file_suffix,
-                 sites, out_dir, logger):
+                 sites, out_dir, logger, cache_dir=None, workers=1,
+                 compact=False, split_data=False, precompress=False,
+                 hashed_filenames=False, stats_file=None, profile=None,
+                 referrers_top=None, heavy_hitters=None,
+                 precompile_templates=False, bundle_assets=False):
         self.awstats_dir = awstats_dir
         self.file_prefix = file_prefix
         self.file_suffix = file_suffix
         self.sites = sites
         self.out_dir = out_dir
-        self.backup_dir = os.path.join(self.out_dir, BACKUP_DIR_NAME)
-        self.data_dir = os.path.join(self.out_dir, DATA_DIR_NAME)
+        # The report is built in a staging directory, next to the
+        # output directory, and is published only when it is complete.
+        # See '_publish()'.
+        parent, name = os.path.split(out_dir)
+        self._staging_prefix = '.%s.' % name
+        self.build_dir = os.path.join(parent, '%s%d.%d' % (
+            self._staging_prefix, int(time()), os.getpid()))
+        self.data_dir = os.path.join(self.build_dir, DATA_DIR_NAME)
         self.template_dir = os.path.join(os.path.dirname(__file__), 'template')
         self.log = logger
+        self.cache_dir = cache_dir
+        self.cache = None
+        self.aggregate_cache = None
+        self.workers = workers
+        self.compact = compact
+        self.split_data = split_data
+        self.precompress = precompress
+        self.hashed_filenames = hashed_filenames
+        self.precompile_templates = precompile_templates
+        self.bundle_assets = bundle_assets
+        self.stats_file = stats_file
+        self.stats = RunStats()
+        self.profiler = Profiler(profile)
+        self.report_options = {'referrers_top': referrers_top,
+                               'heavy_hitters': heavy_hitters}
 
     def run(self):
         """Read statistics and generate report."""
-        self._prepare_out_dir()
-        self._interpolate_in_index_html()
-
-        # 'data/sites.json' contains the list of the sites.
-        sites_json = os.path.join(self.data_dir, 'sites.json')
-        with open(sites_json, 'w+') as out:
-            out.write(json.dumps([site_id for (site_id, url) in self.sites]))
-
-        # Parse each AWStats report file.
-        for site_id, url in self.sites:
-            parser = Parser()
-            self.log.info('Reading AWStats data for "%s"...', site_id)
+        self._remove_stale_dirs()
+        with self.profiler.profile_main():
+            try:
+                self._build()
+            except:
+                # Leave the previous report untouched.
+                shutil.rmtree(self.build_dir, ignore_errors=True)
+                raise
+            with self.stats.measure(None, 'publish'):
+                self._publish()
+        if self.profiler.path is not None:
+            self.profiler.dump([site_id for (site_id, url) in self.sites])
+            self.log.info('Profiling statistics have been written in '
+                          '"%s".', self.profiler.path)
+        self.log.info('Statistics of the run:\n%s',
+                      '\n'.join(self.stats.format_summary()))
+        if self.stats_file is not None:
+            self._write_stats()
+
+    def _build(self):
+        """Generate the report in the staging directory."""
+        with self.stats.measure(None, 'prepare'):
+            self._prepare_out_dir()
+            self._interpolate_in_index_html()
+
+            # 'data/sites.json' contains the list of the sites.
+            sites_json = os.path.join(self.data_dir, 'sites.json')
+            self._write_file(
+                sites_json, dumps([site_id for (site_id, url) in self.sites]),
+                hashed=self.hashed_filenames)
+
+        if self.cache_dir is not None:
+            self.cache = ParseCache(self.cache_dir)
+            self.aggregate_cache = AggregateCache(os.path.join(
+                self.cache_dir, AGGREGATE_CACHE_DIR_NAME))
+
+        # Parse each AWStats report file and write the report of each
+        # site. A failure does not prevent us from processing other
+        # sites.
+        # Sites are profiled separately.
+        failed = []
+        with self.profiler.pause():
+            for site_id, error, records in self._process_sites():
+                self.stats.extend(records)
+                if error is not None:
+                    self.log.error('Could not generate report for "%s". '
+                                   'Traceback follows:\n%s', site_id, error)
+                    failed.append(site_id)
+        if failed:
+            raise ReportError(
+                'Could not generate report for the following site(s): %s. '
+                'The previous report has been kept.' % ', '.join(failed))
+        self._write_manifest()
+
+    def _process_sites(self):
+        """Process each site (possibly in parallel) and yield a tuple
+        ``(site_id, error, records)`` for each site, where ``error`` is
+        the formatted traceback of the exception that occurred, or
+        ``None``, and ``records`` are the statistics of the phases of
+        the site (see ``RunStats``).
+        """
+        workers = min(self.workers, len(self.sites))
+        if workers < 2:
+            for site_id, url in self.sites:
+                yield self._process_site_safely(site_id, url)
+            return
+        pool = Pool(workers, initializer=_init_worker, initargs=(self, ))
+        try:
+            for result in pool.imap_unordered(_process_site_in_worker,
+                                              self.sites):
+                yield result
+            pool.close()
+        except:
+            pool.terminate()
+            raise
+        finally:
+            pool.join()
+
+    def _process_site_safely(self, site_id, url):
+        # Statistics of the site are collected apart, since this may
+        # run in a worker process.
+        site_stats = RunStats()
+        run_stats, self.stats = self.stats, site_stats
+        try:
+            with self.profiler.profile_site(site_id):
+                self._process_site(site_id, url)
+            error = None
+        except Exception:
+            error = traceback.format_exc()
+        finally:
+            self.stats = run_stats
+        return site_id, error, site_stats.records
+
+    def _process_site(self, site_id, url):
+        """Read statistics of a site and write its report."""
+        parser = Parser(sections=get_required_sections(), cache=self.cache,
+                        compact=self.compact)
+        self.log.info('Reading AWStats data for "%s"...', site_id)
+        # Sites are processed in parallel if there are many of them.
+        # Otherwise, we can parse the files of the site in parallel.
+        parse_workers = self.workers if len(self.sites) == 1 else 1
+        with self.stats.measure(site_id, 'parse'):
             data = parser.parse_dir(site_id, self.awstats_dir,
-                                    self.file_prefix, self.file_suffix)
-            report = create_report(data, url)
-            site_path = os.path.join(self.data_dir, '%s.json' % site_id)
-            self.log.info('Writing "%s"...', site_path)
-            with open(site_path, 'w+') as out:
-                out.write(json.dumps(report))
+                                    self.file_prefix, self.file_suffix,
+                                    workers=parse_workers)
+            self.stats.add('bytes_read', parser.bytes_read)
+        report = create_report(data, url, self.stats, site_id,
+                               self.aggregate_cache, parser.fingerprints,
+                               self.report_options)
+        site_path = os.path.join(self.data_dir, '%s.json' % site_id)
+        self.log.info('Writing "%s"...', site_path)
+        with self.stats.measure(site_id, 'write'):
+            if self.split_data:
+                self._write_split_report(site_id, site_path, report)
+            else:
+                self._write_file(site_path, iter_json(report, depth=2),
+                                 hashed=self.hashed_filenames)
 
-        # Everything went fine, we can remove the backup.
-        if os.path.exists(self.backup_dir):
-            shutil.rmtree(self.backup_dir)
+    def _write_split_report(self, site_id, site_path, report):
+        """Write the report of a site as a small index and one file
+        per report and per period, so that the browser loads only what
+        it displays.
+
+        The index has the same structure as the full report, except
+        that reports that are not listed in ``INDEX_REPORTS`` are
+        replaced by a ``shards`` key. For each of these reports, it
+        maps each available period to the path (relative to the data
+        directory) of the file that holds its data:
+        ``<site_id>/<report>/<period>.json``, or
+        ``<site_id>/<report>/<period>.<hash>.json`` if file names are
+        hashed.
+        """
+        index = dict(report)
+        shards = {}
+        for name, builder, sections in REPORTS:
+            if name in INDEX_REPORTS:
+                continue
+            value = index.pop(name)
+            report_dir = os.path.join(self.data_dir, site_id, name)
+            os.makedirs(report_dir)
+            shards[name] = {}
+            for period, items in value.items():
+                path = os.path.join(report_dir, '%s.json' % period)
+                path = self._write_file(path, dumps(items),
+                                        hashed=self.hashed_filenames)
+                shards[name][period] = '/'.join(
+                    (site_id, name, os.path.basename(path)))
+        index['shards'] = shards
+        self._write_file(site_path, iter_json(index, depth=2),
+                         hashed=self.hashed_filenames)
+
+    def _write_file(self, path, content, hashed=False):
+        """Write ``content`` in the file at ``path`` and precompress
+        it if needed. Return the path of the written file.
+
+        ``content`` is either a string or an iterable of strings
+        (e.g. from ``iter_json()``) that are written one after the
+        other.
+
+        If ``hashed`` is true, the hash of the content is inserted in
+        the file name, before the extension.
+
+        If the published report has a file with the same content at
+        the same place, it is hard-linked instead, so that its
+        modification time (and therefore HTTP caches) is preserved.
+        """
+        if isinstance(content, (bytes, text_type)):
+            content = (content, )
+        # The final path is not known until the content has been
+        # hashed.
+        tmp_path = path + '.tmp'
+        digest = hashlib.sha1()
+        size = 0
+        with open(tmp_path, 'wb') as out:
+            for chunk in content:
+                if not isinstance(chunk, bytes):
+                    chunk = chunk.encode('utf-8')
+                digest.update(chunk)
+                size += len(chunk)
+                out.write(chunk)
+        digest = digest.hexdigest()
+        if hashed:
+            base, ext = os.path.splitext(path)
+            path = '%s.%s%s' % (base, digest[:HASH_LENGTH], ext)
+        filename = os.path.relpath(path, self.build_dir)
+        if self._link_previous(path, filename, size, digest):
+            os.unlink(tmp_path)
+            return path
+        os.rename(tmp_path, path)
+        self.stats.add('bytes_written', size)
+        self._compress(path)
+        return path
+
+    def _compress(self, path):
+        if self.precompress and is_compressible(path):
+            write_compressed_copies(path)
 
     def _prepare_out_dir(self):
-        """Prepare output directory.
+        """Prepare the staging directory and create template files.
 
-        Here we backup the previous run (if any) in case something
-        goes wrong later and we create template files.
+        Template files that have not changed since the previous run
+        are hard-linked from the published report instead of being
+        copied.
         """
-        if not os.path.exists(self.out_dir):
-            os.mkdir(self.out_dir)
-        elif not os.path.exists(self.backup_dir):
-            os.mkdir(self.backup_dir)
-            for filename in os.listdir(self.out_dir):
-                if filename == BACKUP_DIR_NAME:
-                    continue
-                path = os.path.join(self.out_dir, filename)
-                shutil.move(path, self.backup_dir)
+        os.mkdir(self.build_dir)
         for res in TEMPLATE_STRUCTURE:
             filename = res.replace('/', os.sep)
             src_path = os.path.join(self.template_dir, filename)
-            out_path = os.path.join(self.out_dir, filename)
+            out_path = os.path.join(self.build_dir, filename)
             if res.endswith('/'):
                 os.mkdir(out_path)
-            else:
+            elif not self._link_previous(out_path, filename,
+                                         os.path.getsize(src_path),
+                                         get_file_hash(src_path)):
                 shutil.copy(src_path, out_path)
+                self.stats.add('bytes_written', os.path.getsize(out_path))
+                self._compress(out_path)
+
+    def _link_previous(self, out_path, filename, size, digest):
+        """Hard link the file of the published report at ``filename``
+        (a path relative to the output directory) to ``out_path`` if
+        it has the given ``size`` and SHA-1 ``digest``. Return whether
+        the file has been linked.
+
+        Compressed copies are linked too, but only those that would be
+        written now: if one of them is missing (e.g. because ``brotli``
+        has been installed since the previous run), copies are written
+        again.
+        """
+        previous_path = os.path.join(self.out_dir, filename)
+        if not os.path.isfile(previous_path) or \
+                os.path.getsize(previous_path) != size or \
+                get_file_hash(previous_path) != digest:
+            return False
+        links = [(previous_path, out_path)]
+        missing_copies = False
+        if self.precompress and is_compressible(out_path):
+            for suffix in get_compressed_suffixes():
+                if os.path.exists(previous_path + suffix):
+                    links.append((previous_path + suffix, out_path + suffix))
+                else:
+                    missing_copies = True
+        try:
+            for src, dst in links:
+                os.link(src, dst)
+        except OSError:  # e.g. hard links are not supported
+            for src, dst in links:
+                if os.path.exists(dst):
+                    os.unlink(dst)
+            return False
+        if missing_copies:
+            self._compress(out_path)
+        return True
 
     def _interpolate_in_index_html(self):
         """Replace dynamic content in ``index.html``."""
-        path = os.path.join(self.out_dir, 'index.html')
-        with open(path) as fp:
+        src_path = os.path.join(self.template_dir, 'index.html')
+        with io.open(src_path, encoding='utf-8') as fp:
             content = fp.read()
         today = strftime('%d %B %Y')
-        content = interpolate(content, last_update=today)
-        with open(path, 'w+') as fp:
-            fp.write(content)
+        use_manifest = 'true' if self.hashed_filenames else 'false'
+        if self.precompile_templates:
+            content = self._precompile_templates(content)
+        urls = {}
+        if self.bundle_assets:
+            content, urls = self._bundle_assets(content)
+        content = interpolate(content, last_update=today,
+                              use_manifest=use_manifest,
+                              loader_url=urls.get(LOADER_PATH, LOADER_PATH))
+        path = os.path.join(self.build_dir, 'index.html')
+        # 'index.html' may be a hard link to the published file.
+        os.unlink(path)
+        self._write_file(path, content)
+
+    def _precompile_templates(self, content):
+        """Write the precompiled Handlebars templates of ``index.html``
+        (whose ``content`` is given) and return the content where
+        templates are replaced by a link to the precompiled ones.
+
+        If templates cannot be precompiled, a warning is logged and
+        ``content`` is returned as is: templates are then compiled by
+        the browser.
+        """
+        templates = get_templates(content)
+        handlebars_path = os.path.join(
+            self.template_dir, HANDLEBARS_PATH.replace('/', os.sep))
+        try:
+            js = precompile(templates, handlebars_path)
+        except TemplateError as exc:
+            self.log.warning('Templates will be compiled by the browser. %s',
+                             exc)
+            return content
+        self._write_file(self._get_build_path(PRECOMPILED_TEMPLATES_PATH), js)
+        return replace_templates(content, PRECOMPILED_TEMPLATES_PATH)
+
+    def _bundle_assets(self, content):
+        """Bundle the scripts of ``index.html`` (whose ``content`` is
+        given) in a single file, and give hashed names to the bundle,
+        to the loader of data files (which the Web Worker loads apart)
+        and to the other assets that the page references.
+
+        Return the content where references to assets are rewritten,
+        and a dictionary that maps the original paths of renamed
+        assets to their hashed paths. Original files are removed.
+        """
+        scripts = get_scripts(content)
+        sources = []
+        for script in scripts:
+            with io.open(self._get_build_path(script),
+                         encoding='utf-8') as fp:
+                sources.append((script, fp.read()))
+        bundle = self._write_asset(BUNDLE_PATH, bundle_scripts(sources))
+        content = replace_scripts(content, bundle)
+        urls = {}
+        for asset in get_assets(content) + [LOADER_PATH]:
+            with open(self._get_build_path(asset), 'rb') as fp:
+                urls[asset] = self._write_asset(asset, fp.read())
+        for asset in set(scripts).union(urls):
+            path = self._get_build_path(asset)
+            self._remove_file(path)
+            # e.g. 'assets/js/libs/'
+            if not os.listdir(os.path.dirname(path)):
+                os.rmdir(os.path.dirname(path))
+        return replace_assets(content, urls), urls
+
+    def _write_asset(self, asset, content):
+        """Write ``content`` in the file of the given asset (a path
+        relative to the output directory), with the hash of the
+        content in its name. Return the path (relative to the output
+        directory) of the file.
+        """
+        path = self._write_file(self._get_build_path(asset), content,
+                                hashed=True)
+        return os.path.relpath(path, self.build_dir).replace(os.sep, '/')
+
+    def _get_build_path(self, filename):
+        """Return the path in the staging directory of the given file
+        (a path relative to the output directory).
+        """
+        return os.path.join(self.build_dir, filename.replace('/', os.sep))
+
+    def _remove_file(self, path):
+        """Remove the file at ``path`` and its compressed copies."""
+        for suffix in ('', ) + COMPRESSED_SUFFIXES:
+            if os.path.exists(path + suffix):
+                os.unlink(path + suffix)
+
+    def _write_manifest(self):
+        """Write the manifest of the data files, if file names are
+        hashed. It maps the name of each file of the data directory
+        (e.g. ``sites.json``) to its hashed name (e.g.
+        ``sites.0123456789abcdef.json``). The manifest itself is not
+        hashed: it must not be cached by clients.
+        """
+        if not self.hashed_filenames:
+            return
+        manifest = {}
+        for filename in os.listdir(self.data_dir):
+            base, ext = os.path.splitext(filename)
+            if ext != '.json':
+                continue
+            base, digest = os.path.splitext(base)
+            manifest[base + ext] = filename
+        path = os.path.join(self.data_dir, MANIFEST_NAME)
+        self._write_file(path, json.dumps(manifest, sort_keys=True,
+                                          separators=JSON_SEPARATORS))
+
+    def _write_stats(self):
+        """Write the statistics of the run in ``stats_file``."""
+        tmp_path = '%s.%d.tmp' % (self.stats_file, os.getpid())
+        with open(tmp_path, 'w') as out:
+            out.write(json.dumps(self.stats.to_dict(), indent=2,
+                                 sort_keys=True))
+        os.rename(tmp_path, self.stats_file)
+
+    def _publish(self):
+        """Replace the published report by the one that has been built
+        in the staging directory.
+
+        If the output directory is a symbolic link, it is atomically
+        replaced by a link to the staging directory. Otherwise, the
+        output directory is replaced by the staging directory with two
+        renames.
+        """
+        parent = os.path.dirname(self.out_dir)
+        if os.path.islink(self.out_dir):
+            previous = os.path.join(parent, os.readlink(self.out_dir))
+            tmp_link = self.build_dir + '.link'
+            os.symlink(os.path.basename(self.build_dir), tmp_link)
+            os.rename(tmp_link, self.out_dir)
+            if os.path.basename(previous).startswith(self._staging_prefix):
+                shutil.rmtree(previous)
+        elif os.path.exists(self.out_dir):
+            previous = self.build_dir + '.old'
+            os.rename(self.out_dir, previous)
+            os.rename(self.build_dir, self.out_dir)
+            shutil.rmtree(previous)
+        else:
+            os.rename(self.build_dir, self.out_dir)
+
+    def _remove_stale_dirs(self):
+        """Remove staging directories that may have been left by
+        previous runs that were interrupted. Staging directories of
+        runs that are still in progress (e.g. when runs overlap) are
+        kept, see ``_is_stale()``.
+        """
+        parent = os.path.dirname(self.out_dir)
+        published = None
+        if os.path.islink(self.out_dir):
+            published = os.path.basename(os.readlink(self.out_dir))
+        for filename in os.listdir(parent):
+            if filename.startswith(self._staging_prefix) and \
+                    filename != published and self._is_stale(filename):
+                path = os.path.join(parent, filename)
+                if os.path.isdir(path) and not os.path.islink(path):
+                    shutil.rmtree(path)
+                else:
+                    os.unlink(path)
+
+    def _is_stale(self, filename):
+        """Return whether the staging directory (or a temporary file
+        derived from it) with the given name has been left by a run
+        that is not in progress anymore: the process that created it
+        (see ``__init__()``) is not running, or the directory is older
+        than ``STALE_STAGING_AGE``.
+        """
+        parts = filename[len(self._staging_prefix):].split('.')
+        try:
+            started, pid = int(parts[0]), int(parts[1])
+        except (IndexError, ValueError):
+            return True  # not a name that we use
+        if time() - started > STALE_STAGING_AGE:
+            return True
+        return not is_process_alive(pid)
+
+
+# The reporter used by worker processes. It is set by '_init_worker()'
+# when each worker process starts.
+_worker_reporter = None
+
+
+def _init_worker(reporter):
+    global _worker_reporter
+    _worker_reporter = reporter
+
+
+def _process_site_in_worker(site):
+    site_id, url = site
+    return _worker_reporter._process_site_safely(site_id, url)
+
+
+# Registered reports, as a list of '(name, builder, sections)' tuples.
+# See 'register_report()'.
+REPORTS = []
+
+
+def register_report(name, *sections):
+    """Register the decorated function as the builder of the ``name``
+    report. The function is called with the data returned by the
+    parser, a ``YearPartials`` instance (or ``None``) and the options
+    of the reports (see ``create_report()``, may be ``None``), and
+    must return the report. ``sections`` are the names of the sections of
+    the data that it needs.
+    """
+    def decorator(builder):
+        REPORTS.append((name, builder, sections))
+        return builder
+    return decorator
+
+
+def get_required_sections():
+    """Return the names of the sections that are needed by the
+    registered reports.
+    """
+    required = set()
+    for name, builder, sections in REPORTS:
+        required.update(sections)
+    return required
+
+
+# In Python 3, 'unquote_plus()' must be called with a 'str', which
+# is the case. In Python 2, if the quoted keyword is a 'unicode'
+# object, unquoting it does not yield back the original keyword.
+#
+# In Python 2:
+#    >>> encoded = '\xc3\xa9'
+#    >>> decoded = unicode(encoded, 'utf-8')
+#    >>> decoded
+#    u'\xe9'
+#    >>> quote_plus(encoded)
+#    '%C3%A9'
+# Now the following is fine:
+#    >>> unquote_plus('%C3%A9')
+#    '\x3\xa9'
+# But we cannot do that. Since 'unquote_plus()' requires a 'str'
+# in Python 3, we pass is a 'unicode' object in Python 2, and
+# unquoting the 'unicode' object does not return the decoded
+# string:
+#    >>> unquote_plus(unicode('%C3%A9'))
+#    u'\xc3\xa9'
+#
+# This is why, in Python 2, we first encode the 'unicode' object,
+# then unquote it, and finally decode it back to have a 'unicode'
+# object.
+if PY3:  # pragma: no cover
+    _unquote_plus = unquote_plus
+else:
+    _unquote_plus = lambda uni: unquote_plus(
+        uni.encode('utf-8')).decode('utf-8')
+
+# The same keywords and phrases come up month after month, hence
+# unquoted values are cached.
+_unquote_cache = Memoized(_unquote_plus, UNQUOTE_CACHE_SIZE)
+
 
+def _unquote(value):
+    """Unquote a search keyword or phrase."""
+    if '%' not in value and '+' not in value:
+        return value
+    return _unquote_cache(value)
 
-def create_report(data, url):
+
+class YearPartials(object):
+    """The aggregates of each year of a report of a site, as stored
+    in an ``AggregateCache``.
+
+    ``fingerprints`` maps each month to the fingerprint of its AWStats
+    file (see ``Parser.fingerprints``). Aggregates of a year are valid
+    as long as the fingerprints of its months and the ``options`` of
+    the reports are unchanged.
+    """
+
+    def __init__(self, cache, site_id, report, fingerprints, options=None):
+        self.cache = cache
+        self.site_id = site_id
+        self.report = report
+        self.fingerprints = fingerprints
+        self.options = options or {}
+
+    def _get_fingerprint(self, year):
+        months = ' '.join('%s=%s' % (yyyymm, fingerprint)
+                          for yyyymm, fingerprint in sorted(
+                              self.fingerprints.items())
+                          if yyyymm.startswith(year))
+        return '%s heavy_hitters=%s' % (
+            months, self.options.get('heavy_hitters', None))
+
+    def get(self, year):
+        """Return the aggregates of the given year, or ``None`` if they
+        have not been cached or if the data of the year has changed.
+        """
+        return self.cache.get(self.site_id, self.report, year,
+                              self._get_fingerprint(year))
+
+    def set(self, year, aggregates):
+        self.cache.set(self.site_id, self.report, year,
+                       self._get_fingerprint(year), aggregates)
+
+
+def create_report(data, url, stats=None, site_id=None,
+                  aggregate_cache=None, fingerprints=None, options=None):
+    """Return the report of a site from its parsed ``data``.
+
+    If given, ``stats`` is a ``RunStats`` instance where the time
+    spent in each builder is recorded (as the ``report:<name>`` phase
+    of ``site_id``), along with the number of hits and misses of the
+    cache of unquoted keywords and phrases, if it has been used.
+
+    If given, ``aggregate_cache`` is an ``AggregateCache`` where the
+    aggregates of each year are stored, so that they are not computed
+    again as long as the ``fingerprints`` of the AWStats files of the
+    year (see ``Parser.fingerprints``) are unchanged.
+
+    ``options`` is a dictionary of options of the reports, passed on
+    to each builder:
+
+    ``referrers_top``
+        The number of entries of each period of the referrers report.
+        All referrers are kept if it is ``None`` or missing.
+
+    ``heavy_hitters``
+        The maximum number of entries of the aggregates of each year
+        and of all time. If it is ``None`` or missing, aggregates are
+        exact. See ``_create_report_helper()``.
+    """
+    if stats is None:
+        stats = RunStats()
     report = {'url': url}
-    report['overview'] = _create_report_overview(data)
-    report['top10'] = _create_report_top10(data)
-    report['downloads'] = _create_report_downloads(data)
-    report['referrers'] = _create_report_referrers(data)
-    report['keywords'] = _create_report_keywords(data)
-    report['phrases'] = _create_report_phrases(data)
-    # FIXME: for each report, calculate all-time total
+    for name, builder, sections in REPORTS:
+        partials = None
+        if aggregate_cache is not None:
+            partials = YearPartials(aggregate_cache, site_id, name,
+                                    fingerprints, options)
+        hits, misses = _unquote_cache.hits, _unquote_cache.misses
+        with stats.measure(site_id, 'report:%s' % name):
+            report[name] = builder(data, partials, options)
+            if (hits, misses) != (_unquote_cache.hits, _unquote_cache.misses):
+                stats.add('unquote_hits', _unquote_cache.hits - hits)
+                stats.add('unquote_misses', _unquote_cache.misses - misses)
     report['periods'] = get_periods(report['overview'].keys())
     return report
 
 
-def _create_report_overview(data):
-    """Number of hits, pages, visits, visitors and bandwith."""
-    empty_stats = {'hits': 0,
-                   'pages': 0,
-                   'bandwidth': 0,
-                   'visits': 0}
+@register_report('overview', 'DAY', 'GENERAL')
+def _create_report_overview(data, partials=None, options=None):
+    """Number of hits, pages, visits, visitors and bandwith.
+
+    Data is stored in columns. For each month, the report has an array
+    of ``hits``, ``pages``, ``bandwidth`` and ``visits`` with a value
+    for each day of the month (the value of the first day at index 0).
+    For each year, it has the same arrays (plus ``visitors``) with a
+    value for each month, from January to the last month that has
+    data. Missing days and months have a value of 0. The ``all-time``
+    entry has the same arrays with a value for each year, and a
+    ``years`` array that lists these years.
+    """
+    keys = ('hits', 'pages', 'bandwidth', 'visits')
+    columns = [(key, get_column_index('DAY', key)) for key in keys]
     report = {}
-    all_time = empty_stats.copy()
-    for yyyymm, d in data['DAY'].items():
+    for yyyymm, rows in data['DAY'].items():
+        n_days = get_number_of_days(yyyymm)
+        month = {key: [0] * n_days for key in keys}
+        for row in rows:
+            day = int(row[0][6:]) - 1
+            if row[0][:6] != yyyymm or not 0 <= day < n_days:
+                continue
+            for key, index in columns:
+                month[key][day] = row[index]
+        report[yyyymm] = month
+        # Years are the sums of months.
         yyyy = yyyymm[:4]
         year = report.get(yyyy, None)
         if year is None:
-            year = report[yyyy] = empty_stats.copy()
-        month = empty_stats.copy()
-        for day in range(1, 1 + get_number_of_days(yyyymm)):
-            yyyymmdd = '%s%02d' % (yyyymm, day)
-            info = d.get(yyyymmdd, {})
-            day_data = {'visitors': 0}  # not reported by AWStats
-            for key in ('hits', 'pages', 'bandwidth', 'visits'):
-                day_data[key] = int(info.get(key, 0))
-                month[key] += day_data[key]
-                year[key] += day_data[key]
-                all_time[key] += day_data[key]
-            report[yyyymmdd] = day_data
-        month['visitors'] = data['GENERAL'][yyyymm]['TotalUnique'][0]
-        report[yyyymm] = month
-    report['all-time'] = all_time  # FIXME: not used (yet)
+            year = report[yyyy] = {key: [] for key in keys + ('visitors', )}
+        index = int(yyyymm[4:]) - 1
+        for key, values in year.items():
+            if len(values) <= index:
+                values.extend([0] * (1 + index - len(values)))
+        for key in keys:
+            year[key][index] = sum(month[key])
+        # AWStats stores the number of visitors as a string.
+        year['visitors'][index] = int(
+            data['GENERAL'][yyyymm]['TotalUnique'][0])
+    # The visitors of a year are the sum of the unique visitors of each
+    # month: visitors who came in several months are counted several
+    # times.
+    years = sorted(key for key in report if len(key) == 4)
+    all_time = {'years': years}
+    for key in keys + ('visitors', ):
+        all_time[key] = [sum(report[yyyy][key]) for yyyy in years]
+    report['all-time'] = all_time
     return report
 
 
-def _create_report_top10(data):
-    keys = {'url': None, 'pages': int, 'bandwidth': int}
+@register_report('top10', 'SIDER')
+def _create_report_top10(data, partials=None, options=None):
+    keys = {'url': None, 'pages': None, 'bandwidth': None}
     discr = 'url'
     aggregate_keys = ('pages', 'bandwidth')
     return _create_report_helper(
-        data, 'SIDER', keys, discr, aggregate_keys, 'pages', top=10)
+        data, 'SIDER', keys, discr, aggregate_keys, 'pages', top=10,
+        partials=partials, options=options)
 
 
-def _create_report_downloads(data):
-    keys = {'url': None, 'hits': int, 'bandwidth': int}
+@register_report('downloads', 'DOWNLOADS')
+def _create_report_downloads(data, partials=None, options=None):
+    keys = {'url': None, 'hits': None, 'bandwidth': None}
     discr = 'url'
     aggregate_keys = ('hits', 'bandwidth')
     return _create_report_helper(
-        data, 'DOWNLOADS', keys, discr, aggregate_keys, 'hits', top=10)
+        data, 'DOWNLOADS', keys, discr, aggregate_keys, 'hits', top=10,
+        partials=partials, options=options)
 
 
-def _create_report_referrers(data):
-    keys = {'url': None, 'pages': int, 'hits': int}
+@register_report('referrers', 'PAGEREFS')
+def _create_report_referrers(data, partials=None, options=None):
+    keys = {'url': None, 'pages': None, 'hits': None}
     discr = 'url'
     aggregate_keys = ('pages', 'hits')
+    top = (options or {}).get('referrers_top', None)
     return _create_report_helper(
-        data, 'PAGEREFS', keys, discr, aggregate_keys, 'pages')
-
-
-def _create_report_keywords(data):
-    # In Python 3, 'unquote_plus()' must be called with a 'str', which
-    # is the case. In Python 2, if the quoted keyword is a 'unicode'
-    # object, unquoting it does not yield back the original keyword.
-    #
-    # In Python 2:
-    #    >>> encoded = '\xc3\xa9'
-    #    >>> decoded = unicode(encoded, 'utf-8')
-    #    >>> decoded
-    #    u'\xe9'
-    #    >>> quote_plus(encoded)
-    #    '%C3%A9'
-    # Now the following is fine:
-    #    >>> unquote_plus('%C3%A9')
-    #    '\x3\xa9'
-    # But we cannot do that. Since 'unquote_plus()' requires a 'str'
-    # in Python 3, we pass is a 'unicode' object in Python 2, and
-    # unquoting the 'unicode' object does not return the decoded
-    # string:
-    #    >>> unquote_plus(unicode('%C3%A9'))
-    #    u'\xc3\xa9'
-    #
-    # This is why, in Python 2, we first encode the 'unicode' object,
-    # then unquote it, and finally decode it back to have a 'unicode'
-    # object.
-    if PY3:  # pragma: no cover
-        converter = unquote_plus
-    else:
-        converter = lambda uni: unquote_plus(
-            uni.encode('utf-8')).decode('utf-8')
-    keys = {'keyword': converter, 'searches': int}
+        data, 'PAGEREFS', keys, discr, aggregate_keys, 'pages', top=top,
+        partials=partials, options=options)
+
+
+@register_report('keywords', 'KEYWORDS')
+def _create_report_keywords(data, partials=None, options=None):
+    keys = {'keyword': _unquote, 'searches': None}
     discr = 'keyword'
     aggregate_keys = ('searches', )
     return _create_report_helper(
-        data, 'KEYWORDS', keys, discr, aggregate_keys, 'searches', top=30)
+        data, 'KEYWORDS', keys, discr, aggregate_keys, 'searches', top=30,
+        partials=partials, options=options)
 
 
-def _create_report_phrases(data):
-    # See comments in '_create_report_keywords()' for details about
-    # the block below.
-    if PY3:  # pragma: no cover
-        converter = unquote_plus
-    else:
-        converter = lambda uni: unquote_plus(
-            uni.encode('utf-8')).decode('utf-8')
-    keys = {'phrase': converter, 'searches': int}
+@register_report('phrases', 'SEARCHWORDS')
+def _create_report_phrases(data, partials=None, options=None):
+    keys = {'phrase': _unquote, 'searches': None}
     discr = 'phrase'
     aggregate_keys = ('searches', )
     return _create_report_helper(
-        data, 'SEARCHWORDS', keys, discr, aggregate_keys, 'searches', top=30)
+        data, 'SEARCHWORDS', keys, discr, aggregate_keys, 'searches', top=30,
+        partials=partials, options=options)
 
 
 def _create_report_helper(data, section_key, keys, discr, aggregate_keys,
-                          sort_on, top=None):
+                          sort_on, top=None, partials=None, options=None):
     """An helper for several '_create_report_*()' functions (**not**
     including '_create_report_overview()', though).
 
@@ -238,11 +851,11 @@ def _create_report_helper(data, section_key, keys, discr, aggregate_keys,
 
     ``keys``
         Must be a dictionary. The keys of this dictionary will be
-        looked up in ``data`` (see ``awstatic.parser.SECTIONS`` for a
-        list of available keys). The values are a callable that will
-        convert the value (e.g. ``int()`` or
+        looked up in the rows of ``data`` (see
+        ``awstatic.parser.SECTIONS`` for a list of available keys).
+        The values are a callable that will convert the value (e.g.
         ``urllib.unquote_plus()``), or ``None`` if no conversion is
-        needed.
+        needed (numbers have already been converted by the parser).
 
     ``discr``
         The discriminant to look for in ``data``. It should be one of
@@ -260,6 +873,26 @@ def _create_report_helper(data, section_key, keys, discr, aggregate_keys,
         The maximum number of entries to keep, or ``None`` if all
         entries must be kept.
 
+    ``partials``
+        A ``YearPartials`` instance, or ``None``. If given, the
+        aggregates of the years whose data has not changed are read
+        from there instead of being computed again.
+
+    ``options``
+        The options of the reports (see ``create_report()``), or
+        ``None``. If the ``heavy_hitters`` option is set, aggregates
+        of each year and of all time are approximate and hold at most
+        this number of entries (see ``awstatic.topk.SpaceSaving``).
+        The aggregates of all time are merged from those of each year
+        (see ``awstatic.topk.merge()``). Each item of years and of
+        all time then has an ``error`` key: its ``sort_on`` value may
+        be overestimated by at most this error. Other values may be
+        overestimated by an amount that is not tracked.
+
+    Besides an entry for each month and each year, the report has an
+    ``all-time`` entry, which is computed from the aggregates of each
+    year.
+
     I reckon it is a bit painful to read...
     """
     report = {}
@@ -269,53 +902,124 @@ def _create_report_helper(data, section_key, keys, discr, aggregate_keys,
     #     {'2012': {'url1': {'pages': 10, 'bandwidth': 200},
     #               'url2': {'pages': 20, 'bandwidth': 300}}
     empty_aggregate_dict = lambda: {key: 0 for key in aggregate_keys}
-    years = defaultdict(
-        lambda: defaultdict(empty_aggregate_dict))
-    # We are going to iterate over each key of the report, i.e. over
-    # each month.
-    for yyyymm, d in data[section_key].items():
+    capacity = (options or {}).get('heavy_hitters', None)
+    if capacity:
+        new_aggregates = lambda: SpaceSaving(capacity, aggregate_keys,
+                                             sort_on)
+    else:
+        new_aggregates = lambda: defaultdict(empty_aggregate_dict)
+    years = {}
+    # Years whose aggregates have been computed (i.e. that were not
+    # found in 'partials').
+    computed_years = set()
+    columns = [(key, get_column_index(section_key, key), converter)
+               for key, converter in keys.items()]
+    discr_index = get_column_index(section_key, discr)
+    discr_converter = keys[discr]
+    # Aggregated and sorted values are numbers, which are never
+    # converted.
+    aggregate_columns = [(key, get_column_index(section_key, key))
+                         for key in aggregate_keys]
+    sort_index = get_column_index(section_key, sort_on)
+
+    def make_item(row):
         # Build a dictionary with the keys listed in ``keys`` and
-        # convert values. This is where we convert strings to
-        # integers.
+        # convert values if needed.
+        item = {}
+        for key, index, converter in columns:
+            value = row[index]
+            if converter is not None:
+                value = converter(value)
+            item[key] = value
+        return item
+
+    def make_items(aggregates):
+        # Build the items of a year (or of all time). We select the
+        # top entries before building the items, since there may be
+        # a lot of them.
         items = []
-        for item in d.values():
-            converted_item = {}
-            for key, converter in keys.items():
-                value = item[key]
-                if converter is not None:
-                    value = converter(value)
-                converted_item[key] = value
-            items.append(converted_item)
-        report[yyyymm] = items
-        # Aggregate data for this year.
+        for discr_value, d in _select_top(
+                aggregates.items(), lambda entry: entry[1][sort_on], top):
+            item = {discr: discr_value}
+            item.update(d)
+            items.append(item)
+        return items
+
+    # We are going to iterate over each key of the report, i.e. over
+    # each month. Each row is aggregated in its year in a single pass,
+    # then the top rows of the month are selected and only these are
+    # converted to items.
+    for yyyymm, rows in data[section_key].items():
         yyyy = yyyymm[:4]
-        for item in items:
-            for key in aggregate_keys:
-                years[yyyy][item[discr]][key] += item[key]
-    # Sort data for each month.
-    for month, items in report.items():
-        items = sorted(items, key=lambda i: i[sort_on], reverse=True)
-        if top:
-            items = items[:top]
-        report[month] = items
+        year = years.get(yyyy, None)
+        if year is None:
+            if partials is not None:
+                year = partials.get(yyyy)
+            if year is None:
+                year = new_aggregates()
+                computed_years.add(yyyy)
+            years[yyyy] = year
+        if yyyy in computed_years and capacity:
+            for row in rows:
+                value = row[discr_index]
+                if discr_converter is not None:
+                    value = discr_converter(value)
+                year.add(value, [row[index]
+                                 for key, index in aggregate_columns])
+        elif yyyy in computed_years:
+            for row in rows:
+                value = row[discr_index]
+                if discr_converter is not None:
+                    value = discr_converter(value)
+                aggregate = year[value]
+                for key, index in aggregate_columns:
+                    aggregate[key] += row[index]
+        report[yyyymm] = [
+            make_item(row)
+            for row in _select_top(rows, lambda row: row[sort_index], top)]
     # Sort data for each year. The key is the year, the value is a
     # dictionary, where the key is the discriminant value (for example
     # the URL in the top 10 pages report, of the keyword for the
     # keywords report) and the value is a dictionary that contains the
-    # data (and has ``keys`` as keys).
+    # data (and has ``keys`` as keys). All-time data is the sum of the
+    # data of each year.
+    all_time = defaultdict(empty_aggregate_dict)
     for year, dicts in years.items():
-        items = []
+        if year in computed_years:
+            if capacity:
+                dicts = years[year] = dicts.to_dict()
+            else:
+                dicts = years[year] = dict(dicts)
+            if partials is not None:
+                partials.set(year, dicts)
+        report[year] = make_items(dicts)
+        if capacity:
+            continue
         for discr_value, d in dicts.items():
-            item = {discr: discr_value}
-            item.update(d)
-            items.append(item)
-        items = sorted(items, key=lambda i: i[sort_on], reverse=True)
-        if top:
-            items = items[:top]
-        report[year] = items
+            aggregate = all_time[discr_value]
+            for key in aggregate_keys:
+                aggregate[key] += d[key]
+    if capacity:
+        # Summaries of years cannot be summed like exact aggregates:
+        # an entry that is missing from a year may have been evicted.
+        all_time = merge(years.values(), capacity, aggregate_keys, sort_on)
+    report['all-time'] = make_items(all_time)
     return report
 
 
+def _select_top(items, key, top=None):
+    """Return the ``top`` greatest items of ``items`` (or all of them
+    if ``top`` is ``None``), sorted in descending order of ``key``.
+
+    Items that compare equal keep their original order, so that this
+    is equivalent to ``sorted(items, key=key, reverse=True)[:top]``,
+    only faster when there are many more items than ``top``.
+    """
+    if top:
+        return heapq.nlargest(top, items, key=key)
+    return sorted(items, key=key, reverse=True)
+
+
 def get_periods(keys):
     """Return periods of time to display (sorted with the most recent
     first).
@@ -323,10 +1027,11 @@ def get_periods(keys):
     ``keys`` must be a sequence of strings that should be formatted as
     'YYYYMM'. Keys that have less or more than 6 characters are
     ignored. This function returns all given months plus all years
-    that have at least two months listed.
+    that have at least two months listed, and ``all-time`` (last) if
+    there is at least one month.
 
     >>> get_periods(['201201', '201202', '201112'])
-    ['201202', '201201', '2012', '201112']
+    ['201202', '201201', '2012', '201112', 'all-time']
     """
     periods = []
     years = defaultdict(lambda: 0)
@@ -339,4 +1044,6 @@ def get_periods(keys):
         periods.append(''.join((yyyy, mm)))
     periods.extend(filter(lambda y: years[y] > 1, years.keys()))
     periods.sort(reverse=1)
+    if periods:
+        periods.append('all-time')
     return periods
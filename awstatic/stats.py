@@ -0,0 +1,140 @@
+"""Timing and memory statistics of the phases of a run."""
+
+from contextlib import contextmanager
+import os
+import sys
+from timeit import default_timer
+
+from awstatic.compat import resource
+
+
+def get_cpu_time():
+    """Return the CPU time (user and system) used by this process and
+    its terminated children (e.g. the processes of a pool), in
+    seconds.
+    """
+    return sum(os.times()[:4])
+
+
+def get_max_rss():
+    """Return the maximum resident set size of this process, in bytes,
+    or ``None`` if it is not available on this platform.
+    """
+    if resource is None:  # pragma: no cover
+        return None
+    max_rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform != 'darwin':  # pragma: no cover
+        max_rss *= 1024  # kilobytes
+    return max_rss
+
+
+class RunStats(object):
+    """Statistics of the phases of a run.
+
+    Each phase is recorded as a dictionary with the following keys:
+
+    ``site``
+        The identifier of the site, or ``None`` for phases that do
+        not relate to a particular site.
+
+    ``phase``
+        The name of the phase (e.g. ``parse``).
+
+    ``wall`` and ``cpu``
+        The wall-clock and CPU time spent in the phase, in seconds.
+
+    ``bytes_read`` and ``bytes_written``
+        The number of bytes read from AWStats files and written in
+        the report.
+
+    ``max_rss``
+        The maximum memory used by the process (resident set size, in
+        bytes) at the end of the phase. It is ``None`` if it is not
+        available on this platform.
+    """
+
+    def __init__(self):
+        self.records = []
+        self._open = []
+
+    @contextmanager
+    def measure(self, site, phase):
+        """Record the statistics of the code that runs in this
+        context.
+        """
+        record = {'site': site, 'phase': phase,
+                  'bytes_read': 0, 'bytes_written': 0}
+        self._open.append(record)
+        cpu = get_cpu_time()
+        start = default_timer()
+        try:
+            yield record
+        finally:
+            record['wall'] = default_timer() - start
+            record['cpu'] = get_cpu_time() - cpu
+            record['max_rss'] = get_max_rss()
+            self._open.remove(record)
+            self.records.append(record)
+
+    def add(self, counter, value):
+        """Add ``value`` to the given counter of the phases that are
+        being measured. Counters other than those listed above start
+        at 0.
+        """
+        for record in self._open:
+            record[counter] = record.get(counter, 0) + value
+
+    def extend(self, records):
+        """Add records that have been collected by another instance
+        (e.g. in a worker process).
+        """
+        self.records.extend(records)
+
+    def get_totals(self):
+        """Return the totals of all phases, as a dictionary. Times are
+        summed up: if sites have been processed in parallel, they may
+        exceed the actual duration of the run.
+        """
+        totals = {'wall': 0, 'cpu': 0, 'bytes_read': 0, 'bytes_written': 0,
+                  'max_rss': None}
+        for record in self.records:
+            for counter in ('wall', 'cpu', 'bytes_read', 'bytes_written'):
+                totals[counter] += record[counter]
+            if record['max_rss'] is not None:
+                totals['max_rss'] = max(totals['max_rss'] or 0,
+                                        record['max_rss'])
+        return totals
+
+    def to_dict(self):
+        """Return all statistics as a dictionary that can be encoded
+        as JSON.
+        """
+        return {'phases': self.records, 'totals': self.get_totals()}
+
+    def format_summary(self):
+        """Return a human-readable summary of all phases, as a list of
+        lines.
+        """
+        lines = ['%-24s %-18s %9s %9s %10s %10s %10s' % (
+            'site', 'phase', 'wall', 'cpu', 'read', 'written', 'max rss')]
+        totals = dict(self.get_totals(), site='', phase='total')
+        for record in self.records + [totals]:
+            lines.append('%-24s %-18s %8.3fs %8.3fs %10s %10s %10s' % (
+                record['site'] or '-', record['phase'],
+                record['wall'], record['cpu'],
+                format_size(record['bytes_read']),
+                format_size(record['bytes_written']),
+                format_size(record['max_rss'])))
+        return lines
+
+
+def format_size(size):
+    """Return the given number of bytes as a human-readable string."""
+    if size is None:
+        return '-'
+    if size < 1024:
+        return '%dB' % size
+    for unit in ('KB', 'MB', 'GB'):
+        size /= 1024.0
+        if size < 1024 or unit == 'GB':
+            return '%.1f%s' % (size, unit)
@@ -0,0 +1,81 @@
+// Loading of data files. This script runs in a Web Worker (see
+// 'start_worker()' in 'ui.js'), so that big files are downloaded,
+// parsed and prepared without freezing the page. It is also included
+// in the page, where 'prepare()' is used if workers are not
+// available.
+var awstatic_loader = (function(self, undefined) {
+
+"use strict";
+
+// Convert the columns of the overview report (an array per metric
+// and per period, see '_create_report_overview()' in 'reporter.py')
+// to typed arrays. They use less memory than arrays of numbers and
+// can be transferred from the worker to the page without being
+// copied. The list of years of the 'all-time' period is kept as is.
+// Return the list of their buffers.
+function prepare(data) {
+    var buffers = [];
+    var overview = data['overview'];
+    if (overview === undefined) {
+        return buffers;
+    }
+    for (var period in overview) {
+        if (!overview.hasOwnProperty(period)) {
+            continue;
+        }
+        var columns = overview[period];
+        for (var key in columns) {
+            if (columns.hasOwnProperty(key) && key !== 'years') {
+                columns[key] = new Float64Array(columns[key]);
+                buffers.push(columns[key].buffer);
+            }
+        }
+    }
+    return buffers;
+}
+
+// Handle a request from the page: load the JSON file at 'url' (which
+// must be absolute, since relative URLs would be resolved against the
+// URL of this script) and post back the prepared data and the size of
+// the file (in characters), or an error.
+function on_message(event) {
+    var id = event.data['id'];
+    var post_error = function(error) {
+        self.postMessage({'id': id, 'error': error});
+    };
+    var xhr = new XMLHttpRequest();
+    xhr.open('GET', event.data['url']);
+    xhr.onload = function() {
+        // The status is 0 when files are loaded from the filesystem.
+        if (xhr.status !== 200 && xhr.status !== 0) {
+            post_error(xhr.statusText);
+            return;
+        }
+        var data;
+        try {
+            data = JSON.parse(xhr.responseText);
+        } catch (e) {
+            post_error(e.message);
+            return;
+        }
+        var buffers = prepare(data);
+        self.postMessage({'id': id, 'data': data,
+                          'size': xhr.responseText.length}, buffers);
+    };
+    xhr.onerror = function() {
+        post_error('network error');
+    };
+    xhr.send();
+}
+
+if (self.document === undefined && typeof self.importScripts === 'function') {
+    self.onmessage = on_message;
+}
+
+// public symbols of the module
+return {
+    prepare: prepare
+};
+
+// end of module
+})(this);
@@ -5,17 +5,153 @@ var awstatic = (function(window, $, undefined) {
 /* ******************************************************************
 ** Utilities
 ** *********/
-// Synchronous version of '$.getJSON()'.
-function get_json(url) {
-    return $.parseJSON(
-        $.ajax({
-            url: url,
-            async: false,
-            dataType: 'json',
-            error: function (jqXHR, textStatus, errorThrown) {
-                window.alert('Could not load "' + url + '": ' + errorThrown);
+// Files are loaded (and parsed) in a Web Worker that runs this
+// script, see 'loader.js'. If workers are not available (or the
+// worker cannot be started, e.g. when the page is opened from the
+// filesystem in some browsers), files are loaded in the main thread.
+var LOADER_URL = 'assets/js/loader.js';
+var worker = undefined; // set by 'start_worker()'
+var worker_requests = {};
+var worker_request_id = 0;
+
+function start_worker(url) {
+    if (window.Worker === undefined) {
+        return;
+    }
+    try {
+        worker = new window.Worker(url);
+    } catch (e) {
+        worker = undefined;
+        return;
+    }
+    worker.onmessage = function(event) {
+        var response = event.data;
+        var request = worker_requests[response['id']];
+        delete worker_requests[response['id']];
+        if (response.hasOwnProperty('error')) {
+            request.error(response['error']);
+        } else {
+            request.success(response['data'], response['size']);
+        }
+    };
+    worker.onerror = function(event) {
+        // Errors of requests are handled by the worker: this one is
+        // fatal. Load pending and future files in the main thread.
+        if (event.preventDefault) {
+            event.preventDefault();
+        }
+        worker.terminate();
+        worker = undefined;
+        var requests = worker_requests;
+        worker_requests = {};
+        for (var id in requests) {
+            if (requests.hasOwnProperty(id)) {
+                load_json_in_main_thread(requests[id].url,
+                                         requests[id].success,
+                                         requests[id].error);
             }
-        }).responseText);
+        }
+    };
+}
+
+// Return the absolute URL of the given URL (relative to the page).
+function get_absolute_url(url) {
+    var link = window.document.createElement('a');
+    link.href = url;
+    return link.href;
+}
+
+function load_json_in_main_thread(url, success, error) {
+    $.ajax({
+        url: url,
+        dataType: 'text',
+        success: function(text) {
+            var data = $.parseJSON(text);
+            awstatic_loader.prepare(data);
+            success(data, text.length);
+        },
+        error: function (jqXHR, textStatus, errorThrown) {
+            error(errorThrown);
+        }
+    });
+}
+
+// Load the JSON file at 'url' asynchronously. 'success' is called
+// with the parsed data (see 'prepare()' in 'loader.js') and the size
+// of the file (in characters). 'error' is called with the error, if
+// any, or an alert is shown if it is not given.
+function load_json(url, success, error) {
+    if (error === undefined) {
+        error = function(error) {
+            window.alert('Could not load "' + url + '": ' + error);
+        };
+    }
+    if (worker === undefined) {
+        load_json_in_main_thread(url, success, error);
+        return;
+    }
+    var id = worker_request_id++;
+    worker_requests[id] = {'url': url, 'success': success, 'error': error};
+    worker.postMessage({'id': id, 'url': get_absolute_url(url)});
+}
+
+// A cache that holds at most 'max_count' values, whose total size is
+// at most 'max_size' (the size of each value is given by the caller).
+// When the cache is full, the least recently used values are evicted.
+// The most recently used value is always kept, even if it is bigger
+// than 'max_size'.
+function LRUCache(max_count, max_size) {
+    this.max_count = max_count;
+    this.max_size = max_size;
+    this.size = 0;
+    this._keys = []; // least recently used first
+    this._entries = {};
+}
+
+// Return the value of the given key, or undefined if it is not in
+// the cache.
+LRUCache.prototype.get = function(key) {
+    if (!this._entries.hasOwnProperty(key)) {
+        return undefined;
+    }
+    this._keys.splice($.inArray(key, this._keys), 1);
+    this._keys.push(key);
+    return this._entries[key].value;
+};
+
+LRUCache.prototype.set = function(key, value, size) {
+    this.remove(key);
+    this._entries[key] = {'value': value, 'size': size};
+    this._keys.push(key);
+    this.size += size;
+    while (this._keys.length > this.max_count ||
+           (this.size > this.max_size && this._keys.length > 1)) {
+        this.remove(this._keys[0]);
+    }
+};
+
+LRUCache.prototype.remove = function(key) {
+    if (!this._entries.hasOwnProperty(key)) {
+        return;
+    }
+    this.size -= this._entries[key].size;
+    delete this._entries[key];
+    this._keys.splice($.inArray(key, this._keys), 1);
+};
+
+LRUCache.prototype.keys = function() {
+    return this._keys.slice();
+};
+
+// Return the URL of the given file of the data directory. If file
+// names are hashed (see the 'hashed_filenames' option), the actual
+// name is looked up in the manifest loaded by 'init_ui()'.
+var manifest = undefined;
+function data_url(name) {
+    if (manifest !== undefined && manifest.hasOwnProperty(name)) {
+        name = manifest[name];
+    }
+    return 'data/' + name;
 }
 
 // Parse the given query string and return an associative array with
@@ -50,10 +186,14 @@ function to_querystring(hash) {
 }
 
 // Given a date formatted as 'YYYYMM' or 'YYYY', return a proper label
-// such as 'month YYYY' or 'YYYY' (respectively).
+// such as 'month YYYY' or 'YYYY' (respectively). The 'all-time' period
+// is labelled 'All time'.
 var MONTHS = ['January', 'February', 'March', 'April', 'May', 'June',
     'July', 'August', 'September', 'October', 'November', 'December'];
 function get_period_label(date) {
+    if (date === 'all-time') {
+        return 'All time';
+    }
     if (date.length === 4) {
         return date;
     }
@@ -74,6 +214,29 @@ function get_sorted_properties(obj) {
     return items.sort();
 }
 
+// Given an object that holds columns (arrays of the same length,
+// such as the data of a period in the overview report), return an
+// array of '[index, row]' pairs, where 'row' maps each of the given
+// keys to its value at this index. Missing columns have a value of 0.
+function get_rows(columns, keys) {
+    var length = 0;
+    for (var i = 0; i < keys.length; i++) {
+        if (columns.hasOwnProperty(keys[i])) {
+            length = Math.max(length, columns[keys[i]].length);
+        }
+    }
+    var rows = [];
+    for (var x = 0; x < length; x++) {
+        var row = {};
+        for (var i = 0; i < keys.length; i++) {
+            var column = columns[keys[i]];
+            row[keys[i]] = (column === undefined) ? 0 : column[x] || 0;
+        }
+        rows.push([x, row]);
+    }
+    return rows;
+}
+
 // Return whether the given year is a leap year.
 function is_leap_year(year) {
     if (year % 4 !== 0) {
@@ -138,23 +301,51 @@ function format_bandwidth(bandwidth) {
 ** The 'UI' class loads reports, generates diagrams and responds to
 ** user commands.
 ** *************************/
-function UI(site, period, page) {
+// The data of the most recently viewed sites is kept in memory, so
+// that switching back to them is instant. The size is the number of
+// characters of the JSON files (parsed data uses a few times more
+// memory).
+var SITE_CACHE_MAX_COUNT = 10;
+var SITE_CACHE_MAX_SIZE = 32 * 1024 * 1024;
+// Delay (in milliseconds) before the next site of the list is
+// prefetched, so that the data of the displayed site is loaded
+// first.
+var PREFETCH_DELAY = 1000;
+
+// 'sites' is the list of all sites, in the order of the menu.
+function UI(site, period, page, sites) {
+    this.sites = sites || [];
+    this._site_cache = new LRUCache(SITE_CACHE_MAX_COUNT,
+                                    SITE_CACHE_MAX_SIZE);
+    // Callbacks waiting for the data of each site being loaded.
+    this._pending = {};
     this.init_templates();
     this.select_site(site, period);
     this.show_page(page || 'overview');
 }
 
-// Return the mode which we are in: 'month' or 'year'.
+// Return the mode which we are in: 'month', 'year' or 'all-time'.
 UI.prototype.get_period_mode = function() {
+    if (this.period === 'all-time') {
+        return 'all-time';
+    }
     if (this.period.length === 4) {
         return 'year';
     }
     return 'month';
 };
 
-// Compile templates.
+// Compile templates, unless they have been precompiled (see the
+// 'precompile_templates' option), in which case 'index.html' does
+// not include them.
 UI.prototype.init_templates = function() {
     this._templates = {};
+    var precompiled = Handlebars.templates || {};
+    for (var template_id in precompiled) {
+        if (precompiled.hasOwnProperty(template_id)) {
+            this._templates[template_id] = precompiled[template_id];
+        }
+    }
     var that = this;
     $('script[type="text/html"]').each(function(index, tag) {
         var template_id = tag.id.slice('tmpl-'.length);
@@ -168,21 +359,98 @@ UI.prototype.render = function(template_id, data) {
     return this._templates[template_id](data);
 };
 
-// Select a site, load data, update reports and interface.
+// Call 'callback' with the data of the given site, once it has been
+// loaded (or immediately if it is in the cache). If 'callback' is
+// not given, the data is only loaded in the cache (and errors are
+// ignored).
+UI.prototype.load_site = function(site, callback) {
+    var data = this._site_cache.get(site);
+    if (data !== undefined) {
+        if (callback !== undefined) {
+            callback.call(this, data);
+        }
+        return;
+    }
+    var pending = this._pending[site];
+    if (pending === undefined) {
+        pending = this._pending[site] = [];
+        var that = this;
+        load_json(data_url(site + '.json'), function(data, size) {
+            delete that._pending[site];
+            that._site_cache.set(site, data, size);
+            for (var i = 0; i < pending.length; i++) {
+                pending[i].call(that, data);
+            }
+        }, function(error) {
+            delete that._pending[site];
+            if (pending.length) {
+                $('#page-loading').hide();
+                window.alert('Could not load data of "' + site + '": ' +
+                             error);
+            }
+        });
+    }
+    if (callback !== undefined) {
+        pending.push(callback);
+    }
+};
+
+// Load the data of the given site in the cache, if it is not there
+// yet.
+UI.prototype.prefetch_site = function(site) {
+    if (site !== undefined && site !== this.site) {
+        this.load_site(site);
+    }
+};
+
+// Prefetch the site that is most likely to be selected next, i.e.
+// the next one in the menu.
+UI.prototype.prefetch_next_site = function() {
+    var index = $.inArray(this.site, this.sites);
+    if (index === -1 || this.sites.length < 2) {
+        return;
+    }
+    var next = this.sites[(index + 1) % this.sites.length];
+    var that = this;
+    window.setTimeout(function() {
+        that.prefetch_site(next);
+    }, PREFETCH_DELAY);
+};
+
+// Select a site, load data (asynchronously if it is not in the
+// cache), then update reports and interface.
 UI.prototype.select_site = function(new_site, new_period) {
-    var old_site = this.site;
-    var old_period = this.period;
-    if ((new_site === old_site) && (new_period === old_period)) {
+    if ((new_site === this.site) && (new_period === this.period)) {
         return false;
     }
+    // If another site is selected while the data of this one is
+    // being loaded, the latest selection wins.
+    this._selected_site = new_site;
+    if (new_site === this.site) {
+        this.show_site(new_site, new_period, this.data);
+        return;
+    }
     $('#page-loading').show();
+    this.load_site(new_site, function(data) {
+        if (this._selected_site === new_site) {
+            this.show_site(new_site, new_period, data);
+            this.prefetch_next_site();
+        }
+    });
+};
+
+// Show the reports of the given site and period. 'data' is the data
+// of the site.
+UI.prototype.show_site = function(new_site, new_period, data) {
+    var old_site = this.site;
+    var old_period = this.period;
     if (new_site !== old_site) {
         this.site = new_site;
-        this.data = get_json('data/' + this.site + '.json');
+        this.data = data;
         this.url = this.data['url'];
         $('.domain-selector').find('.placeholder').html(new_site);
     }
-    if (old_period !== new_period || old_period === undefined) {
+    if (new_site !== old_site || old_period !== new_period) {
         // If no particular period is provided, use the latest one.
         new_period = new_period || this.data['periods'][0];
         this.period = new_period;
@@ -203,8 +471,14 @@ UI.prototype.select_site = function(new_site, new_period) {
     this.update_hash();
 };
 
-// Select a period, update reports and interface.
+// Select a period, update reports and interface. This is ignored if
+// another site is being loaded: the period menu is still the one of
+// the displayed site, and selecting a period of this site would cancel
+// the selection of the other one.
 UI.prototype.select_period = function(new_period) {
+    if (this._selected_site !== this.site) {
+        return;
+    }
     if (new_period !== this.period) {
         this.select_site(this.site, new_period);
     }
@@ -212,6 +486,10 @@ UI.prototype.select_period = function(new_period) {
 
 // Update URL hash so that we can bookmark (deep-link) the page.
 UI.prototype.update_hash = function() {
+    if (this.site === undefined) {
+        // The data of the first site is still being loaded.
+        return;
+    }
     window.location.hash = to_querystring({'site': this.site,
                                            'period': this.period,
                                            'page': this.page});
@@ -251,52 +529,10 @@ UI.prototype.update_reports = function() {
     this.update_report_phrases();
 };
 
-// FIXME: review this. Probably rename.
-// Return series for the selected period.
-// - 'what' is the key in the JSON file. It may be either 'visits' or
-//   'visits_by_day'. FIXME: not true anymore
-// - 'mode' may be either 'month' or 'year'.
-UI.prototype.get_series = function(what, mode) {
-    var data = get_sorted_properties(this.data[what]);
-    // 'idx' is the position of the varying component of the keys of
-    // the 'data' object. The varying component is the day when in
-    // 'month' mode, and the month when in 'year' mode.
-    var idx = mode === 'year' ? 4 : 6;
-    // 'expected_length' is the length of the keys that are
-    // relevant. In 'year' mode, we look for YYYYMM keys (6 chars
-    // long); in 'month' mode, we look for YYYYMMDD keys (8 chars
-    // long).
-    var expected_length = mode === 'year' ? 6 : 8;
-    // We may not have data for the first days of the month (or the
-    // first months of the year). Here we find out the first day (or
-    // month) for which we have data.
-    var i = 0;
-    for (; i < data.length; i++) {
-        if ((data[i][0].length === expected_length) &&
-            (data[i][0].slice(0, idx) === this.period)) {
-            break;
-        }
-    }
-    var series = [];
-    // We provide a value of 0 for missing days/months.
-    var x = 0;
-    var first = parseInt(data[i][0].slice(1 + idx), 10) - 1;
-    for (; x < first; x++) {
-        series.push([x, {}]);
-    }
-    // ... and add data that we do know.
-    for (; i < data.length; i++) {
-        if ((data[i][0].length === expected_length) &&
-            (data[i][0].slice(0, idx) === this.period)) {
-            series.push([x++, data[i][1]]);
-        }
-    }
-    return series;
-};
-
 var YEAR_TICKS = [[0, 'jan'], [1, 'feb'], [2, 'mar'], [3, 'apr'], [4, 'may'],
     [5, 'jun'], [6, 'jul'], [7, 'aug'], [8, 'sep'], [9, 'oct'], [10, 'nov'],
     [11, 'dec']];
+var OVERVIEW_KEYS = ['hits', 'pages', 'bandwidth', 'visits', 'visitors'];
 // Update overview page.
 UI.prototype.update_report_overview = function() {
     var data = [];
@@ -309,12 +545,23 @@ UI.prototype.update_report_overview = function() {
                    'yaxis': {'ticks': 2}}; // FIXME: really?
     // FIXME: add tooltips
     // (see http://people.iola.dk/olau/flot/examples/interacting.html)
-    if (this.get_period_mode() === 'year') {
-        data = this.get_series('overview', 'year');
+    // Values of each day (or month, or year) of the period are stored
+    // in columns, at the index of the day (or month, or year).
+    var columns = this.data['overview'][this.period] || {};
+    var mode = this.get_period_mode();
+    var years = columns['years'] || [];
+    data = get_rows(columns, OVERVIEW_KEYS);
+    if (mode === 'all-time') {
+        var ticks = [];
+        for (var i = 0; i < years.length; i++) {
+            ticks.push([i, years[i]]);
+        }
+        options['xaxis'] = {'ticks': ticks};
+    }
+    else if (mode === 'year') {
         options['xaxis'] = {'ticks': YEAR_TICKS};
     }
     else { // mode === 'month'
-        data = this.get_series('overview', 'month');
         options['xaxis'] = {'ticks': get_month_ticks(this.period)};
     }
     var series = [];
@@ -327,8 +574,10 @@ UI.prototype.update_report_overview = function() {
     var table = [];
     for (var i = 0; i < data.length; i++) {
         var label = '';
-        if (this.get_period_mode() === 'month') {
+        if (mode === 'month') {
             label = String(1 + series[i][0]);
+        } else if (mode === 'all-time') {
+            label = years[series[i][0]];
         } else {
             label = MONTHS[series[i][0]];
         }
@@ -344,46 +593,86 @@ UI.prototype.update_report_overview = function() {
     $('.overview').children('tbody').html(this.render('overview-table', view));
 };
 
+// Call 'callback' with the data of the given report for the selected
+// period. If the data of the site has been split (see the
+// 'split_data' option), the data of the report for this period is
+// loaded asynchronously (and only once). The callback is not called
+// if another site or period has been selected in the meantime.
+UI.prototype.with_report_data = function(report, callback) {
+    var shards = this.data['shards'];
+    if (shards === undefined || shards[report] === undefined) {
+        callback.call(this, this.data[report][this.period] || []);
+        return;
+    }
+    if (this.data[report] === undefined) {
+        this.data[report] = {};
+    }
+    var cache = this.data[report];
+    var period = this.period;
+    if (cache.hasOwnProperty(period) ||
+        !shards[report].hasOwnProperty(period)) {
+        callback.call(this, cache[period] || []);
+        return;
+    }
+    var that = this;
+    var data = this.data;
+    load_json('data/' + shards[report][period], function(items) {
+        cache[period] = items;
+        if (that.data === data && that.period === period) {
+            callback.call(that, items);
+        }
+    }, function(error) {
+        window.alert('Could not load "' + report + '" report: ' + error);
+    });
+};
+
 // Update "Top 10" report.
 UI.prototype.update_report_top10 = function() {
-    var pages = this.data['top10'][this.period] || [];
-    var view = {'base_url': this.url,
-                'pages': pages,
-                'format_bandwidth': format_bandwidth};
-    $('.top10').children('tbody').html(this.render('top10-table', view));
+    this.with_report_data('top10', function(pages) {
+        var view = {'base_url': this.url,
+                    'pages': pages,
+                    'format_bandwidth': format_bandwidth};
+        $('.top10').children('tbody').html(this.render('top10-table', view));
+    });
 };
 
 // Update "Downloads" report.
 UI.prototype.update_report_downloads = function() {
-    var files = this.data['downloads'][this.period] || [];
-    var view = {'base_url': this.url,
-                'files': files,
-                'format_bandwidth': format_bandwidth};
-    $('.downloads').children('tbody').html(
-        this.render('downloads-table', view));
+    this.with_report_data('downloads', function(files) {
+        var view = {'base_url': this.url,
+                    'files': files,
+                    'format_bandwidth': format_bandwidth};
+        $('.downloads').children('tbody').html(
+            this.render('downloads-table', view));
+    });
 };
 
 // Update "Referrers" report.
 UI.prototype.update_report_referrers = function() {
-    var referrers = this.data['referrers'][this.period] || [];
-    var view = {'referrers': referrers};
-    $('.referrers').children('tbody').html(
-        this.render('referrers-table', view));
+    this.with_report_data('referrers', function(referrers) {
+        var view = {'referrers': referrers};
+        $('.referrers').children('tbody').html(
+            this.render('referrers-table', view));
+    });
 };
 
 // Update "Search keywords" report.
 UI.prototype.update_report_keywords = function() {
-    var keywords = this.data['keywords'][this.period] || [];
-    var view = {'keywords': keywords};
-    $('.keywords').children('tbody').html(this.render('keywords-table', view));
+    this.with_report_data('keywords', function(keywords) {
+        var view = {'keywords': keywords};
+        $('.keywords').children('tbody').html(
+            this.render('keywords-table', view));
+    });
 };
 
 
 // Update "Search phrases" report.
 UI.prototype.update_report_phrases = function() {
-    var phrases = this.data['phrases'][this.period] || [];
-    var view = {'phrases': phrases};
-    $('.phrases').children('tbody').html(this.render('phrases-table', view));
+    this.with_report_data('phrases', function(phrases) {
+        var view = {'phrases': phrases};
+        $('.phrases').children('tbody').html(
+            this.render('phrases-table', view));
+    });
 };
 
 
@@ -391,19 +680,36 @@ var ui = undefined; // will be set in 'init_ui()'
 
 // Initialize the user interface (to be called when the document is
 // ready): this sets up dropdown menus, generates graphs, etc.
-function init_ui() {
+// 'options.use_manifest' tells whether data file names are hashed.
+// 'options.loader_url' is the URL of 'loader.js', whose name is hashed
+// if assets are bundled.
+// Data is loaded asynchronously (in a worker if possible): the
+// loading indicator is shown in the meantime.
+function init_ui(options) {
     $('.dropdown-toggle').dropdown();
-    var sites = get_json('data/sites.json');
-    var qs = parse_querystring(window.location.hash);
-    var site = qs.site;
-    if (!site) {
-        site = sites[0];
-    }
-    // Set 'window.ui'
-    // 'qs.period' and 'qs.page' may be undefined but the constructor
-    // can deal with that.
-    window.ui = ui = new UI(site, qs.period, qs.page);
-    $('#site-menu').html(ui.render('site-menu', {'sites': sites}));
+    start_worker((options && options.loader_url) || LOADER_URL);
+    var start = function() {
+        load_json(data_url('sites.json'), function(sites) {
+            var qs = parse_querystring(window.location.hash);
+            var site = qs.site;
+            if (!site) {
+                site = sites[0];
+            }
+            // Set 'window.ui'
+            // 'qs.period' and 'qs.page' may be undefined but the
+            // constructor can deal with that.
+            window.ui = ui = new UI(site, qs.period, qs.page, sites);
+            $('#site-menu').html(ui.render('site-menu', {'sites': sites}));
+        });
+    };
+    if (options && options.use_manifest) {
+        load_json('data/manifest.json', function(data) {
+            manifest = data;
+            start();
+        });
+    } else {
+        start();
+    }
 }
 
 // public symbols of the module
@@ -411,9 +717,11 @@ return {
     format_bandwidth: format_bandwidth,
     get_month_ticks: get_month_ticks,
     get_period_label: get_period_label,
+    get_rows: get_rows,
     get_sorted_properties: get_sorted_properties,
     init_ui: init_ui,
     is_leap_year: is_leap_year,
+    LRUCache: LRUCache,
     parse_querystring: parse_querystring,
     to_querystring: to_querystring
 };
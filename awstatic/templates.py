@@ -0,0 +1,96 @@
+"""Precompilation of the Handlebars templates of ``index.html``.
+
+Templates are compiled with the Handlebars library of the report
+itself, which needs a JavaScript interpreter: Node.js must be
+installed. The page then uses the precompiled templates instead of
+compiling them each time it is loaded.
+"""
+
+import json
+import re
+import subprocess
+
+from awstatic.utils import replace_tags
+
+
+# Path of the Handlebars library (relative to the template directory),
+# used to compile templates. Precompiled templates can only be used
+# with the same version of the library.
+HANDLEBARS_PATH = 'assets/js/libs/handlebars-1.0.0.beta.6.min.js'
+# Path of the precompiled templates (relative to the output
+# directory).
+PRECOMPILED_TEMPLATES_PATH = 'assets/js/templates.js'
+NODE_COMMAND = 'node'
+
+TEMPLATE_RE = re.compile(
+    r'([ \t]*)<script id="tmpl-([\w-]+)" type="text/html">(.*?)</script>'
+    r'[ \t]*\n?', re.DOTALL)
+
+# Read a JSON object on the standard input, with the path of the
+# Handlebars library and the source of each template, and write the
+# precompiled templates on the standard output.
+PRECOMPILE_SCRIPT = '''
+var fs = require('fs');
+var vm = require('vm');
+var input = JSON.parse(fs.readFileSync(0, 'utf8'));
+var sandbox = {};
+vm.runInNewContext(fs.readFileSync(input.handlebars, 'utf8'), sandbox);
+var lines = ['(function(Handlebars) {',
+             'var templates = Handlebars.templates = ' +
+             'Handlebars.templates || {};'];
+for (var i = 0; i < input.templates.length; i++) {
+    var template = input.templates[i];
+    lines.push('templates[' + JSON.stringify(template[0]) + '] = ' +
+               'Handlebars.template(' +
+               sandbox.Handlebars.precompile(template[1]) + ');');
+}
+lines.push('})(Handlebars);');
+process.stdout.write(lines.join('\\n') + '\\n');
+'''
+
+
+class TemplateError(Exception):
+    """Raised when templates cannot be precompiled."""
+
+
+def get_templates(html):
+    """Return the identifiers and sources of the templates of the
+    given HTML page, as a list of ``(id, source)`` tuples. Templates
+    are ``<script type="text/html">`` tags whose identifier is
+    prefixed by ``tmpl-``.
+    """
+    return [(match.group(2), match.group(3))
+            for match in TEMPLATE_RE.finditer(html)]
+
+
+def replace_templates(html, url):
+    """Return the given HTML page where the first template is replaced
+    by a ``<script>`` tag that loads the precompiled templates at
+    ``url``, and other templates are removed.
+    """
+    return replace_tags(TEMPLATE_RE, html, '<script src="%s"></script>' % url)
+
+
+def precompile(templates, handlebars_path, node=NODE_COMMAND):
+    """Return the source of a JavaScript file that registers the given
+    templates (a list of ``(id, source)`` tuples), precompiled with
+    the Handlebars library at ``handlebars_path``, in
+    ``Handlebars.templates``.
+
+    Raise ``TemplateError`` if Node.js (the ``node`` command) is not
+    available or if a template cannot be compiled.
+    """
+    data = json.dumps({'handlebars': handlebars_path,
+                       'templates': templates})
+    try:
+        process = subprocess.Popen(
+            [node, '-e', PRECOMPILE_SCRIPT], stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE, stderr=subprocess.PIPE)
+    except OSError as exc:
+        raise TemplateError('Could not run "%s": %s' % (node, exc))
+    out, err = process.communicate(data.encode('utf-8'))
+    if process.returncode != 0:
+        raise TemplateError('Could not precompile templates: %s' %
+                            err.decode('utf-8', 'replace').strip())
+    return out.decode('utf-8')
+
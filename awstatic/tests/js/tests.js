@@ -45,6 +45,9 @@ $(document).ready(function () {
     test('test_get_period_label_year_only', function() {
         same(awstatic.get_period_label('2012'), '2012');
     });
+    test('test_get_period_label_all_time', function() {
+        same(awstatic.get_period_label('all-time'), 'All time');
+    });
 
     // Test 'get_sorted_properties()'
     test('test_get_sorted_properties_basics', function() {
@@ -55,6 +58,66 @@ $(document).ready(function () {
         same(awstatic.get_sorted_properties({}), []);
     });
 
+    // Test 'get_rows()'
+    test('test_get_rows_basics', function() {
+        same(awstatic.get_rows({'hits': [1, 2], 'pages': [3, 4]},
+                               ['hits', 'pages']),
+             [[0, {'hits': 1, 'pages': 3}], [1, {'hits': 2, 'pages': 4}]]);
+    });
+    test('test_get_rows_missing_column', function() {
+        same(awstatic.get_rows({'hits': [1]}, ['hits', 'visitors']),
+             [[0, {'hits': 1, 'visitors': 0}]]);
+    });
+    test('test_get_rows_empty', function() {
+        same(awstatic.get_rows({}, ['hits']), []);
+    });
+
+    // Test 'LRUCache'
+    test('test_lru_cache_get_set', function() {
+        var cache = new awstatic.LRUCache(2, 100);
+        same(cache.get('foo'), undefined);
+        cache.set('foo', 1, 10);
+        same(cache.get('foo'), 1);
+        same(cache.size, 10);
+    });
+    test('test_lru_cache_max_count', function() {
+        var cache = new awstatic.LRUCache(2, 100);
+        cache.set('foo', 1, 10);
+        cache.set('bar', 2, 10);
+        cache.get('foo');
+        cache.set('baz', 3, 10);
+        same(cache.keys(), ['foo', 'baz']);
+        same(cache.size, 20);
+    });
+    test('test_lru_cache_max_size', function() {
+        var cache = new awstatic.LRUCache(10, 100);
+        cache.set('foo', 1, 60);
+        cache.set('bar', 2, 60);
+        same(cache.keys(), ['bar']);
+        cache.set('baz', 3, 200);
+        same(cache.keys(), ['baz']);
+    });
+
+    // Test 'prepare()' of the loader
+    test('test_loader_prepare', function() {
+        var data = {'overview': {'2012': {'hits': [1, 2],
+                                          'visitors': [3, 0]},
+                                 'all-time': {'years': ['2012'],
+                                              'hits': [3]}}};
+        var buffers = awstatic_loader.prepare(data);
+        same(buffers.length, 3);
+        ok(data['overview']['2012']['hits'] instanceof Float64Array);
+        same(awstatic.get_rows(data['overview']['2012'],
+                               ['hits', 'visitors']),
+             [[0, {'hits': 1, 'visitors': 3}],
+              [1, {'hits': 2, 'visitors': 0}]]);
+        ok(data['overview']['all-time']['hits'] instanceof Float64Array);
+        same(data['overview']['all-time']['years'], ['2012']);
+    });
+    test('test_loader_prepare_no_overview', function() {
+        same(awstatic_loader.prepare({'top10': {}}), []);
+    });
+
     // Test 'is_leap_year()'
     test('test_is_leap_year', function() {
         ok(awstatic.is_leap_year(2012));
@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+
+HTML = '''<head>
+  <link rel="stylesheet" href="assets/css/style.css">
+</head>
+<body>
+  <img src="assets/img/loading.gif">
+  <script src="assets/js/libs/lib.min.js"></script>
+  <script src="assets/js/ui.js"></script>
+  <script src="http://example.com/external.js"></script>
+</body>
+'''
+
+
+class TestGetScripts(TestCase):
+
+    def _call_fut(self, html):
+        from awstatic.assets import get_scripts
+        return get_scripts(html)
+
+    def test_basics(self):
+        self.assertEqual(self._call_fut(HTML),
+                         ['assets/js/libs/lib.min.js', 'assets/js/ui.js'])
+
+
+class TestGetAssets(TestCase):
+
+    def _call_fut(self, html):
+        from awstatic.assets import get_assets
+        return get_assets(html)
+
+    def test_basics(self):
+        self.assertEqual(self._call_fut(HTML),
+                         ['assets/css/style.css', 'assets/img/loading.gif'])
+
+
+class TestReplaceScripts(TestCase):
+
+    def _call_fut(self, html, url):
+        from awstatic.assets import replace_scripts
+        return replace_scripts(html, url)
+
+    def test_basics(self):
+        html = self._call_fut(HTML, 'assets/js/bundle.0123.js')
+        self.assertIn('  <img src="assets/img/loading.gif">\n'
+                      '  <script src="assets/js/bundle.0123.js"></script>\n'
+                      '  <script src="http://example.com/external.js">'
+                      '</script>\n', html)
+        self.assertNotIn('ui.js', html)
+
+
+class TestReplaceAssets(TestCase):
+
+    def _call_fut(self, html, urls):
+        from awstatic.assets import replace_assets
+        return replace_assets(html, urls)
+
+    def test_basics(self):
+        html = self._call_fut(
+            HTML, {'assets/css/style.css': 'assets/css/style.0123.css'})
+        self.assertIn('href="assets/css/style.0123.css"', html)
+        self.assertIn('src="assets/img/loading.gif"', html)
+
+
+class TestBundleScripts(TestCase):
+
+    def _call_fut(self, scripts):
+        from awstatic.assets import bundle_scripts
+        return bundle_scripts(scripts)
+
+    def test_basics(self):
+        bundle = self._call_fut([('a.min.js', 'var a = 1\n'),
+                                 ('b.min.js', 'var b = 2;')])
+        self.assertEqual(bundle, 'var a = 1\n;\nvar b = 2;\n')
@@ -0,0 +1,124 @@
+from contextlib import contextmanager
+from tempfile import mkdtemp
+from shutil import rmtree
+from unittest import TestCase
+
+import mock
+
+
+@contextmanager
+def temp_folder():
+    tmp_dir = mkdtemp()
+    try:
+        yield tmp_dir
+    finally:
+        rmtree(tmp_dir)
+
+
+def write(path, content):
+    with open(path, 'w') as fp:
+        fp.write(content)
+
+
+class TestParseCache(TestCase):
+
+    def _make_one(self, cache_dir):
+        from awstatic.cache import ParseCache
+        return ParseCache(cache_dir)
+
+    def test_get_empty(self):
+        import os.path
+        with temp_folder() as tmp_dir:
+            path = os.path.join(tmp_dir, 'awstats012012.txt')
+            write(path, 'content')
+            cache = self._make_one(os.path.join(tmp_dir, 'cache'))
+            self.assertIsNone(cache.get(path, ('DAY', )))
+
+    def test_set_and_get(self):
+        import os.path
+        with temp_folder() as tmp_dir:
+            path = os.path.join(tmp_dir, 'awstats012012.txt')
+            write(path, 'content')
+            cache = self._make_one(os.path.join(tmp_dir, 'cache'))
+            cache.set(path, ('DAY', ), {'DAY': {'foo': 'bar'}})
+            self.assertEqual(cache.get(path, ('DAY', )),
+                             {'DAY': {'foo': 'bar'}})
+            # Another list of sections invalidates the entry.
+            self.assertIsNone(cache.get(path, ('DAY', 'SIDER')))
+
+    def test_content_changed(self):
+        import os.path
+        with temp_folder() as tmp_dir:
+            path = os.path.join(tmp_dir, 'awstats012012.txt')
+            write(path, 'content')
+            cache = self._make_one(os.path.join(tmp_dir, 'cache'))
+            cache.set(path, ('DAY', ), {'DAY': {}})
+            write(path, 'CONTENT')
+            os.utime(path, (0, 0))
+            self.assertIsNone(cache.get(path, ('DAY', )))
+
+    def test_mtime_changed_but_same_content(self):
+        import os.path
+        with temp_folder() as tmp_dir:
+            path = os.path.join(tmp_dir, 'awstats012012.txt')
+            write(path, 'content')
+            cache = self._make_one(os.path.join(tmp_dir, 'cache'))
+            cache.set(path, ('DAY', ), {'DAY': {}})
+            os.utime(path, (0, 0))
+            with mock.patch('awstatic.cache.get_file_hash',
+                            return_value='wrong') as mock_hash:
+                self.assertIsNone(cache.get(path, ('DAY', )))
+            self.assertEqual(mock_hash.call_count, 1)
+            self.assertEqual(cache.get(path, ('DAY', )), {'DAY': {}})
+            # The new modification time has been stored: the hash is
+            # not computed anymore.
+            with mock.patch('awstatic.cache.get_file_hash') as mock_hash:
+                self.assertEqual(cache.get(path, ('DAY', )), {'DAY': {}})
+            self.assertFalse(mock_hash.called)
+
+
+class TestAggregateCache(TestCase):
+
+    def _make_one(self, cache_dir):
+        from awstatic.cache import AggregateCache
+        return AggregateCache(cache_dir)
+
+    def test_get_empty(self):
+        import os.path
+        with temp_folder() as tmp_dir:
+            cache = self._make_one(os.path.join(tmp_dir, 'aggregates'))
+            self.assertIsNone(cache.get('exemple.com', 'top10', '2012', 'fp'))
+
+    def test_set_and_get(self):
+        import os.path
+        aggregates = {'url1': {'pages': 10, 'bandwidth': 200}}
+        with temp_folder() as tmp_dir:
+            cache = self._make_one(os.path.join(tmp_dir, 'aggregates'))
+            cache.set('exemple.com', 'top10', '2012', 'fp', aggregates)
+            self.assertEqual(
+                cache.get('exemple.com', 'top10', '2012', 'fp'), aggregates)
+            self.assertIsNone(
+                cache.get('exemple.com', 'top10', '2012', 'other'))
+            self.assertIsNone(
+                cache.get('exemple.com', 'top10', '2011', 'fp'))
+            self.assertIsNone(
+                cache.get('exemple.com', 'keywords', '2012', 'fp'))
+
+
+class TestParserWithCache(TestCase):
+
+    def test_parse_file_uses_cache(self):
+        import os.path
+        from awstatic.cache import ParseCache
+        from awstatic.parser import Parser
+        here = os.path.dirname(__file__)
+        path = os.path.join(here, 'data', 'awstats', 'basics.txt')
+        with temp_folder() as cache_dir:
+            cache = ParseCache(cache_dir)
+            parser = Parser(cache=cache)
+            parser.parse_file(path, '201201')
+            cached = Parser(cache=cache)
+            with mock.patch('awstatic.parser.Parser._parse_file') as m:
+                cached.parse_file(path, '201201')
+            self.assertFalse(m.called)
+            self.assertEqual(cached.data, parser.data)
@@ -0,0 +1,55 @@
+from unittest import TestCase
+
+
+class TestIsCompressible(TestCase):
+
+    def _call_fut(self, path):
+        from awstatic.compress import is_compressible
+        return is_compressible(path)
+
+    def test_basics(self):
+        self.assertTrue(self._call_fut('data/sites.json'))
+        self.assertTrue(self._call_fut('index.html'))
+        self.assertTrue(self._call_fut('assets/js/ui.js'))
+        self.assertTrue(self._call_fut('assets/css/style.css'))
+        self.assertFalse(self._call_fut('assets/img/loading.gif'))
+        self.assertFalse(self._call_fut('data/sites.json.gz'))
+
+
+class TestGetCompressedSuffixes(TestCase):
+
+    def _call_fut(self):
+        from awstatic.compress import get_compressed_suffixes
+        return get_compressed_suffixes()
+
+    def test_basics(self):
+        from awstatic.compat import brotli
+        expected = ('.gz', '.br') if brotli is not None else ('.gz', )
+        self.assertEqual(self._call_fut(), expected)
+
+
+class TestWriteCompressedCopies(TestCase):
+
+    def _call_fut(self, path):
+        from awstatic.compress import write_compressed_copies
+        return write_compressed_copies(path)
+
+    def test_basics(self):
+        import gzip
+        import os
+        from tempfile import mkstemp
+        fd, path = mkstemp(suffix='.json')
+        try:
+            content = b'{"foo": "bar"}' * 100
+            with os.fdopen(fd, 'wb') as fp:
+                fp.write(content)
+            os.utime(path, (1000000000, 1000000000))
+            self._call_fut(path)
+            with gzip.open(path + '.gz', 'rb') as fp:
+                self.assertEqual(fp.read(), content)
+            self.assertEqual(os.stat(path + '.gz').st_mtime, 1000000000)
+            self.assertLess(os.path.getsize(path + '.gz'), len(content))
+        finally:
+            for suffix in ('', '.gz', '.br'):
+                if os.path.exists(path + suffix):
+                    os.unlink(path + suffix)
@@ -5,9 +5,9 @@ import mock
 
 class TestParser(TestCase):
 
-    def _make_one(self):
+    def _make_one(self, **kwargs):
         from awstatic.parser import Parser
-        return Parser()
+        return Parser(**kwargs)
 
     @mock.patch('awstatic.parser.Parser.parse_file')
     def test_parse_dir(self, mock_parse_file):
@@ -37,17 +37,115 @@ class TestParser(TestCase):
                                     'TotalUnique': ['6']}},
                     'VISITOR':
                         {'201201':
-                             {'8.8.8.8.rev.sfr.net':
-                                  {'host': '8.8.8.8.rev.sfr.net',
-                                   'pages': '14',
-                                   'hits': '38',
-                                   'bandwidth': '1213892'},
-                              'i04m-8-8-8-8.d4.club-internet.fr':
-                                  {'host': 'i04m-8-8-8-8.d4.club-internet.fr',
-                                   'pages': '2',
-                                   'hits': '12',
-                                   'bandwidth': '654661'},
-                              }
+                             [('8.8.8.8.rev.sfr.net', 14, 38, 1213892),
+                              ('i04m-8-8-8-8.d4.club-internet.fr',
+                               2, 12, 654661)]
                          }
                     }
         self.assertEqual(parser.data, expected)
+
+    def test_parse_file_with_map(self):
+        import os
+        here = os.path.dirname(__file__)
+        path = os.path.join(here, 'data', 'awstats', 'map.txt')
+        parser = self._make_one(sections=('DAY', 'GENERAL'))
+        with mock.patch('awstatic.parser.Parser._read_sections') as m:
+            parser.parse_file(path, '201201')
+        self.assertFalse(m.called)
+        expected = {'DAY':
+                        {'201201':
+                             [('20120129', 3, 16, 1824948, 2),
+                              ('20120131', 11, 34, 43605, 4)]},
+                    'GENERAL':
+                        {'201201': {'TotalVisits': ['6'],
+                                    'TotalUnique': ['6']}}}
+        self.assertEqual(parser.data, expected)
+        # Only the map and the requested sections have been read.
+        self.assertTrue(0 < parser.bytes_read < os.path.getsize(path))
+
+    def test_parse_file_without_map(self):
+        # 'basics.txt' has no map: the whole file is read.
+        import os
+        here = os.path.dirname(__file__)
+        path = os.path.join(here, 'data', 'awstats', 'basics.txt')
+        parser = self._make_one(sections=('VISITOR', ))
+        parser.parse_file(path, '201201')
+        self.assertEqual(list(parser.data.keys()), ['VISITOR'])
+        self.assertEqual(parser.bytes_read, os.path.getsize(path))
+
+    def test_parse_file_with_inconsistent_map(self):
+        # Offsets of the map of this file are wrong: we should fall
+        # back on reading the whole file.
+        import os
+        here = os.path.dirname(__file__)
+        path = os.path.join(here, 'data', 'awstats',
+                            'awstats012012.exemple.com.txt')
+        parser = self._make_one()
+        parser.parse_file(path, '201201')
+        linear = self._make_one(use_map=False)
+        linear.parse_file(path, '201201')
+        self.assertEqual(parser.data, linear.data)
+        self.assertEqual(sorted(parser.data.keys()),
+                         ['BROWSER', 'DAY', 'DOWNLOADS', 'GENERAL',
+                          'KEYWORDS', 'OS', 'PAGEREFS', 'SEARCHWORDS',
+                          'SEREFERRALS', 'SIDER', 'VISITOR'])
+
+    def test_parse_dir_with_workers(self):
+        import os
+        here = os.path.dirname(__file__)
+        in_dir = os.path.join(here, 'data', 'awstats')
+        parser = self._make_one()
+        parser.parse_dir('exemple.com', in_dir, 'awstats', 'txt')
+        parallel = self._make_one()
+        parallel.parse_dir('exemple.com', in_dir, 'awstats', 'txt',
+                           workers=3)
+        self.assertEqual(parallel.data, parser.data)
+        self.assertEqual(list(parallel.data['DAY'].keys()),
+                         list(parser.data['DAY'].keys()))
+
+    def test_parse_file_compact(self):
+        import os
+        from awstatic.parser import ColumnarSection
+        here = os.path.dirname(__file__)
+        path = os.path.join(here, 'data', 'awstats',
+                            'awstats012012.exemple.com.txt')
+        parser = self._make_one()
+        parser.parse_file(path, '201201')
+        compact = self._make_one(compact=True)
+        compact.parse_file(path, '201201')
+        self.assertEqual(sorted(compact.data.keys()),
+                         sorted(parser.data.keys()))
+        for section, months in compact.data.items():
+            if section == 'GENERAL':
+                self.assertEqual(months, parser.data[section])
+                continue
+            rows = months['201201']
+            self.assertIsInstance(rows, ColumnarSection)
+            self.assertEqual(len(rows), len(parser.data[section]['201201']))
+            self.assertEqual(list(rows), parser.data[section]['201201'])
+
+
+class TestColumnarSection(TestCase):
+
+    def _make_one(self, n_columns):
+        from awstatic.parser import ColumnarSection
+        return ColumnarSection(n_columns)
+
+    def test_basics(self):
+        section = self._make_one(3)
+        self.assertEqual(len(section), 0)
+        self.assertEqual(list(section), [])
+        section.extend([('url1', 1, 2), ('url2', 3, 4)])
+        self.assertEqual(len(section), 2)
+        self.assertEqual(list(section), [('url1', 1, 2), ('url2', 3, 4)])
+        self.assertEqual(section.keys, ['url1', 'url2'])
+
+    def test_intern(self):
+        interned = {}
+        intern = lambda key: interned.setdefault(key, key)
+        first = self._make_one(2)
+        first.extend([(''.join(('ur', 'l')), 1)], intern=intern)
+        second = self._make_one(2)
+        second.extend([(''.join(('u', 'rl')), 2)], intern=intern)
+        self.assertEqual(first.keys, ['url'])
+        self.assertIs(first.keys[0], second.keys[0])
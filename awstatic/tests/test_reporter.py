@@ -27,10 +27,9 @@ def text_(s, encoding):
 
 
 class DummyLogger(object):
-    pass
-    #def info(self, *args, **kwargs):
-    #    pass
-    #debug = warning = info
+    def info(self, *args, **kwargs):
+        pass
+    debug = warning = error = info
 
 
 class TestGetPeriods(TestCase):
@@ -41,9 +40,57 @@ class TestGetPeriods(TestCase):
 
     def test_basics(self):
         seq = ['201201', '201112', '201111', '20111101', 'ignore-me']
-        expected = ['201201', '201112', '201111', '2011']
+        expected = ['201201', '201112', '201111', '2011', 'all-time']
         self.assertEqual(self.call_fut(seq), expected)
 
+    def test_no_months(self):
+        self.assertEqual(self.call_fut(['ignore-me']), [])
+
+
+class TestGetRequiredSections(TestCase):
+
+    def call_fut(self):
+        from awstatic.reporter import get_required_sections
+        return get_required_sections()
+
+    def test_basics(self):
+        self.assertEqual(self.call_fut(),
+                         set(('DAY', 'DOWNLOADS', 'GENERAL', 'KEYWORDS',
+                              'PAGEREFS', 'SEARCHWORDS', 'SIDER')))
+
+    def test_register_report(self):
+        from awstatic.reporter import REPORTS
+        from awstatic.reporter import register_report
+        n_reports = len(REPORTS)
+        try:
+            @register_report('visitors', 'VISITOR')
+            def builder(data):
+                pass  # pragma: no cover
+            self.assertEqual(REPORTS[-1], ('visitors', builder, ('VISITOR', )))
+            self.assertIn('VISITOR', self.call_fut())
+        finally:
+            del REPORTS[n_reports:]
+
+
+class TestSelectTop(TestCase):
+
+    def call_fut(self, items, top):
+        from awstatic.reporter import _select_top
+        return _select_top(items, lambda i: i[1], top)
+
+    def test_all(self):
+        items = [('a', 1), ('b', 3), ('c', 2)]
+        self.assertEqual(self.call_fut(items, None),
+                         [('b', 3), ('c', 2), ('a', 1)])
+
+    def test_top_with_ties(self):
+        # Must keep the same order as 'sorted()' for equal items.
+        items = [('a', 1), ('b', 2), ('c', 3), ('d', 2), ('e', 1), ('f', 2)]
+        expected = sorted(items, key=lambda i: i[1], reverse=True)[:3]
+        self.assertEqual(self.call_fut(items, 3), expected)
+        self.assertEqual(self.call_fut(items, 3),
+                         [('c', 3), ('b', 2), ('d', 2)])
+
 
 class TestReporter(TestCase):
 
@@ -58,52 +105,503 @@ class TestReporter(TestCase):
         kwargs.update(custom)
         return Reporter(**kwargs)
 
+    def _get_contents(self, root):
+        import os
+        contents = []
+        for dirpath, dirnames, filenames in os.walk(root):
+            for l in (dirnames, filenames):
+                for filename in l:
+                    path = os.path.join(dirpath, filename)
+                    path = path.replace(os.sep, '/')
+                    if os.path.isdir(path):
+                        path += '/'
+                    path = path[1 + len(root):]
+                    contents.append(path)
+        return sorted(contents)
+
     def test_prepare_out_dir(self):
         import os.path
-        from awstatic.reporter import BACKUP_DIR_NAME
         from awstatic.reporter import TEMPLATE_STRUCTURE
-        with temp_folder() as out_dir:
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            reporter = self._make_one(out_dir=out_dir, awstats_dir=None,
+                                      sites=())
+            reporter._prepare_out_dir()
+            self.assertEqual(os.path.dirname(reporter.build_dir), tmp_dir)
+            self.assertFalse(os.path.exists(out_dir))
+            contents = self._get_contents(reporter.build_dir)
+        self.assertEqual(contents, sorted(TEMPLATE_STRUCTURE))
+
+    def test_prepare_out_dir_links_unchanged_files(self):
+        import os.path
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            self._make_one(out_dir=out_dir, awstats_dir=None, sites=()).run()
             reporter = self._make_one(out_dir=out_dir, awstats_dir=None,
                                       sites=())
             reporter._prepare_out_dir()
-            contents = []
-            for dirpath, dirnames, filenames in os.walk(out_dir):
-                for l in (dirnames, filenames):
-                    for filename in l:
-                        path = os.path.join(dirpath, filename)
-                        path = path.replace(os.sep, '/')
-                        if os.path.isdir(path):
-                            path += '/'
-                        path = path[1 + len(out_dir):]
-                        contents.append(path)
-        expected = list(TEMPLATE_STRUCTURE)
-        expected.append(BACKUP_DIR_NAME + '/')
-        self.assertEqual(sorted(contents), sorted(expected))
+            css = os.path.join('assets', 'css', 'style.css')
+            self.assertTrue(os.path.samefile(
+                os.path.join(out_dir, css),
+                os.path.join(reporter.build_dir, css)))
+
+    def test_run_publish_directory(self):
+        import os
+        from awstatic.reporter import TEMPLATE_STRUCTURE
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            for i in range(2):
+                reporter = self._make_one(out_dir=out_dir, awstats_dir=None,
+                                          sites=())
+                reporter.run()
+                self.assertEqual(os.listdir(tmp_dir), ['out'])
+                self.assertFalse(os.path.islink(out_dir))
+                expected = sorted(TEMPLATE_STRUCTURE + ('data/sites.json', ))
+                self.assertEqual(self._get_contents(out_dir), expected)
+
+    def test_run_publish_symlink(self):
+        import os
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            os.mkdir(os.path.join(tmp_dir, 'first'))
+            os.symlink('first', out_dir)
+            reporter = self._make_one(out_dir=out_dir, awstats_dir=None,
+                                      sites=())
+            reporter.run()
+            self.assertTrue(os.path.islink(out_dir))
+            self.assertEqual(os.readlink(out_dir),
+                             os.path.basename(reporter.build_dir))
+            self.assertTrue(
+                os.path.exists(os.path.join(out_dir, 'index.html')))
+            # The previous target was not ours: it has been kept.
+            self.assertTrue(os.path.exists(os.path.join(tmp_dir, 'first')))
+            first_build_dir = reporter.build_dir
+            # Make sure that the new staging directory has another name.
+            reporter = self._make_one(out_dir=out_dir, awstats_dir=None,
+                                      sites=())
+            reporter.build_dir += '-2'
+            reporter.data_dir = os.path.join(reporter.build_dir, 'data')
+            reporter.run()
+            self.assertEqual(os.readlink(out_dir),
+                             os.path.basename(reporter.build_dir))
+            self.assertFalse(os.path.exists(first_build_dir))
+
+    def test_run_removes_only_stale_dirs(self):
+        import os
+        import subprocess
+        import sys
+        from time import time
+        from awstatic.reporter import STALE_STAGING_AGE
+        if os.name != 'posix':  # pragma: no cover
+            self.skipTest('Processes cannot be checked on this platform.')
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        now = int(time())
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            # The staging directory of a run that is in progress...
+            running = os.path.join(tmp_dir, '.out.%d.%d' % (now, os.getpid()))
+            # ... of a run that has been interrupted...
+            dead = os.path.join(tmp_dir, '.out.%d.%d' % (now, process.pid))
+            # ... and of a run that has been running for too long.
+            old = os.path.join(tmp_dir, '.out.%d.%d' % (
+                now - STALE_STAGING_AGE - 60, os.getpid()))
+            for path in (running, dead, old):
+                os.mkdir(path)
+            reporter = self._make_one(out_dir=out_dir, awstats_dir=None,
+                                      sites=())
+            reporter.build_dir += '-new'
+            reporter.data_dir = os.path.join(reporter.build_dir, 'data')
+            reporter.run()
+            self.assertTrue(os.path.exists(running))
+            self.assertFalse(os.path.exists(dead))
+            self.assertFalse(os.path.exists(old))
+
+    def _get_awstats_dir(self):
+        import os.path
+        here = os.path.dirname(__file__)
+        return os.path.join(here, 'data', 'awstats')
+
+    def _read_reports(self, out_dir):
+        import os
+        data_dir = os.path.join(out_dir, 'data')
+        reports = {}
+        for filename in os.listdir(data_dir):
+            with open(os.path.join(data_dir, filename)) as fp:
+                reports[filename] = fp.read()
+        return reports
+
+    def test_run_with_workers(self):
+        import os.path
+        sites = (('exemple.com', 'http://exemple.com'),
+                 ('exemple2.com', 'http://exemple2.com'))
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'serial')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir())
+            reporter.run()
+            expected = self._read_reports(out_dir)
+            out_dir = os.path.join(tmp_dir, 'parallel')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      workers=2)
+            reporter.run()
+            self.assertEqual(self._read_reports(out_dir), expected)
+
+    def test_run_with_split_data(self):
+        import json
+        import os.path
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'full')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir())
+            reporter.run()
+            with open(os.path.join(out_dir, 'data', 'exemple.com.json')) as fp:
+                full = json.load(fp)
+            out_dir = os.path.join(tmp_dir, 'split')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      split_data=True)
+            reporter.run()
+            data_dir = os.path.join(out_dir, 'data')
+            with open(os.path.join(data_dir, 'exemple.com.json')) as fp:
+                index = json.load(fp)
+            self.assertEqual(sorted(index.keys()),
+                             ['overview', 'periods', 'shards', 'url'])
+            for key in ('overview', 'periods', 'url'):
+                self.assertEqual(index[key], full[key])
+            self.assertEqual(sorted(index['shards'].keys()),
+                             ['downloads', 'keywords', 'phrases',
+                              'referrers', 'top10'])
+            for name, paths in index['shards'].items():
+                self.assertEqual(sorted(paths.keys()),
+                                 sorted(full[name].keys()))
+                for period, path in paths.items():
+                    self.assertEqual(
+                        path, 'exemple.com/%s/%s.json' % (name, period))
+                    with open(os.path.join(data_dir, path)) as fp:
+                        self.assertEqual(json.load(fp), full[name][period])
+
+    def test_run_keeps_unchanged_data_files(self):
+        import os
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            path = os.path.join(out_dir, 'data', 'exemple.com.json')
+            self._make_one(out_dir=out_dir, sites=sites,
+                           awstats_dir=self._get_awstats_dir()).run()
+            first = os.stat(path)
+            self._make_one(out_dir=out_dir, sites=sites,
+                           awstats_dir=self._get_awstats_dir()).run()
+            second = os.stat(path)
+            self.assertEqual(first.st_ino, second.st_ino)
+            self.assertEqual(first.st_mtime, second.st_mtime)
+
+    def test_run_with_hashed_filenames(self):
+        import json
+        import os.path
+        import re
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'plain')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir())
+            reporter.run()
+            expected = self._read_reports(out_dir)
+            out_dir = os.path.join(tmp_dir, 'hashed')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      hashed_filenames=True)
+            reporter.run()
+            reports = self._read_reports(out_dir)
+            manifest = json.loads(reports.pop('manifest.json'))
+            self.assertEqual(sorted(manifest.keys()), sorted(expected.keys()))
+            for name, hashed_name in manifest.items():
+                base, ext = os.path.splitext(name)
+                self.assertTrue(re.match(
+                    r'^%s\.[0-9a-f]{16}\%s$' % (re.escape(base), ext),
+                    hashed_name))
+                self.assertEqual(reports[hashed_name], expected[name])
+            with open(os.path.join(out_dir, 'index.html')) as fp:
+                self.assertIn("{'use_manifest': true,", fp.read())
+
+    def test_run_with_stats_file(self):
+        import json
+        import os.path
+        sites = (('exemple.com', 'http://exemple.com'),
+                 ('exemple2.com', 'http://exemple2.com'))
+        with temp_folder() as tmp_dir:
+            stats_file = os.path.join(tmp_dir, 'stats.json')
+            reporter = self._make_one(out_dir=os.path.join(tmp_dir, 'out'),
+                                      sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      stats_file=stats_file, workers=2)
+            reporter.run()
+            with open(stats_file) as fp:
+                stats = json.load(fp)
+            phases = [(record['site'], record['phase'])
+                      for record in stats['phases']]
+            self.assertEqual(phases[0], (None, 'prepare'))
+            self.assertEqual(phases[-1], (None, 'publish'))
+            for site_id, url in sites:
+                self.assertIn((site_id, 'parse'), phases)
+                self.assertIn((site_id, 'report:overview'), phases)
+                self.assertIn((site_id, 'write'), phases)
+            self.assertTrue(stats['totals']['bytes_read'] > 0)
+            self.assertTrue(stats['totals']['bytes_written'] > 0)
+
+    def test_run_with_profile(self):
+        import os.path
+        import pstats
+        sites = (('exemple.com', 'http://exemple.com'),
+                 ('exemple2.com', 'http://exemple2.com'))
+        for workers in (1, 2):
+            with temp_folder() as tmp_dir:
+                path = os.path.join(tmp_dir, 'awstatic.prof')
+                reporter = self._make_one(
+                    out_dir=os.path.join(tmp_dir, 'out'), sites=sites,
+                    awstats_dir=self._get_awstats_dir(), profile=path,
+                    workers=workers)
+                reporter.run()
+                functions = set(func[2] for func in pstats.Stats(path).stats)
+                self.assertIn('_publish', functions)
+                self.assertIn('_create_report_overview', functions)
+                for site_id, url in sites:
+                    stats = pstats.Stats('%s.%s' % (path, site_id))
+                    functions = set(func[2] for func in stats.stats)
+                    self.assertIn('parse_dir', functions)
+                    self.assertNotIn('_publish', functions)
+
+    def test_run_with_cache(self):
+        import os
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            cache_dir = os.path.join(tmp_dir, 'cache')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir())
+            reporter.run()
+            expected = self._read_reports(out_dir)
+            for i in range(2):
+                reporter = self._make_one(
+                    out_dir=out_dir, sites=sites, cache_dir=cache_dir,
+                    awstats_dir=self._get_awstats_dir())
+                reporter.run()
+                self.assertEqual(self._read_reports(out_dir), expected)
+            self.assertIn('exemple.com.top10.2012.aggregate',
+                          os.listdir(os.path.join(cache_dir, 'aggregates')))
+
+    def test_run_with_precompress(self):
+        import os.path
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      precompress=True)
+            reporter.run()
+            for path in ('index.html', 'assets/css/style.css',
+                         'assets/js/ui.js', 'data/sites.json',
+                         'data/exemple.com.json'):
+                path = os.path.join(out_dir, path.replace('/', os.sep))
+                self.assertTrue(os.path.exists(path + '.gz'))
+            gif = os.path.join(out_dir, 'assets', 'img', 'loading.gif')
+            self.assertFalse(os.path.exists(gif + '.gz'))
+
+    def test_run_with_precompress_missing_copies(self):
+        import os.path
+        from awstatic.compress import get_compressed_suffixes
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      precompress=True)
+            reporter.run()
+            # The (unchanged) style sheet has lost its gzip copy and
+            # has a Brotli copy that may not be expected anymore.
+            path = os.path.join(out_dir, 'assets', 'css', 'style.css')
+            os.unlink(path + '.gz')
+            with open(path + '.br', 'wb') as fp:
+                fp.write(b'stale')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      precompress=True)
+            reporter.run()
+            self.assertTrue(os.path.exists(path + '.gz'))
+            if '.br' in get_compressed_suffixes():  # pragma: no cover
+                with open(path + '.br', 'rb') as fp:
+                    self.assertNotEqual(fp.read(), b'stale')
+            else:
+                self.assertFalse(os.path.exists(path + '.br'))
+
+    def test_run_with_precompiled_templates(self):
+        import io
+        import os.path
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      precompile_templates=True)
+            reporter.run()
+            templates = os.path.join(out_dir, 'assets', 'js', 'templates.js')
+            with io.open(os.path.join(out_dir, 'index.html'),
+                         encoding='utf-8') as fp:
+                html = fp.read()
+            if not os.path.exists(templates):
+                # Node.js is not available: templates are left in
+                # 'index.html', to be compiled by the browser.
+                self.assertIn('id="tmpl-top10-table"', html)
+                return
+            self.assertNotIn('id="tmpl-', html)
+            self.assertIn('<script src="assets/js/templates.js"></script>',
+                          html)
+            with io.open(templates, encoding='utf-8') as fp:
+                self.assertIn('templates["top10-table"]', fp.read())
+
+    def test_run_with_bundled_assets(self):
+        import io
+        import os.path
+        import re
+        sites = (('exemple.com', 'http://exemple.com'), )
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      bundle_assets=True, precompress=True)
+            reporter.run()
+            with io.open(os.path.join(out_dir, 'index.html'),
+                         encoding='utf-8') as fp:
+                html = fp.read()
+            scripts = re.findall(r'<script src="([^"]+)"></script>', html)
+            self.assertEqual(len(scripts), 1)
+            self.assertTrue(re.match(r'^assets/js/bundle\.[0-9a-f]{16}\.js$',
+                                     scripts[0]))
+            loader = re.search(r"'loader_url': '([^']+)'", html).group(1)
+            self.assertTrue(re.match(r'^assets/js/loader\.[0-9a-f]{16}\.js$',
+                                     loader))
+            self.assertTrue(re.search(
+                r'href="assets/css/style\.[0-9a-f]{16}\.css"', html))
+            self.assertTrue(re.search(
+                r'src="assets/img/loading\.[0-9a-f]{16}\.gif"', html))
+            for path in (scripts[0], loader):
+                path = os.path.join(out_dir, path.replace('/', os.sep))
+                self.assertTrue(os.path.exists(path))
+                self.assertTrue(os.path.exists(path + '.gz'))
+            bundle_path = os.path.join(out_dir,
+                                       scripts[0].replace('/', os.sep))
+            with io.open(bundle_path, encoding='utf-8') as fp:
+                bundle = fp.read()
+            self.assertIn('var awstatic = ', bundle)
+            self.assertIn('var awstatic_loader = ', bundle)
+            # Bundled and renamed files are not kept.
+            for path in ('assets/js/ui.js', 'assets/js/loader.js',
+                         'assets/js/ui.js.gz', 'assets/css/style.css',
+                         'assets/img/loading.gif', 'assets/js/libs'):
+                path = os.path.join(out_dir, path.replace('/', os.sep))
+                self.assertFalse(os.path.exists(path))
+            # Assets keep their names if they have not changed.
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      bundle_assets=True)
+            reporter.run()
+            with io.open(os.path.join(out_dir, 'index.html'),
+                         encoding='utf-8') as fp:
+                self.assertIn(scripts[0], fp.read())
+
+    def test_run_with_failure(self):
+        import os.path
+        from awstatic.reporter import ReportError
+        with temp_folder() as tmp_dir:
+            out_dir = os.path.join(tmp_dir, 'out')
+            sites = (('exemple.com', 'http://exemple.com'), )
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir())
+            reporter.run()
+            previous = self._read_reports(out_dir)
+            sites = (('exemple.com', 'http://exemple.com'),
+                     ('unknown.com', 'http://unknown.com'),
+                     ('exemple2.com', 'http://exemple2.com'))
+            reporter = self._make_one(out_dir=out_dir, sites=sites,
+                                      awstats_dir=self._get_awstats_dir(),
+                                      workers=2)
+            # There is no data for 'unknown.com'.
+            self.assertRaises(ReportError, reporter.run)
+            # The previous report is untouched.
+            self.assertEqual(self._read_reports(out_dir), previous)
+            self.assertEqual(os.listdir(tmp_dir), ['out'])
 
 
 class TestReports(TestCase):
     # Test '_create_report_*()' functions
 
+    def test_create_report_overview(self):
+        from awstatic.reporter import _create_report_overview
+        data = {'DAY': {'201202': [('20120202', 3, 16, 1024, 2),
+                                   ('20120229', 11, 34, 2048, 4)]},
+                'GENERAL': {'201202': {'TotalUnique': ['5']}}}
+        report = _create_report_overview(data)
+        self.assertEqual(sorted(report.keys()),
+                         ['2012', '201202', 'all-time'])
+        month = report['201202']
+        self.assertEqual(sorted(month.keys()),
+                         ['bandwidth', 'hits', 'pages', 'visits'])
+        for values in month.values():
+            self.assertEqual(len(values), 29)
+        self.assertEqual(month['hits'][0], 0)
+        self.assertEqual(month['hits'][1], 16)
+        self.assertEqual(month['hits'][28], 34)
+        self.assertEqual(month['pages'][28], 11)
+        self.assertEqual(month['bandwidth'][28], 2048)
+        self.assertEqual(month['visits'][28], 4)
+        self.assertEqual(report['2012'],
+                         {'hits': [0, 50], 'pages': [0, 14],
+                          'bandwidth': [0, 3072], 'visits': [0, 6],
+                          'visitors': [0, 5]})
+        for values in report['2012'].values():
+            for value in values:
+                self.assertIsInstance(value, int)
+        self.assertEqual(report['all-time'],
+                         {'years': ['2012'], 'hits': [50], 'pages': [14],
+                          'bandwidth': [3072], 'visits': [6],
+                          'visitors': [5]})
+
+    def test_create_report_overview_several_months(self):
+        from awstatic.reporter import _create_report_overview
+        data = {'DAY': {'201203': [('20120301', 1, 2, 3, 4)],
+                        '201201': [('20120131', 5, 6, 7, 8)]},
+                'GENERAL': {'201203': {'TotalUnique': ['9']},
+                            '201201': {'TotalUnique': ['10']}}}
+        report = _create_report_overview(data)
+        self.assertEqual(report['2012'],
+                         {'hits': [6, 0, 2], 'pages': [5, 0, 1],
+                          'bandwidth': [7, 0, 3], 'visits': [8, 0, 4],
+                          'visitors': [10, 0, 9]})
+        self.assertEqual(report['201201']['pages'][30], 5)
+
+    def test_create_report_overview_several_years(self):
+        from awstatic.reporter import _create_report_overview
+        data = {'DAY': {'201301': [('20130101', 1, 2, 3, 4)],
+                        '201112': [('20111231', 5, 6, 7, 8)],
+                        '201111': [('20111101', 1, 1, 1, 1)]},
+                'GENERAL': {'201301': {'TotalUnique': ['9']},
+                            '201112': {'TotalUnique': ['10']},
+                            '201111': {'TotalUnique': ['1']}}}
+        report = _create_report_overview(data)
+        self.assertEqual(report['all-time'],
+                         {'years': ['2011', '2013'], 'hits': [7, 2],
+                          'pages': [6, 1], 'bandwidth': [8, 3],
+                          'visits': [9, 4], 'visitors': [11, 9]})
+
     def test_create_report_top10(self):
         from awstatic.reporter import _create_report_top10
-        data = {'SIDER': {'201202':
-                              {'url1': {'url': 'url1',
-                                        'pages': '14',
-                                        'bandwidth': '114'},
-                               'url2': {'url': 'url2',
-                                        'pages': '12',
-                                        'bandwidth': '112'}},
-                          '201201':
-                              {'url1': {'url': 'url1',
-                                        'pages': '14',
-                                        'bandwidth': '114'},
-                               'url3': {'url': 'url3',
-                                        'pages': '33',
-                                        'bandwidth': '331'}},
-                          '201112':
-                              {'url3': {'url': 'url3',
-                                        'pages': '32',
-                                        'bandwidth': '332'}}}}
+        data = {'SIDER': {'201202': [('url1', 14, 114, 0, 0),
+                                     ('url2', 12, 112, 0, 0)],
+                          '201201': [('url1', 14, 114, 0, 0),
+                                     ('url3', 33, 331, 0, 0)],
+                          '201112': [('url3', 32, 332, 0, 0)]}}
         report = _create_report_top10(data)
         expected = {'201202': [{'url': 'url1', 'pages': 14, 'bandwidth': 114},
                                {'url': 'url2', 'pages': 12, 'bandwidth': 112}],
@@ -113,29 +611,60 @@ class TestReports(TestCase):
                              {'url': 'url1', 'pages': 28, 'bandwidth': 228},
                              {'url': 'url2', 'pages': 12, 'bandwidth': 112}],
                     '201112': [{'url': 'url3', 'pages': 32, 'bandwidth': 332}],
-                    '2011': [{'url': 'url3', 'pages': 32, 'bandwidth': 332}]}
+                    '2011': [{'url': 'url3', 'pages': 32, 'bandwidth': 332}],
+                    'all-time': [
+                        {'url': 'url3', 'pages': 65, 'bandwidth': 663},
+                        {'url': 'url1', 'pages': 28, 'bandwidth': 228},
+                        {'url': 'url2', 'pages': 12, 'bandwidth': 112}]}
         self.assertEqual(report, expected)
 
+    def test_create_report_top10_with_partials(self):
+        from awstatic.reporter import _create_report_top10
+
+        class DummyPartials(object):
+            def __init__(self, cached):
+                self.cached = cached
+                self.stored = {}
+            def get(self, year):
+                return self.cached.get(year)
+            def set(self, year, aggregates):
+                self.stored[year] = aggregates
+
+        data = {'SIDER': {'201202': [('url1', 14, 114, 0, 0)],
+                          '201112': [('url3', 32, 332, 0, 0)]}}
+        # Cached aggregates of 2011 are used instead of the data.
+        partials = DummyPartials(
+            {'2011': {'url2': {'pages': 40, 'bandwidth': 400}}})
+        report = _create_report_top10(data, partials)
+        self.assertEqual(report['2011'],
+                         [{'url': 'url2', 'pages': 40, 'bandwidth': 400}])
+        self.assertEqual(report['201112'],
+                         [{'url': 'url3', 'pages': 32, 'bandwidth': 332}])
+        self.assertEqual(report['all-time'],
+                         [{'url': 'url2', 'pages': 40, 'bandwidth': 400},
+                          {'url': 'url1', 'pages': 14, 'bandwidth': 114}])
+        self.assertEqual(partials.stored,
+                         {'2012': {'url1': {'pages': 14, 'bandwidth': 114}}})
+
+    def test_create_report_top10_compact(self):
+        from awstatic.parser import ColumnarSection
+        from awstatic.reporter import _create_report_top10
+        rows = {'201202': [('url1', 14, 114, 0, 0), ('url2', 12, 112, 0, 0)],
+                '201201': [('url1', 14, 114, 0, 0), ('url3', 33, 331, 0, 0)]}
+        compact = {}
+        for month, month_rows in rows.items():
+            compact[month] = ColumnarSection(5)
+            compact[month].extend(month_rows)
+        self.assertEqual(_create_report_top10({'SIDER': compact}),
+                         _create_report_top10({'SIDER': rows}))
+
     def test_create_report_downloads(self):
         from awstatic.reporter import _create_report_downloads
-        data = {'DOWNLOADS': {'201202':
-                                  {'url1': {'url': 'url1',
-                                            'hits': '14',
-                                            'bandwidth': '114'},
-                                   'url2': {'url': 'url2',
-                                            'hits': '12',
-                                            'bandwidth': '112'}},
-                              '201201':
-                                  {'url1': {'url': 'url1',
-                                            'hits': '14',
-                                            'bandwidth': '114'},
-                                   'url3': {'url': 'url3',
-                                            'hits': '33',
-                                            'bandwidth': '331'}},
-                              '201112':
-                                  {'url3': {'url': 'url3',
-                                            'hits': '32',
-                                            'bandwidth': '332'}}}}
+        data = {'DOWNLOADS': {'201202': [('url1', 14, 0, 114),
+                                         ('url2', 12, 0, 112)],
+                              '201201': [('url1', 14, 0, 114),
+                                         ('url3', 33, 0, 331)],
+                              '201112': [('url3', 32, 0, 332)]}}
         report = _create_report_downloads(data)
         expected = {'201202': [{'url': 'url1', 'hits': 14, 'bandwidth': 114},
                                {'url': 'url2', 'hits': 12, 'bandwidth': 112}],
@@ -145,29 +674,20 @@ class TestReports(TestCase):
                              {'url': 'url1', 'hits': 28, 'bandwidth': 228},
                              {'url': 'url2', 'hits': 12, 'bandwidth': 112}],
                     '201112': [{'url': 'url3', 'hits': 32, 'bandwidth': 332}],
-                    '2011': [{'url': 'url3', 'hits': 32, 'bandwidth': 332}]}
+                    '2011': [{'url': 'url3', 'hits': 32, 'bandwidth': 332}],
+                    'all-time': [
+                        {'url': 'url3', 'hits': 65, 'bandwidth': 663},
+                        {'url': 'url1', 'hits': 28, 'bandwidth': 228},
+                        {'url': 'url2', 'hits': 12, 'bandwidth': 112}]}
         self.assertEqual(report, expected)
 
     def test_create_report_referrers(self):
         from awstatic.reporter import _create_report_referrers
-        data = {'PAGEREFS': {'201202':
-                                 {'url1': {'url': 'url1',
-                                           'pages': '14',
-                                           'hits': '114'},
-                                  'url2': {'url': 'url2',
-                                           'pages': '12',
-                                           'hits': '112'}},
-                             '201201':
-                                 {'url1': {'url': 'url1',
-                                           'pages': '14',
-                                           'hits': '114'},
-                                  'url3': {'url': 'url3',
-                                           'pages': '33',
-                                           'hits': '331'}},
-                             '201112':
-                                 {'url3': {'url': 'url3',
-                                           'pages': '32',
-                                           'hits': '332'}}}}
+        data = {'PAGEREFS': {'201202': [('url1', 14, 114),
+                                        ('url2', 12, 112)],
+                             '201201': [('url1', 14, 114),
+                                        ('url3', 33, 331)],
+                             '201112': [('url3', 32, 332)]}}
         report = _create_report_referrers(data)
         expected = {'201202': [{'url': 'url1', 'pages': 14, 'hits': 114},
                                {'url': 'url2', 'pages': 12, 'hits': 112}],
@@ -177,24 +697,93 @@ class TestReports(TestCase):
                              {'url': 'url1', 'pages': 28, 'hits': 228},
                              {'url': 'url2', 'pages': 12, 'hits': 112}],
                     '201112': [{'url': 'url3', 'pages': 32, 'hits': 332}],
-                    '2011': [{'url': 'url3', 'pages': 32, 'hits': 332}]}
+                    '2011': [{'url': 'url3', 'pages': 32, 'hits': 332}],
+                    'all-time': [{'url': 'url3', 'pages': 65, 'hits': 663},
+                                 {'url': 'url1', 'pages': 28, 'hits': 228},
+                                 {'url': 'url2', 'pages': 12, 'hits': 112}]}
         self.assertEqual(report, expected)
 
+    def test_create_report_referrers_top(self):
+        from awstatic.reporter import _create_report_referrers
+        data = {'PAGEREFS': {'201202': [('url1', 14, 114),
+                                        ('url2', 12, 112)],
+                             '201201': [('url2', 33, 331)]}}
+        report = _create_report_referrers(data, None, {'referrers_top': 1})
+        self.assertEqual(report['201202'],
+                         [{'url': 'url1', 'pages': 14, 'hits': 114}])
+        self.assertEqual(report['2012'],
+                         [{'url': 'url2', 'pages': 45, 'hits': 443}])
+        self.assertEqual(report['all-time'],
+                         [{'url': 'url2', 'pages': 45, 'hits': 443}])
+
+    def test_create_report_top10_heavy_hitters(self):
+        from awstatic.reporter import _create_report_top10
+        data = {'SIDER': {'201202': [('url1', 14, 114, 0, 0),
+                                     ('url2', 12, 112, 0, 0)],
+                          '201201': [('url1', 14, 114, 0, 0),
+                                     ('url3', 33, 331, 0, 0)],
+                          '201112': [('url3', 32, 332, 0, 0)]}}
+        report = _create_report_top10(data, None, {'heavy_hitters': 2})
+        # Monthly reports are exact.
+        self.assertEqual(report['201202'],
+                         [{'url': 'url1', 'pages': 14, 'bandwidth': 114},
+                          {'url': 'url2', 'pages': 12, 'bandwidth': 112}])
+        # Only 2 entries are kept in 2012. Which ones depends on the
+        # order of months, but values are never underestimated and
+        # overestimated by at most their error.
+        actual = {'url1': 28, 'url2': 12, 'url3': 33}
+        self.assertEqual(len(report['2012']), 2)
+        for item in report['2012']:
+            self.assertGreaterEqual(item['pages'], actual[item['url']])
+            self.assertLessEqual(item['pages'] - item['error'],
+                                 actual[item['url']])
+            self.assertLessEqual(item['error'], sum(actual.values()) / 2.0)
+        self.assertEqual(report['2011'],
+                         [{'url': 'url3', 'pages': 32, 'bandwidth': 332,
+                           'error': 0}])
+        self.assertEqual(len(report['all-time']), 2)
+        for item in report['all-time']:
+            self.assertIn('error', item)
+
+    def test_create_report_top10_heavy_hitters_all_time(self):
+        import random
+        from awstatic.reporter import _create_report_top10
+        rand = random.Random(16)
+        capacity = 5
+        data = {'SIDER': {}}
+        actual = {}
+        for yyyy in ('2010', '2011', '2012'):
+            for mm in range(1, 13):
+                rows = []
+                for i in rand.sample(range(40), 15):
+                    url = 'url%d' % i
+                    pages = int(rand.paretovariate(1.2) * 3)
+                    rows.append((url, pages, 10 * pages, 0, 0))
+                    actual[url] = actual.get(url, 0) + pages
+                data['SIDER']['%s%02d' % (yyyy, mm)] = rows
+        report = _create_report_top10(data, None,
+                                      {'heavy_hitters': capacity})
+        # All-time values are merged from the summaries of each year,
+        # with the same bounds as a single summary.
+        total = sum(actual.values())
+        kept = set()
+        for item in report['all-time']:
+            kept.add(item['url'])
+            self.assertGreaterEqual(item['pages'], actual[item['url']])
+            self.assertLessEqual(item['pages'] - item['error'],
+                                 actual[item['url']])
+            self.assertLessEqual(item['error'], total / float(capacity))
+        for url, pages in actual.items():
+            if pages > total / float(capacity):
+                self.assertIn(url, kept)
+
     def test_create_report_keywords(self):
         from awstatic.reporter import _create_report_keywords
-        data = {'KEYWORDS': {'201202':
-                                 {'keyword1': {'keyword': 'keyword1',
-                                               'searches': '14'},
-                                  'keyword2': {'keyword': 'keyword2',
-                                               'searches': '112'}},
-                             '201201':
-                                 {'keyword1': {'keyword': 'keyword1',
-                                               'searches': '114'},
-                                  'keyword3': {'keyword': 'keyword3',
-                                               'searches': '331'}},
-                             '201112':
-                                 {'keyword3': {'keyword': 'keyword3',
-                                               'searches': '332'}}}}
+        data = {'KEYWORDS': {'201202': [('keyword1', 14),
+                                        ('keyword2', 112)],
+                             '201201': [('keyword1', 114),
+                                        ('keyword3', 331)],
+                             '201112': [('keyword3', 332)]}}
         report = _create_report_keywords(data)
         expected = {'201202': [{'keyword': 'keyword2', 'searches': 112},
                                {'keyword': 'keyword1', 'searches': 14}],
@@ -204,7 +793,10 @@ class TestReports(TestCase):
                              {'keyword': 'keyword1', 'searches': 128},
                              {'keyword': 'keyword2', 'searches': 112}],
                     '201112': [{'keyword': 'keyword3', 'searches': 332}],
-                    '2011': [{'keyword': 'keyword3', 'searches': 332}]}
+                    '2011': [{'keyword': 'keyword3', 'searches': 332}],
+                    'all-time': [{'keyword': 'keyword3', 'searches': 663},
+                                 {'keyword': 'keyword1', 'searches': 128},
+                                 {'keyword': 'keyword2', 'searches': 112}]}
         self.assertEqual(report, expected)
 
     def test_create_report_keywords_unquote(self):
@@ -214,28 +806,20 @@ class TestReports(TestCase):
         encoded = b'\xc3\xa9l\xc3\xa9phant'
         decoded = text_(encoded, 'utf-8')
         quoted = text_(quote_plus(encoded), 'utf-8')
-        data = {'KEYWORDS': {'201202': {quoted: {'keyword': quoted,
-                                                 'searches': '14'}}}}
+        data = {'KEYWORDS': {'201202': [(quoted, 14)]}}
         report = _create_report_keywords(data)
         expected = {'201202': [{'keyword': decoded, 'searches': 14}],
-                    '2012': [{'keyword': decoded, 'searches': 14}]}
+                    '2012': [{'keyword': decoded, 'searches': 14}],
+                    'all-time': [{'keyword': decoded, 'searches': 14}]}
         self.assertEqual(report, expected)
 
     def test_create_report_phrases(self):
         from awstatic.reporter import _create_report_phrases
-        data = {'SEARCHWORDS': {'201202':
-                                 {'phrase 1': {'phrase': 'phrase 1',
-                                               'searches': '14'},
-                                  'phrase 2': {'phrase': 'phrase 2',
-                                               'searches': '112'}},
-                                '201201':
-                                    {'phrase 1': {'phrase': 'phrase 1',
-                                                  'searches': '114'},
-                                     'phrase 3': {'phrase': 'phrase 3',
-                                                  'searches': '331'}},
-                                '201112':
-                                    {'phrase 3': {'phrase': 'phrase 3',
-                                                  'searches': '332'}}}}
+        data = {'SEARCHWORDS': {'201202': [('phrase 1', 14),
+                                           ('phrase 2', 112)],
+                                '201201': [('phrase 1', 114),
+                                           ('phrase 3', 331)],
+                                '201112': [('phrase 3', 332)]}}
         report = _create_report_phrases(data)
         expected = {'201202': [{'phrase': 'phrase 2', 'searches': 112},
                                {'phrase': 'phrase 1', 'searches': 14}],
@@ -245,7 +829,10 @@ class TestReports(TestCase):
                              {'phrase': 'phrase 1', 'searches': 128},
                              {'phrase': 'phrase 2', 'searches': 112}],
                     '201112': [{'phrase': 'phrase 3', 'searches': 332}],
-                    '2011': [{'phrase': 'phrase 3', 'searches': 332}]}
+                    '2011': [{'phrase': 'phrase 3', 'searches': 332}],
+                    'all-time': [{'phrase': 'phrase 3', 'searches': 663},
+                                 {'phrase': 'phrase 1', 'searches': 128},
+                                 {'phrase': 'phrase 2', 'searches': 112}]}
         self.assertEqual(report, expected)
 
     def test_create_report_phrases_unquote(self):
@@ -255,9 +842,22 @@ class TestReports(TestCase):
         encoded = b"ceci n'est pas un \xc3\xa9l\xc3\xa9phant"
         decoded = text_(encoded, 'utf-8')
         quoted = text_(quote_plus(encoded), 'utf-8')
-        data = {'SEARCHWORDS': {'201202': {quoted: {'phrase': quoted,
-                                                    'searches': '14'}}}}
+        data = {'SEARCHWORDS': {'201202': [(quoted, 14)]}}
         report = _create_report_phrases(data)
         expected = {'201202': [{'phrase': decoded, 'searches': 14}],
-                    '2012': [{'phrase': decoded, 'searches': 14}]}
+                    '2012': [{'phrase': decoded, 'searches': 14}],
+                    'all-time': [{'phrase': decoded, 'searches': 14}]}
         self.assertEqual(report, expected)
+
+    def test_unquote_is_cached(self):
+        from awstatic.reporter import _unquote
+        from awstatic.reporter import _unquote_cache
+        self.assertEqual(_unquote('plain'), 'plain')
+        misses = _unquote_cache.misses
+        self.assertEqual(_unquote('caf%C3%A9+cr%C3%A8me'),
+                         text_(b'caf\xc3\xa9 cr\xc3\xa8me', 'utf-8'))
+        hits = _unquote_cache.hits
+        self.assertEqual(_unquote('caf%C3%A9+cr%C3%A8me'),
+                         text_(b'caf\xc3\xa9 cr\xc3\xa8me', 'utf-8'))
+        self.assertEqual(_unquote_cache.misses, misses + 1)
+        self.assertEqual(_unquote_cache.hits, hits + 1)
@@ -0,0 +1,63 @@
+from unittest import TestCase
+
+
+class TestRunStats(TestCase):
+
+    def _make_one(self):
+        from awstatic.stats import RunStats
+        return RunStats()
+
+    def test_measure(self):
+        stats = self._make_one()
+        with stats.measure('exemple.com', 'parse'):
+            stats.add('bytes_read', 10)
+            with stats.measure('exemple.com', 'write'):
+                stats.add('bytes_written', 20)
+        stats.add('bytes_written', 30)  # no phase is being measured
+        self.assertEqual([(r['phase'], r['bytes_read'], r['bytes_written'])
+                          for r in stats.records],
+                         [('write', 0, 20), ('parse', 10, 20)])
+        for record in stats.records:
+            self.assertEqual(record['site'], 'exemple.com')
+            self.assertTrue(record['wall'] >= 0)
+            self.assertTrue(record['cpu'] >= 0)
+
+    def test_measure_exception(self):
+        stats = self._make_one()
+        try:
+            with stats.measure(None, 'prepare'):
+                raise ValueError()
+        except ValueError:
+            pass
+        self.assertEqual(len(stats.records), 1)
+        stats.add('bytes_written', 30)
+        self.assertEqual(stats.records[0]['bytes_written'], 0)
+
+    def test_totals(self):
+        stats = self._make_one()
+        stats.extend([
+            {'site': 'a', 'phase': 'parse', 'wall': 1, 'cpu': 2,
+             'bytes_read': 3, 'bytes_written': 0, 'max_rss': 10},
+            {'site': 'b', 'phase': 'parse', 'wall': 4, 'cpu': 5,
+             'bytes_read': 6, 'bytes_written': 7, 'max_rss': 20}])
+        self.assertEqual(stats.get_totals(),
+                         {'wall': 5, 'cpu': 7, 'bytes_read': 9,
+                          'bytes_written': 7, 'max_rss': 20})
+        lines = stats.format_summary()
+        self.assertEqual(len(lines), 4)
+        self.assertTrue(lines[-1].startswith('-'))
+        self.assertIn('total', lines[-1])
+
+
+class TestFormatSize(TestCase):
+
+    def _call_fut(self, size):
+        from awstatic.stats import format_size
+        return format_size(size)
+
+    def test_basics(self):
+        self.assertEqual(self._call_fut(None), '-')
+        self.assertEqual(self._call_fut(1000), '1000B')
+        self.assertEqual(self._call_fut(1536), '1.5KB')
+        self.assertEqual(self._call_fut(3 * 1024 ** 2), '3.0MB')
+        self.assertEqual(self._call_fut(2048 * 1024 ** 3), '2048.0GB')
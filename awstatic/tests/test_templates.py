@@ -0,0 +1,75 @@
+from unittest import TestCase
+
+
+HTML = ('<body>\n'
+        '  <script src="ui.js"></script>\n'
+        '  <script id="tmpl-foo" type="text/html">\n'
+        '    <b>{{foo}}</b>\n'
+        '  </script>\n'
+        '  <script id="tmpl-bar-baz" type="text/html">'
+        '{{#each bar}}{{this}}{{/each}}</script>\n'
+        '</body>\n')
+
+
+def precompile_or_skip(test, templates):
+    import os.path
+    from awstatic.templates import HANDLEBARS_PATH
+    from awstatic.templates import TemplateError
+    from awstatic.templates import precompile
+    handlebars_path = os.path.join(
+        os.path.dirname(os.path.dirname(__file__)), 'template',
+        HANDLEBARS_PATH.replace('/', os.sep))
+    try:
+        return precompile(templates, handlebars_path)
+    except TemplateError as exc:
+        if str(exc).startswith('Could not run'):
+            test.skipTest('Node.js is not available.')
+        raise
+
+
+class TestGetTemplates(TestCase):
+
+    def _call_fut(self, html):
+        from awstatic.templates import get_templates
+        return get_templates(html)
+
+    def test_basics(self):
+        self.assertEqual(self._call_fut(HTML),
+                         [('foo', '\n    <b>{{foo}}</b>\n  '),
+                          ('bar-baz', '{{#each bar}}{{this}}{{/each}}')])
+
+    def test_no_templates(self):
+        self.assertEqual(self._call_fut('<body></body>'), [])
+
+
+class TestReplaceTemplates(TestCase):
+
+    def _call_fut(self, html, url):
+        from awstatic.templates import replace_templates
+        return replace_templates(html, url)
+
+    def test_basics(self):
+        self.assertEqual(self._call_fut(HTML, 'templates.js'),
+                         '<body>\n'
+                         '  <script src="ui.js"></script>\n'
+                         '  <script src="templates.js"></script>\n'
+                         '</body>\n')
+
+
+class TestPrecompile(TestCase):
+
+    def test_basics(self):
+        js = precompile_or_skip(self, [('foo', '<b>{{foo}}</b>')])
+        self.assertTrue(js.startswith('(function(Handlebars) {'))
+        self.assertIn('templates["foo"] = Handlebars.template(', js)
+
+    def test_syntax_error(self):
+        from awstatic.templates import TemplateError
+        self.assertRaises(TemplateError, precompile_or_skip, self,
+                          [('foo', '{{#each foo}}')])
+
+    def test_node_not_found(self):
+        from awstatic.templates import TemplateError
+        from awstatic.templates import precompile
+        self.assertRaises(TemplateError, precompile, [], 'handlebars.js',
+                          node='/does/not/exist/node')
@@ -0,0 +1,119 @@
+from unittest import TestCase
+
+
+class TestSpaceSaving(TestCase):
+
+    def _make_one(self, capacity):
+        from awstatic.topk import SpaceSaving
+        return SpaceSaving(capacity, ('pages', 'hits'), 'pages')
+
+    def test_exact_under_capacity(self):
+        summary = self._make_one(3)
+        summary.add('url1', [1, 10])
+        summary.add('url2', [2, 20])
+        summary.add('url1', [3, 30])
+        self.assertEqual(len(summary), 2)
+        self.assertEqual(summary.to_dict(),
+                         {'url1': {'pages': 4, 'hits': 40, 'error': 0},
+                          'url2': {'pages': 2, 'hits': 20, 'error': 0}})
+
+    def test_eviction(self):
+        summary = self._make_one(2)
+        summary.add('url1', [5, 50])
+        summary.add('url2', [2, 20])
+        summary.add('url3', [1, 10])
+        # 'url2' has the lowest value: it is evicted and 'url3'
+        # inherits its values.
+        self.assertEqual(summary.to_dict(),
+                         {'url1': {'pages': 5, 'hits': 50, 'error': 0},
+                          'url3': {'pages': 3, 'hits': 30, 'error': 2}})
+
+    def test_error_of_added_values(self):
+        summary = self._make_one(2)
+        summary.add('url1', [5, 50], 1)
+        summary.add('url1', [5, 50], 2)
+        self.assertEqual(summary.to_dict(),
+                         {'url1': {'pages': 10, 'hits': 100, 'error': 3}})
+
+    def test_bounds(self):
+        import random
+        rand = random.Random(42)
+        capacity = 20
+        summary = self._make_one(capacity)
+        actual = {}
+        # A few heavy hitters and a long tail of rare entries.
+        for i in range(5000):
+            if rand.random() < 0.3:
+                entry = 'heavy%d' % rand.randint(1, 5)
+            else:
+                entry = 'rare%d' % rand.randint(1, 2000)
+            pages = rand.randint(1, 3)
+            summary.add(entry, [pages, 0])
+            actual[entry] = actual.get(entry, 0) + pages
+        total = sum(actual.values())
+        kept = summary.to_dict()
+        self.assertEqual(len(kept), capacity)
+        for entry, values in kept.items():
+            self.assertGreaterEqual(values['pages'], actual[entry])
+            self.assertLessEqual(values['pages'] - values['error'],
+                                 actual[entry])
+            self.assertLessEqual(values['error'], total / float(capacity))
+        for entry, pages in actual.items():
+            if pages > total / float(capacity):
+                self.assertIn(entry, kept)
+
+
+class TestMerge(TestCase):
+
+    def _call_fut(self, summaries, capacity):
+        from awstatic.topk import merge
+        return merge(summaries, capacity, ('pages', 'hits'), 'pages')
+
+    def test_exact_summaries(self):
+        summaries = [{'url1': {'pages': 4, 'hits': 40, 'error': 0}},
+                     {'url1': {'pages': 1, 'hits': 10, 'error': 0},
+                      'url2': {'pages': 2, 'hits': 20, 'error': 0}}]
+        self.assertEqual(self._call_fut(summaries, 3),
+                         {'url1': {'pages': 5, 'hits': 50, 'error': 0},
+                          'url2': {'pages': 2, 'hits': 20, 'error': 0}})
+
+    def test_missing_from_full_summary(self):
+        summaries = [{'url1': {'pages': 5, 'hits': 50, 'error': 0},
+                      'url2': {'pages': 2, 'hits': 20, 'error': 1}},
+                     {'url3': {'pages': 4, 'hits': 40, 'error': 0}}]
+        # 'url3' may have been evicted from the first (full) summary:
+        # it inherits the values of 'url2', the lowest entry there.
+        # Only the 2 greatest entries are kept.
+        self.assertEqual(self._call_fut(summaries, 2),
+                         {'url1': {'pages': 5, 'hits': 50, 'error': 0},
+                          'url3': {'pages': 6, 'hits': 60, 'error': 2}})
+
+    def test_bounds(self):
+        import random
+        from awstatic.topk import SpaceSaving
+        rand = random.Random(42)
+        capacity = 10
+        summaries = []
+        actual = {}
+        for i in range(5):
+            summary = SpaceSaving(capacity, ('pages', 'hits'), 'pages')
+            for j in range(1000):
+                if rand.random() < 0.2:
+                    entry = 'heavy%d' % rand.randint(1, 5)
+                else:
+                    entry = 'rare%d' % rand.randint(1, 300)
+                pages = rand.randint(1, 3)
+                summary.add(entry, [pages, 0])
+                actual[entry] = actual.get(entry, 0) + pages
+            summaries.append(summary.to_dict())
+        total = sum(actual.values())
+        kept = self._call_fut(summaries, capacity)
+        self.assertEqual(len(kept), capacity)
+        for entry, values in kept.items():
+            self.assertGreaterEqual(values['pages'], actual[entry])
+            self.assertLessEqual(values['pages'] - values['error'],
+                                 actual[entry])
+            self.assertLessEqual(values['error'], total / float(capacity))
+        for entry, pages in actual.items():
+            if pages > total / float(capacity):
+                self.assertIn(entry, kept)
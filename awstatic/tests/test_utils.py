@@ -28,6 +28,27 @@ class TestNumberOfDays(TestCase):
         self.assertEqual(self._call_fut('201212'), 31)
 
 
+class TestIsProcessAlive(TestCase):
+
+    def _call_fut(self, pid):
+        from awstatic.utils import is_process_alive
+        return is_process_alive(pid)
+
+    def test_alive(self):
+        import os
+        self.assertTrue(self._call_fut(os.getpid()))
+
+    def test_terminated(self):
+        import os
+        import subprocess
+        import sys
+        if os.name != 'posix':  # pragma: no cover
+            self.skipTest('Not supported on this platform.')
+        process = subprocess.Popen([sys.executable, '-c', 'pass'])
+        process.wait()
+        self.assertFalse(self._call_fut(process.pid))
+
+
 class TestInterpolate(TestCase):
 
     def _call_fut(self, s, **bindings):
@@ -41,3 +62,72 @@ class TestInterpolate(TestCase):
         self.assertEqual(self._call_fut('${foo}', bar='1'), '${foo}')
         self.assertEqual(self._call_fut('Value is: ${foo}', foo='1'),
                          'Value is: 1')
+
+
+class TestIterJson(TestCase):
+
+    def _call_fut(self, obj, depth=0):
+        from awstatic.utils import iter_json
+        return list(iter_json(obj, depth))
+
+    def test_no_depth(self):
+        self.assertEqual(self._call_fut({'a': [1, 2]}), ['{"a":[1,2]}'])
+
+    def test_depth(self):
+        import json
+        obj = {'a': {'x': [1, {'y': 2}], 'z': {}}, 'b': 'c', 'd': {}}
+        for depth in range(4):
+            chunks = self._call_fut(obj, depth)
+            encoded = ''.join(chunks)
+            self.assertEqual(json.loads(encoded), obj)
+            self.assertEqual(encoded,
+                             json.dumps(obj, separators=(',', ':')))
+        self.assertEqual(len(self._call_fut(obj, 1)), 7)
+
+    def test_empty(self):
+        self.assertEqual(self._call_fut({}, 2), ['{}'])
+
+
+class TestMemoized(TestCase):
+
+    def _make_one(self, func, max_size=10):
+        from awstatic.utils import Memoized
+        return Memoized(func, max_size)
+
+    def test_basics(self):
+        calls = []
+        def func(arg):
+            calls.append(arg)
+            return arg.upper()
+        memoized = self._make_one(func)
+        self.assertEqual(memoized('a'), 'A')
+        self.assertEqual(memoized('a'), 'A')
+        self.assertEqual(memoized('b'), 'B')
+        self.assertEqual(calls, ['a', 'b'])
+        self.assertEqual((memoized.hits, memoized.misses), (1, 2))
+
+    def test_max_size(self):
+        memoized = self._make_one(lambda arg: arg * 2, max_size=2)
+        for arg in (1, 2, 3, 3, 1):
+            memoized(arg)
+        self.assertEqual((memoized.hits, memoized.misses), (1, 4))
+        self.assertTrue(len(memoized._cache) <= 2)
+
+
+class TestReplaceTags(TestCase):
+
+    def _call_fut(self, regex, html, tag):
+        from awstatic.utils import replace_tags
+        return replace_tags(regex, html, tag)
+
+    def test_basics(self):
+        import re
+        regex = re.compile(r'([ \t]*)<i>\d</i>\n')
+        html = '<p>\n  <i>1</i>\n  <b>2</b>\n  <i>3</i>\n</p>\n'
+        self.assertEqual(self._call_fut(regex, html, '<u>4</u>'),
+                         '<p>\n  <u>4</u>\n  <b>2</b>\n</p>\n')
+
+    def test_no_match(self):
+        import re
+        self.assertEqual(self._call_fut(re.compile('(x)'), 'abc', 'y'),
+                         'abc')
@@ -0,0 +1,148 @@
+"""Approximate aggregation of the greatest entries in bounded memory."""
+
+import heapq
+
+
+# The heap of 'SpaceSaving' is rebuilt when it holds this many times
+# more (outdated) pairs than there are entries.
+HEAP_GROWTH_FACTOR = 4
+
+
+class SpaceSaving(object):
+    """Aggregate values of entries and keep only (approximately) the
+    ``capacity`` entries with the greatest ``sort_on`` value, with the
+    Space-Saving algorithm (Metwally, Agrawal and El Abbadi, 2005),
+    generalized to weighted updates.
+
+    Each entry has a value for each of ``keys`` (which must include
+    ``sort_on``) and an ``error``. When a new entry is added while
+    ``capacity`` entries are already kept, the entry with the lowest
+    ``sort_on`` value is evicted and the new entry inherits its
+    values, which become its ``error``. Hence:
+
+    - values are never underestimated, and the ``sort_on`` value of an
+      entry is overestimated by at most its ``error``;
+
+    - the ``error`` of any entry is at most ``N / capacity``, where
+      ``N`` is the sum of all ``sort_on`` values that have been added;
+
+    - any entry whose actual ``sort_on`` value is greater than
+      ``N / capacity`` is kept.
+
+    Other values are overestimated by at most the corresponding values
+    of the evicted entries, which are not tracked.
+    """
+
+    def __init__(self, capacity, keys, sort_on):
+        self.capacity = capacity
+        self.keys = tuple(keys)
+        self._sort_index = self.keys.index(sort_on)
+        # Maps each entry to the list of its values (in the order of
+        # 'keys') followed by its error.
+        self._entries = {}
+        # A min-heap of '(sort_on value, entry)' pairs. Pairs are not
+        # removed when the value of an entry changes: outdated pairs
+        # are skipped when they reach the top of the heap.
+        self._heap = []
+
+    def __len__(self):
+        return len(self._entries)
+
+    def add(self, entry, values, error=0):
+        """Add ``values`` (in the order of ``keys``) to the values of
+        ``entry``. ``error`` is the error of these values, if they are
+        themselves approximate.
+        """
+        current = self._entries.get(entry, None)
+        if current is None:
+            current = [0] * len(self.keys) + [0]
+            if len(self._entries) >= self.capacity:
+                evicted = self._pop_min()
+                current[:] = self._entries.pop(evicted)
+                current[-1] = current[self._sort_index]
+            self._entries[entry] = current
+        for i, value in enumerate(values):
+            current[i] += value
+        current[-1] += error
+        self._push(entry, current[self._sort_index])
+
+    def _push(self, entry, sort_value):
+        heap = self._heap
+        if len(heap) > HEAP_GROWTH_FACTOR * max(self.capacity, 1):
+            heap[:] = [(values[self._sort_index], key)
+                       for key, values in self._entries.items()]
+            heapq.heapify(heap)
+        else:
+            heapq.heappush(heap, (sort_value, entry))
+
+    def _pop_min(self):
+        """Return the entry with the lowest ``sort_on`` value."""
+        heap = self._heap
+        while 1:
+            sort_value, entry = heapq.heappop(heap)
+            values = self._entries.get(entry, None)
+            if values is not None and values[self._sort_index] == sort_value:
+                return entry
+
+    def to_dict(self):
+        """Return the entries as a dictionary, where values are
+        dictionaries of the values of each entry (with ``keys`` and
+        ``error`` as keys).
+        """
+        result = {}
+        for entry, values in self._entries.items():
+            d = dict(zip(self.keys, values))
+            d['error'] = values[-1]
+            result[entry] = d
+        return result
+
+
+def merge(summaries, capacity, keys, sort_on):
+    """Merge ``summaries``, dictionaries returned by
+    ``SpaceSaving.to_dict()`` with the same ``capacity``, ``keys`` and
+    ``sort_on``, and return a dictionary of the same form with at most
+    ``capacity`` entries (those with the greatest ``sort_on`` value).
+
+    An entry that is missing from a full summary (which holds
+    ``capacity`` entries) may have been evicted from it: its actual
+    ``sort_on`` value there is at most the lowest one of the summary.
+    It then inherits the values of the entry with the lowest
+    ``sort_on`` value, as if it had been evicted by
+    ``SpaceSaving.add()``, and the ``sort_on`` value of this entry is
+    added to its ``error``. The result has the same guarantees as a
+    single ``SpaceSaving`` instance, where ``N`` is the sum of all
+    ``sort_on`` values that have been added to all summaries.
+    """
+    summaries = list(summaries)
+    # The entry with the lowest 'sort_on' value of each full summary,
+    # or 'None' if the summary is exact.
+    floors = []
+    for summary in summaries:
+        floor = None
+        if len(summary) >= capacity:
+            floor = min(summary.values(), key=lambda d: d[sort_on])
+        floors.append(floor)
+    # Entries start with the values inherited from all full summaries,
+    # which are removed for the summaries where they are found.
+    inherited = dict.fromkeys(keys, 0)
+    inherited['error'] = 0
+    for floor in floors:
+        if floor is not None:
+            for key in keys:
+                inherited[key] += floor[key]
+            inherited['error'] += floor[sort_on]
+    merged = {}
+    for summary, floor in zip(summaries, floors):
+        for entry, d in summary.items():
+            current = merged.get(entry, None)
+            if current is None:
+                current = merged[entry] = dict(inherited)
+            for key in keys:
+                current[key] += d[key]
+            current['error'] += d['error']
+            if floor is not None:
+                for key in keys:
+                    current[key] -= floor[key]
+                current['error'] -= floor[sort_on]
+    return dict(heapq.nlargest(capacity, merged.items(),
+                               key=lambda item: item[1][sort_on]))
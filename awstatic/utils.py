@@ -1,6 +1,13 @@
+import errno
+import json
+import os
 import re
 
 
+# Separators of the generated JSON files, without the (useless) spaces
+# that 'json.dumps()' uses by default.
+JSON_SEPARATORS = (',', ':')
+
 _DAYS_IN_MONTH = (31, 28, 31, 30, 31, 30, 31, 31, 30, 31, 30, 31)
 _INTERPOLATION = re.compile('\${(\w*)}')
 
@@ -23,6 +30,21 @@ def get_number_of_days(yyyymm):
     return n
 
 
+def is_process_alive(pid):
+    """Return whether a process with the given identifier is running.
+    This cannot be checked on platforms other than POSIX, where we
+    always return ``True``.
+    """
+    if os.name != 'posix':  # pragma: no cover
+        return True
+    try:
+        os.kill(pid, 0)
+    except OSError as exc:
+        # EPERM: the process exists but belongs to another user.
+        return exc.errno == errno.EPERM
+    return True
+
+
 def interpolate(s, **bindings):
     """Substitute ``${var}`` fragments in ``s`` by their value
     provided in ``bindings``.
@@ -33,3 +55,74 @@ def interpolate(s, **bindings):
         var = matchobj.group(1)
         return bindings.get(var, matchobj.group(0))
     return _INTERPOLATION.sub(_sub, s)
+
+
+def replace_tags(regex, html, tag):
+    """Return ``html`` where the first match of ``regex`` is replaced
+    by ``tag`` (which is indented like the match) and other matches
+    are removed. The first group of ``regex`` must match the
+    indentation.
+    """
+    replaced = []
+
+    def _sub(matchobj):
+        if replaced:
+            return ''
+        replaced.append(matchobj)
+        return '%s%s\n' % (matchobj.group(1), tag)
+
+    return regex.sub(_sub, html)
+
+
+class Memoized(object):
+    """Wrap ``func``, a function of a single (hashable) argument, and
+    cache its results.
+
+    The cache holds at most ``max_size`` results. When it is full, it
+    is emptied: this is cheaper than evicting the least recently used
+    results and recurring arguments are quickly cached again. The
+    ``hits`` and ``misses`` attributes count cache lookups.
+    """
+
+    def __init__(self, func, max_size):
+        self.func = func
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._cache = {}
+
+    def __call__(self, arg):
+        try:
+            result = self._cache[arg]
+        except KeyError:
+            self.misses += 1
+            if len(self._cache) >= self.max_size:
+                self._cache.clear()
+            result = self._cache[arg] = self.func(arg)
+            return result
+        self.hits += 1
+        return result
+
+
+def dumps(obj):
+    """Return ``obj`` encoded as compact JSON."""
+    return json.dumps(obj, separators=JSON_SEPARATORS)
+
+
+def iter_json(obj, depth=0):
+    """Encode ``obj`` as compact JSON and yield the result piece by
+    piece, so that the whole encoded string never needs to be held in
+    memory. Dictionaries are split into their items down to ``depth``
+    levels (their keys must be strings), deeper values are encoded at
+    once. Joining the pieces gives the same string as ``dumps(obj)``.
+    """
+    if depth <= 0 or not isinstance(obj, dict):
+        yield dumps(obj)
+        return
+    separator = '{'
+    for key, value in obj.items():
+        yield separator + dumps(key) + ':'
+        for chunk in iter_json(value, depth - 1):
+            yield chunk
+        separator = ','
+    yield '}' if separator == ',' else '{}'